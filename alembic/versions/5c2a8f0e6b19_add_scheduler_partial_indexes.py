@@ -0,0 +1,48 @@
+"""Add partial indexes for scheduler queries
+
+Revision ID: 5c2a8f0e6b19
+Revises: 3b7e91c4d2a5
+Create Date: 2026-10-17 11:04:17.918342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2a8f0e6b19'
+down_revision: Union[str, None] = '3b7e91c4d2a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # claim_notifications_to_send / get_notifications_to_send_by_time
+    op.create_index(
+        'ix_notification_preferences_morning_due',
+        'notification_preferences',
+        ['next_execution_datetime'],
+        postgresql_where=sa.text("is_active AND notification_type = 'MORNING_NOTIFICATION'"),
+    )
+    # get_notifications_by_type
+    op.create_index(
+        'ix_notification_preferences_pending_by_type',
+        'notification_preferences',
+        ['notification_type', 'next_execution_datetime'],
+        postgresql_where=sa.text('is_active AND NOT notification_sent'),
+    )
+    # get_custom_notifications_to_send
+    op.create_index(
+        'ix_custom_notifications_pending_due',
+        'custom_notifications',
+        ['next_execution_datetime'],
+        postgresql_where=sa.text('is_active AND NOT notification_sent'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_custom_notifications_pending_due', table_name='custom_notifications')
+    op.drop_index('ix_notification_preferences_pending_by_type', table_name='notification_preferences')
+    op.drop_index('ix_notification_preferences_morning_due', table_name='notification_preferences')
@@ -6,15 +6,17 @@ Script to capture statistics as an image.
 import os
 import json
 from datetime import datetime
-import time
 import argparse
+import asyncio
 import decimal
+import tempfile
 
 from loguru import logger
 
 from openai import AsyncOpenAI
 from statistics_web.generate_web_data import generate_html_from_data, get_statistics_data
 from statistics_web.playwright_capture import capture_statistics_image
+from utils.offload import offload, run_blocking, run_db
 
 from dotenv import load_dotenv
 
@@ -25,6 +27,41 @@ load_dotenv()
 client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 ASSISTANT_ID = os.environ.get("OPENAI_ASSISTANT_ID")
 
+
+def _read_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@offload
+def _create_temp_html(output_dir, chat_id):
+    """Reserve a unique temp HTML path, so concurrent requests of a user don't clash"""
+    os.makedirs(output_dir, exist_ok=True)
+    fd, temp_html = tempfile.mkstemp(prefix=f"temp_{chat_id}_", suffix=".html", dir=output_dir)
+    os.close(fd)
+    return temp_html
+
+
+@offload
+def _remove_temp_files(temp_html):
+    # Remove the temporary HTML file
+    if os.path.exists(temp_html):
+        os.remove(temp_html)
+        logger.debug(f"Removed temporary HTML file: {temp_html}")
+
+    # Remove any stats_image.html and stats_image_debug.html files
+    stats_image_html = os.path.join(os.path.dirname(__file__), "statistics_web", "stats_image.html")
+    stats_image_debug_html = os.path.join(os.path.dirname(__file__), "statistics_web", "stats_image_debug.html")
+
+    if os.path.exists(stats_image_html):
+        os.remove(stats_image_html)
+        logger.debug(f"Removed stats_image.html file: {stats_image_html}")
+
+    if os.path.exists(stats_image_debug_html):
+        os.remove(stats_image_debug_html)
+        logger.debug(f"Removed stats_image_debug.html file: {stats_image_debug_html}")
+
+
 async def capture_html_screenshot(html_file, output_path, window_width=1200, window_height=1600):
     """
     Capture a screenshot of an HTML file using a headless browser
@@ -43,8 +80,7 @@ async def capture_html_screenshot(html_file, output_path, window_width=1200, win
         abs_path = os.path.abspath(html_file)
         
         # Read the HTML content to extract the data
-        with open(abs_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
+        html_content = await run_blocking(_read_file, abs_path)
             
         # Extract the JSON data from the HTML
         # This is a simple approach - in a real implementation, you might want to use a more robust method
@@ -87,7 +123,7 @@ async def capture_html_screenshot(html_file, output_path, window_width=1200, win
                 if not os.path.exists(browser_path):
                     logger.warning("Playwright browser not found, attempting to install...")
                     # Try to install browsers
-                    subprocess.run(["python", "-m", "playwright", "install", "chromium", "--with-deps"], check=True)
+                    await run_blocking(subprocess.run, ["python", "-m", "playwright", "install", "chromium", "--with-deps"], check=True)
                     logger.info("Playwright browser installation completed")
                 else:
                     logger.info("Playwright browser is already installed")
@@ -115,7 +151,7 @@ async def capture_html_screenshot(html_file, output_path, window_width=1200, win
         # If not on Heroku, try to use wkhtmltoimage
         try:
             logger.info(f"Capturing screenshot using wkhtmltoimage: {abs_path}")
-            subprocess.run([
+            await run_blocking(subprocess.run, [
                 "wkhtmltoimage",
                 "--width", str(window_width),
                 "--height", str(window_height),
@@ -192,7 +228,7 @@ async def analyze_metrics_with_assistant(stats_data, user_name):
         # Wait for the analysis to complete
         while run.status in ["queued", "in_progress"]:
             logger.debug(f"Assistant run status: {run.status}")
-            time.sleep(1)
+            await asyncio.sleep(1)
             run = await client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
         
         if run.status == "completed":
@@ -213,7 +249,7 @@ async def analyze_metrics_with_assistant(stats_data, user_name):
         return error_msg
 
 
-async def generate_statistics_image(chat_id, period='monthly', start_date=None, end_date=None, output_dir=None):
+async def generate_statistics_image(chat_id, period='monthly', start_date=None, end_date=None, output_dir=None, batch=False):
     """
     Generate a statistics image for a user
     
@@ -223,6 +259,7 @@ async def generate_statistics_image(chat_id, period='monthly', start_date=None,
         start_date (datetime): Optional start date for custom period
         end_date (datetime): Optional end date for custom period
         output_dir (str): Optional output directory for the image
+        batch (bool): Query on the batch pool, for scheduled jobs
     
     Returns:
         tuple: (Path to the generated image file, Analysis text from OpenAI Assistant)
@@ -231,7 +268,6 @@ async def generate_statistics_image(chat_id, period='monthly', start_date=None,
     
     if output_dir is None:
         output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'statistics_web/static/images')
-    os.makedirs(output_dir, exist_ok=True)
     
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     filename = f"stats_{chat_id}_{period}_{timestamp}.png"
@@ -239,7 +275,9 @@ async def generate_statistics_image(chat_id, period='monthly', start_date=None,
     
     try:
         # Get statistics data
-        stats_data = get_statistics_data(
+        stats_data = await run_db(
+            get_statistics_data,
+            batch=batch,
             user_id=chat_id, 
             period=period, 
             start_date=start_date, 
@@ -253,32 +291,20 @@ async def generate_statistics_image(chat_id, period='monthly', start_date=None,
         analysis = await analyze_metrics_with_assistant(stats_data, stats_data.get('user', {}).get('name', f"User {chat_id}"))
         
         # Generate HTML directly from the data dictionary
-        temp_html = os.path.join(output_dir, f"temp_{chat_id}.html")
-        generate_html_from_data(stats_data, output_path=temp_html, for_image=True)
-        
-        # Capture screenshot
-        await capture_html_screenshot(temp_html, output_path)
-        
-        # Clean up temp files
+        temp_html = await _create_temp_html(output_dir, chat_id)
         try:
-            # Remove the temporary HTML file
-            if os.path.exists(temp_html):
-                os.remove(temp_html)
-                logger.debug(f"Removed temporary HTML file: {temp_html}")
-            
-            # Remove any stats_image.html and stats_image_debug.html files
-            stats_image_html = os.path.join(os.path.dirname(__file__), "statistics_web", "stats_image.html")
-            stats_image_debug_html = os.path.join(os.path.dirname(__file__), "statistics_web", "stats_image_debug.html")
-            
-            if os.path.exists(stats_image_html):
-                os.remove(stats_image_html)
-                logger.debug(f"Removed stats_image.html file: {stats_image_html}")
-                
-            if os.path.exists(stats_image_debug_html):
-                os.remove(stats_image_debug_html)
-                logger.debug(f"Removed stats_image_debug.html file: {stats_image_debug_html}")
-        except Exception as e:
-            logger.warning(f"Error cleaning up temporary files: {e}")
+            await run_blocking(
+                generate_html_from_data, stats_data, output_path=temp_html, for_image=True
+            )
+
+            # Capture screenshot
+            await capture_html_screenshot(temp_html, output_path)
+        finally:
+            # Clean up temp files
+            try:
+                await _remove_temp_files(temp_html)
+            except Exception as e:
+                logger.warning(f"Error cleaning up temporary files: {e}")
         
         logger.info(f"Generated statistics image at: {output_path}")
         return output_path, analysis
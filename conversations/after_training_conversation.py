@@ -7,7 +7,6 @@ from telegram.ext import (
     filters,
 )
 import text_constants
-from database import get_db
 from utils.db_utils import update_training_after_quiz
 from utils.keyboards import (
     default_one_to_ten_keyboard,
@@ -16,6 +15,7 @@ from utils.keyboards import (
 )
 from utils.commands import cancel
 from utils.logger import get_logger
+from utils.offload import run_db
 
 logger = get_logger(__name__)
 
@@ -78,13 +78,12 @@ async def retrieve_after_training_second_answer(update, context):
         )
         return AfterTrainingQuiz.SECOND_QUESTION_ANSWER
 
-    with next(get_db()) as db_session:
-        update_training_after_quiz(
-            training_id=context.user_data["training_id"],
-            stress_level=context.user_data["after_training_stress_level"],
-            soreness=input_text,
-            db_session=db_session,
-        )
+    await run_db(
+        update_training_after_quiz,
+        training_id=context.user_data["training_id"],
+        stress_level=context.user_data["after_training_stress_level"],
+        soreness=input_text,
+    )
     logger.info(f"User {user_id} finished after-training quiz for training ID: {context.user_data['training_id']}")
     await update.message.reply_text(
         text=text_constants.THANKS_FOR_PASSING_QUIZ,
@@ -17,8 +17,8 @@ from utils.bot_utils import (
     is_valid_time,
 )
 from config import timezone
-from database import get_db
-from utils.db_utils import (
+from database import update_db_session
+from utils.async_db_utils import (
     create_training_notifications,
     is_user_had_morning_quiz_today,
     save_morning_quiz_results,
@@ -43,24 +43,26 @@ async def start_morning_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = update.effective_user.id
     logger.info(f"User {user_id} starting morning quiz")
     
-    with next(get_db()) as db_session:
-        if is_user_had_morning_quiz_today(
-            chat_id=user_id, db_session=db_session
-        ):
-            logger.info(f"User {user_id} already completed morning quiz today")
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=text_constants.QUIZ_ALREADY_PASSED,
-                reply_markup=main_menu_keyboard(update.effective_chat.id),
-            )
-            return ConversationHandler.END
-
+    db_session = update_db_session()
+    had_morning_quiz = await is_user_had_morning_quiz_today(
+        chat_id=user_id, db_session=db_session
+    )
+    await db_session.commit()
+    if had_morning_quiz:
+        logger.info(f"User {user_id} already completed morning quiz today")
         await context.bot.send_message(
             chat_id=user_id,
-            text=text_constants.HOW_DO_YOU_FEEL,
-            reply_markup=keyboards.default_one_to_ten_keyboard(),
+            text=text_constants.QUIZ_ALREADY_PASSED,
+            reply_markup=main_menu_keyboard(update.effective_chat.id),
         )
-        return MorningQuizConversation.FIRST_QUESTION_ANSWER
+        return ConversationHandler.END
+
+    await context.bot.send_message(
+        chat_id=user_id,
+        text=text_constants.HOW_DO_YOU_FEEL,
+        reply_markup=keyboards.default_one_to_ten_keyboard(),
+    )
+    return MorningQuizConversation.FIRST_QUESTION_ANSWER
 
 
 async def retrieve_morning_feelings(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -162,26 +164,26 @@ async def retrieve_morning_is_going_to_have_training(update, context):
         )
         return MorningQuizConversation.WHEN_GOING_TO_HAVE_TRAINING
 
-    with next(get_db()) as db_session:
-        save_morning_quiz_results(
-            user_id=update.effective_user.id,
-            quiz_datetime=datetime.now(timezone),
-            user_feelings=context.user_data["morning_feelings"],
-            user_sleeping_hours=context.user_data["morning_sleep_time"],
+    db_session = update_db_session()
+    await save_morning_quiz_results(
+        user_id=update.effective_user.id,
+        quiz_datetime=datetime.now(timezone),
+        user_feelings=context.user_data["morning_feelings"],
+        user_sleeping_hours=context.user_data["morning_sleep_time"],
+        user_weight=context.user_data["user_weight"],
+        db_session=db_session,
+        is_going_to_have_training=context.user_data["is_going_to_have_training"],
+    )
+    await update.message.reply_text(
+        text=text_constants.MORNING_QUIZ_FINAL.format(
+            hours_amount=context.user_data["morning_sleep_time"],
             user_weight=context.user_data["user_weight"],
-            db_session=db_session,
-            is_going_to_have_training=context.user_data["is_going_to_have_training"],
-        )
-        await update.message.reply_text(
-            text=text_constants.MORNING_QUIZ_FINAL.format(
-                hours_amount=context.user_data["morning_sleep_time"],
-                user_weight=context.user_data["user_weight"],
-                feeling_mark=context.user_data["morning_feelings"],
-            ),
-            reply_markup=main_menu_keyboard(update.effective_chat.id),
-        )
-        logger.info(f"User {user_id} completed morning quiz")
-        return ConversationHandler.END
+            feeling_mark=context.user_data["morning_feelings"],
+        ),
+        reply_markup=main_menu_keyboard(update.effective_chat.id),
+    )
+    logger.info(f"User {user_id} completed morning quiz")
+    return ConversationHandler.END
 
 
 async def retrieve_morning_training_time(update, context):
@@ -200,24 +202,23 @@ async def retrieve_morning_training_time(update, context):
         hour=hours, minute=minutes, second=0, microsecond=0
     )
 
-    with next(get_db()) as db_session:
-        save_morning_quiz_results(
-            user_id=update.effective_user.id,
-            quiz_datetime=datetime.now(timezone),
-            user_feelings=context.user_data["morning_feelings"],
-            user_sleeping_hours=context.user_data["morning_sleep_time"],
-            db_session=db_session,
-            is_going_to_have_training=context.user_data["is_going_to_have_training"],
-            user_weight=context.user_data["user_weight"],
-            expected_training_datetime=expected_training_datetime,
-        )
+    db_session = update_db_session()
+    await save_morning_quiz_results(
+        user_id=update.effective_user.id,
+        quiz_datetime=datetime.now(timezone),
+        user_feelings=context.user_data["morning_feelings"],
+        user_sleeping_hours=context.user_data["morning_sleep_time"],
+        db_session=db_session,
+        is_going_to_have_training=context.user_data["is_going_to_have_training"],
+        user_weight=context.user_data["user_weight"],
+        expected_training_datetime=expected_training_datetime,
+    )
 
-    with next(get_db()) as db_session:
-        create_training_notifications(
-            chat_id=update.effective_user.id,
-            notification_time=user_input,
-            db_session=db_session,
-        )
+    await create_training_notifications(
+        chat_id=update.effective_user.id,
+        notification_time=user_input,
+        db_session=db_session,
+    )
 
     await update.message.reply_text(
         text=text_constants.MORNING_QUIZ_FINAL_WITH_TRAINING.format(
@@ -8,7 +8,6 @@ from telegram.ext import (
 )
 
 import text_constants
-from database import get_db
 from utils.commands import cancel
 from utils.keyboards import main_menu_keyboard
 from models import User
@@ -17,11 +16,16 @@ from enum import Enum, auto
 from loguru import logger
 import datetime
 from config import timezone as tz
+from utils.offload import run_db
 
 class StatisticsConversation(Enum):
     SELECT_PERIOD = auto()
 
 
+def find_user_by_chat_id(chat_id, db_session):
+    return db_session.query(User).filter(User.chat_id == str(chat_id)).first()
+
+
 async def start_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the statistics conversation with period selection."""
     keyboard = [
@@ -87,23 +91,22 @@ async def select_period(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"Generating {period} statistics")
         # Get user ID from database
         chat_id = update.effective_chat.id
-        with next(get_db()) as db_session:
-            user = db_session.query(User).filter(User.chat_id == str(chat_id)).first()
-            if not user:
-                logger.warning(f"User not found for chat_id: {chat_id}")
-                # Delete waiting message if possible
-                try:
-                    await waiting_message.delete()
-                except Exception:
-                    pass
-                
-                await update.message.reply_text(
-                    text=text_constants.USER_NOT_FOUND,
-                    reply_markup=main_menu_keyboard(chat_id)
-                )
-                return ConversationHandler.END
+        user = await run_db(find_user_by_chat_id, chat_id)
+        if not user:
+            logger.warning(f"User not found for chat_id: {chat_id}")
+            # Delete waiting message if possible
+            try:
+                await waiting_message.delete()
+            except Exception:
+                pass
             
-            user_id = user.id
+            await update.message.reply_text(
+                text=text_constants.USER_NOT_FOUND,
+                reply_markup=main_menu_keyboard(chat_id)
+            )
+            return ConversationHandler.END
+        
+        user_id = user.id
         
         # Generate statistics image
         start_date = None
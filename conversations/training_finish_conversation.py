@@ -10,17 +10,21 @@ from utils import keyboards
 import text_constants
 from utils.bot_utils import get_random_motivation_message
 from config import ADMIN_CHAT_IDS
-from database import get_db
+from database import update_db_session
+from utils.async_db_utils import (
+    update_pre_training_notification,
+    update_training_start_notification,
+    update_training_stop_notification,
+)
 from utils.db_utils import (
     get_user_by_chat_id,
     stop_training,
-    update_training_stop_notification,
-    update_training_start_notification,
-    update_pre_training_notification,
 )
 from utils.commands import cancel
 from utils.menus import training_menu, main_menu
+from utils.training_reminders import cancel_stop_training_reminder
 from utils.logger import get_logger
+from utils.offload import run_db
 
 logger = get_logger(__name__)
 
@@ -91,41 +95,39 @@ async def handle_training_finish(update, context):
     training_id = context.user_data["training_id"]
 
     if training_discomfort == text_constants.YES_NO_BUTTONS[0]:
-        with next(get_db()) as db_session:
-            user = get_user_by_chat_id(
-                chat_id=update.effective_chat.id, db_session=db_session
-            )
-            for admin_chat_id in ADMIN_CHAT_IDS:
-                await context.bot.send_message(
-                    chat_id=admin_chat_id,
-                    text=text_constants.USER_HAVE_PAINS.format(
-                        full_name=user.full_name,
-                        username=user.username,
-                        chat_id=user.chat_id,
-                    ),
-                )
+        user = await run_db(get_user_by_chat_id, chat_id=update.effective_chat.id)
+        for admin_chat_id in ADMIN_CHAT_IDS:
             await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=text_constants.USER_HAVE_PAINS_CLIENT,
+                chat_id=admin_chat_id,
+                text=text_constants.USER_HAVE_PAINS.format(
+                    full_name=user.full_name,
+                    username=user.username,
+                    chat_id=user.chat_id,
+                ),
             )
-
-    with next(get_db()) as db_session:
-        training_duration = stop_training(
-            training_id=training_id,
-            training_hardness=training_hardness,
-            training_discomfort=training_discomfort,
-            db_session=db_session,
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=text_constants.USER_HAVE_PAINS_CLIENT,
         )
 
-    with next(get_db()) as db_session:
-        update_training_stop_notification(update.effective_chat.id, db_session)
-        update_training_start_notification(update.effective_chat.id, db_session)
-        update_pre_training_notification(update.effective_chat.id, db_session)
+    training_duration = await run_db(
+        stop_training,
+        training_id=training_id,
+        training_hardness=training_hardness,
+        training_discomfort=training_discomfort,
+    )
+    cancel_stop_training_reminder(context.job_queue, training_id)
+
+    db_session = update_db_session()
+    await update_training_stop_notification(update.effective_chat.id, db_session)
+    await update_training_start_notification(update.effective_chat.id, db_session)
+    await update_pre_training_notification(update.effective_chat.id, db_session)
 
+    motivation_message = get_random_motivation_message()
     await context.bot.send_message(
         text=text_constants.TRAINING_FINAL.format(
             training_duration=str(training_duration).split(".")[0],
-            motivation_message=get_random_motivation_message(),
+            motivation_message=motivation_message,
         ),
         chat_id=update.effective_chat.id,
     )
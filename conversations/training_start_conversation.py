@@ -8,16 +8,20 @@ from telegram.ext import (
 
 from utils import keyboards
 import text_constants
-from database import get_db
+from database import update_db_session
+from utils.async_db_utils import (
+    update_pre_training_notification,
+    update_training_start_notification,
+)
 from utils.db_utils import (
     start_user_training,
-    update_training_start_notification,
-    update_pre_training_notification,
     get_training_pdf_message_data,
 )
 from utils.commands import cancel
 from utils.menus import training_menu
+from utils.training_reminders import schedule_stop_training_reminder
 from utils.logger import get_logger
+from utils.offload import run_db
 
 logger = get_logger(__name__)
 
@@ -53,13 +57,12 @@ async def handle_training_timer_start(update, context):
     context.user_data["menu_state"] = "training_start_timer_start"
     logger.info(f"User {user_id} starting training with mark: {user_input}")
     
-    with next(get_db()) as db_session:
-        training_id = start_user_training(
-            chat_id=update.effective_chat.id,
-            user_state_mark=user_input,
-            db_session=db_session,
-        )
-        logger.debug(f"Created training with ID: {training_id}")
+    training_id = await run_db(
+        start_user_training,
+        chat_id=update.effective_chat.id,
+        user_state_mark=user_input,
+    )
+    logger.debug(f"Created training with ID: {training_id}")
         
     if not training_id:
         logger.error(f"Failed to create training for user {user_id}")
@@ -71,11 +74,11 @@ async def handle_training_timer_start(update, context):
     else:
         dummy_pdf = "dummy.pdf"
         context.user_data["training_id"] = training_id
+        schedule_stop_training_reminder(context.job_queue, training_id)
 
-        with next(get_db()) as db_session:
-            training_pdf_message_id, training_pdf_chat_id = (
-                get_training_pdf_message_data(update.effective_chat.id, db_session)
-            )
+        training_pdf_message_id, training_pdf_chat_id = await run_db(
+            get_training_pdf_message_data, update.effective_chat.id
+        )
         if training_pdf_message_id and training_pdf_chat_id:
             await context.bot.forward_message(
                 chat_id=update.effective_chat.id,
@@ -93,9 +96,9 @@ async def handle_training_timer_start(update, context):
             text=text_constants.TRAINING_STARTED,
             reply_markup=keyboards.training_in_progress_keyboard(),
         )
-    with next(get_db()) as db_session:
-        update_training_start_notification(update.effective_chat.id, db_session)
-        update_pre_training_notification(update.effective_chat.id, db_session)
+    db_session = update_db_session()
+    await update_training_start_notification(update.effective_chat.id, db_session)
+    await update_pre_training_notification(update.effective_chat.id, db_session)
     return ConversationHandler.END
 
 
@@ -1,17 +1,193 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
-from config import DATABASE_URL
-
-engine = create_engine(DATABASE_URL, pool_recycle=120)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+import contextvars
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from config import (
+    DATABASE_URL,
+    DB_BATCH_MAX_OVERFLOW,
+    DB_BATCH_POOL_SIZE,
+    DB_BATCH_STATEMENT_TIMEOUT_MS,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT_MS,
+)
+
+
+class _CheckoutTimingMixin:
+    """Times how long checkouts wait for a connection (including connecting)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_waits = 0
+        self.checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
+        self.checkout_timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkout_waits += 1
+            self.checkout_wait_seconds += waited
+            self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, waited)
+
+
+class TimedQueuePool(_CheckoutTimingMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _engine_options(url, pool_size, max_overflow, statement_timeout_ms, poolclass):
+    options = {
+        "poolclass": poolclass,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if statement_timeout_ms and url.get_backend_name() == "postgresql":
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {
+                "server_settings": {"statement_timeout": str(statement_timeout_ms)}
+            }
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    return options
+
+
+def _sync_engine(pool_size, max_overflow, statement_timeout_ms):
+    url = make_url(DATABASE_URL)
+    return create_engine(
+        url, **_engine_options(url, pool_size, max_overflow, statement_timeout_ms, TimedQueuePool)
+    )
+
+
+# Interactive traffic (update handlers) and batch jobs (scheduler, outbox,
+# statistics fan-out) use separate pools, so a burst of jobs can't starve users
+engine = _sync_engine(DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_STATEMENT_TIMEOUT_MS)
+batch_engine = _sync_engine(DB_BATCH_POOL_SIZE, DB_BATCH_MAX_OVERFLOW, DB_BATCH_STATEMENT_TIMEOUT_MS)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+BatchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=batch_engine)
+Base = declarative_base()
+
+
+def _async_database_url(database_url):
+    url = make_url(database_url)
+    if url.get_backend_name() == "postgresql":
+        query = dict(url.query)
+        # asyncpg takes ssl instead of libpq's sslmode
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    return url
+
+
+def _async_engine(pool_size, max_overflow, statement_timeout_ms):
+    url = _async_database_url(DATABASE_URL)
+    return create_async_engine(
+        url,
+        **_engine_options(
+            url, pool_size, max_overflow, statement_timeout_ms, TimedAsyncAdaptedQueuePool
+        ),
+    )
+
+
+async_engine = _async_engine(DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_STATEMENT_TIMEOUT_MS)
+async_batch_engine = _async_engine(
+    DB_BATCH_POOL_SIZE, DB_BATCH_MAX_OVERFLOW, DB_BATCH_STATEMENT_TIMEOUT_MS
+)
+# Attributes stay loaded after commit; lazy loads are not possible outside a greenlet
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+AsyncBatchSessionLocal = async_sessionmaker(
+    bind=async_batch_engine, autoflush=False, expire_on_commit=False
+)
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_batch_db():
+    """get_db for scheduled jobs, on the batch pool."""
+    db = BatchSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_async_db():
+    """AsyncSession counterpart of get_db: ``async with get_async_db() as db_session``."""
+    return AsyncSessionLocal()
+
+
+def get_async_batch_db():
+    """get_async_db for scheduled jobs, on the batch pool."""
+    return AsyncBatchSessionLocal()
+
+
+class _UpdateSessionScope:
+    __slots__ = ("session", "closed")
+
+    def __init__(self):
+        self.session = None
+        self.closed = False
+
+
+_update_session_scope = contextvars.ContextVar("update_session_scope", default=None)
+
+
+@asynccontextmanager
+async def update_session_scope(update=None):
+    """
+    Processing of one update: its decorators and handlers share the session
+    update_db_session() opens, which is closed when the update is done.
+    """
+    scope = _UpdateSessionScope()
+    token = _update_session_scope.set(scope)
+    try:
+        yield
+    finally:
+        _update_session_scope.reset(token)
+        scope.closed = True
+        if scope.session is not None:
+            await scope.session.close()
+
+
+def update_db_session():
+    """The AsyncSession of the update being processed, opened on first use."""
+    scope = _update_session_scope.get()
+    if scope is None or scope.closed:
+        raise RuntimeError(
+            "update_db_session() is only available while an update is processed, "
+            "use get_async_db() in jobs and scripts"
+        )
+    if scope.session is None:
+        scope.session = AsyncSessionLocal()
+    return scope.session
@@ -1,11 +1,12 @@
 import datetime
-from datetime import timedelta, time as datetime_time
+from datetime import time as datetime_time
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
     ApplicationBuilder,
     CallbackContext,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
@@ -13,107 +14,86 @@ import conversations
 from utils import keyboards
 from utils.bot_utils import (
     get_random_motivation_message,
+    reactivate_unreachable_chat,
 )
-from config import ADMIN_CHAT_IDS, BOT_TOKEN, timezone
-from database import get_db
+from config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    TELEGRAM_BASE_URL,
+    timezone,
+)
+from database import get_async_batch_db, update_session_scope
+from utils import async_db_utils
 from utils.db_utils import (
-    get_notifications_by_type,
-    get_notifications_to_send_by_time,
-    get_users_with_yesterday_trainings,
-    update_notification_sent,
-    update_user_notification_preference_admin_message_sent,
-    update_user_notification_preference_next_execution,
-    get_custom_notifications_to_send,
-    update_custom_notification_sent,
-    update_user_stats_counter,
+    build_outbound_message,
+    enqueue_outbound_messages,
+    get_users_by_ids,
 )
-from models import NotificationType, CustomNotification, User
+from models import NotificationType
 import utils.menus
 import text_constants
 from utils.logger import get_logger
+from utils.admin_digest import admin_digest
+from utils.outbox import outbox_worker
+from utils.catch_up import missed_occurrences
+from utils.coordination import instance_coordinator
+from utils.recurrence import compile_notification_rule, localize_wall_time
+from utils.scheduler import notification_scheduler
+from utils.send_plan import PlanKind
+from utils.training_reminders import request_stop_training_reminders_restore
+from utils.db_monitor import database_monitor
+from utils.offload import blocking_pool, run_db
+from utils.update_processor import update_processor
+from utils.user_cache import user_profile_cache
+from utils.user_directory import user_directory
+from utils.motivation import motivation_messages
 from capture_statistics_image import generate_statistics_image
 
 logger = get_logger(__name__)
 
-async def send_morning_notification(context, user_id, admin_message_datetime):
-    try:
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=text_constants.MORNING_NOTIFICATION_TEXT,
-            reply_markup=keyboards.start_morning_quiz_keyboard(),
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send morning notification to user {user_id}: {e}")
-        today = datetime.datetime.now(tz=timezone).date()
-        if not admin_message_datetime or (
-            admin_message_datetime and admin_message_datetime.date() != today
-        ):
-            for chat_id in ADMIN_CHAT_IDS:
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=text_constants.BOT_UNABLE_TO_SEND_MESSAGE.format(
-                        user_id=user_id
-                    ),
-                )
-            return False
-        return None
-
-async def send_scheduled_message(context: CallbackContext):
+async def send_scheduled_message(context: CallbackContext, notification_ids):
     datetime_now = datetime.datetime.now(tz=timezone)
     logger.info(f"Running scheduled message job at {datetime_now}")
-    with next(get_db()) as db_session:
-        notifications = get_notifications_to_send_by_time(
-            current_datetime=datetime_now, db_session=db_session
+    async with get_async_batch_db() as db_session:
+        queued = await async_db_utils.enqueue_morning_notifications(
+            current_datetime=datetime_now,
+            db_session=db_session,
+            text=text_constants.MORNING_NOTIFICATION_TEXT,
+            reply_markup=keyboards.start_morning_quiz_keyboard().to_dict(),
+            notification_ids=notification_ids,
+        )
+    logger.debug(f"Queued {queued} morning notifications")
+    if queued:
+        outbox_worker.wake()
+
+async def skip_morning_notifications_job(context: CallbackContext, notification_ids):
+    async with get_async_batch_db() as db_session:
+        await async_db_utils.skip_morning_notifications(
+            datetime.datetime.now(tz=timezone), db_session, notification_ids
         )
-        logger.debug(f"Found {len(notifications)} notifications to send")
-        for notification in notifications:
-            user_id = notification.user.chat_id
-            logger.info(f"Sending morning notification to user {user_id}")
-            morning_notification_sent = await send_morning_notification(
-                context, user_id, notification.admin_warning_sent
-            )
-            if morning_notification_sent is True:
-                last_execution_datetime = datetime_now
-                next_execution_datetime = (
-                    notification.next_execution_datetime + timedelta(days=1)
-                )
-                logger.debug(f"Updating notification {notification.id} next execution to {next_execution_datetime}")
-                update_user_notification_preference_next_execution(
-                    last_execution_datetime=last_execution_datetime,
-                    next_execution_datetime=next_execution_datetime,
-                    notification_id=notification.id,
-                    db_session=db_session,
-                )
-            elif morning_notification_sent is False:
-                logger.warning(f"Failed to send notification to user {user_id}, updating admin message sent")
-                update_user_notification_preference_admin_message_sent(
-                    db_session=db_session,
-                    sent_datetime=datetime_now,
-                    notification_id=notification.id,
-                )
 
-async def send_after_training_messages(context: CallbackContext):
-    datetime_now = datetime.datetime.now(tz=timezone)
-    yesterday_date = (datetime_now - timedelta(days=1)).date()
-    logger.info(f"Sending after training messages for {yesterday_date}")
-    with next(get_db()) as db_session:
-        results = get_users_with_yesterday_trainings(db_session)
+async def send_after_training_messages(context: CallbackContext, training_ids):
+    logger.info(f"Sending after training messages for {len(training_ids)} trainings")
+    async with get_async_batch_db() as db_session:
+        trainings = await async_db_utils.get_trainings_by_ids(training_ids, db_session)
         users_trainings_to_process = dict()
-        for user in results:
-            for training in user.trainings:
-                if training.training_start_date.date() == yesterday_date:
-                    users_trainings_to_process[user.chat_id] = {
-                        "training_id": training.id,
-                        "training_duration": training.training_duration,
-                        "training_start_date": training.training_start_date,
-                    }
+        for training in trainings:
+            if not training.user.is_active:
+                continue
+            users_trainings_to_process[training.user.chat_id] = {
+                "user_id": training.user_id,
+                "training_id": training.id,
+                "training_duration": training.training_duration,
+                "training_start_date": training.training_start_date,
+            }
         logger.info(f"Found {len(users_trainings_to_process)} users with trainings to process")
         await send_after_training_quiz_notifications(
-            context, users_trainings_to_process
+            users_trainings_to_process, db_session
         )
+    outbox_worker.wake()
 
-async def send_after_training_quiz_notifications(context, users_data):
+async def send_after_training_quiz_notifications(users_data, db_session):
+    messages = []
     for user_id, training in users_data.items():
         keyboard = [
             [
@@ -124,166 +104,173 @@ async def send_after_training_quiz_notifications(context, users_data):
             ]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=text_constants.AFTER_TRAINING_NOTIFICATION_TEXT.format(
-                training_date=str(training["training_start_date"]).split(".")[0]
-            ),
-            reply_markup=reply_markup,
-        )
-
-async def send_evening_after_training_motivation_message(context, user_ids):
-    for user_id in user_ids:
-        message = get_random_motivation_message()
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=message,
+        messages.append(
+            build_outbound_message(
+                user_id=training["user_id"],
+                chat_id=user_id,
+                kind=PlanKind.AFTER_TRAINING_QUIZ.value,
+                # One quiz per training
+                scheduled_for=training["training_start_date"],
+                text=text_constants.AFTER_TRAINING_NOTIFICATION_TEXT.format(
+                    training_date=str(training["training_start_date"]).split(".")[0]
+                ),
+                reply_markup=reply_markup.to_dict(),
+                source_id=training["training_id"],
+            )
         )
+    await async_db_utils.enqueue_outbound_messages(messages, db_session)
+    await db_session.commit()
+
+def send_evening_after_training_motivation_message(users, db_session):
+    # One motivation message per user and day
+    today = localize_wall_time(datetime.datetime.now(tz=timezone).date(), datetime_time(0))
+    enqueue_outbound_messages(
+        [
+            build_outbound_message(
+                user_id=user.id,
+                chat_id=user.chat_id,
+                kind=PlanKind.EVENING_MOTIVATION.value,
+                scheduled_for=today,
+                text=get_random_motivation_message(user.id),
+            )
+            for user in users
+        ],
+        db_session,
+    )
+    db_session.commit()
+
+async def get_evening_after_training_motivation(context, user_ids):
+    await run_db(queue_evening_after_training_motivation, user_ids, batch=True)
+    outbox_worker.wake()
+
+def queue_evening_after_training_motivation(user_ids, db_session):
+    users = user_directory.get_by_ids(user_ids)
+    if len(users) < len(user_ids):
+        # Not loaded yet or users created since the last refresh
+        users = get_users_by_ids(user_ids, db_session)
+    users = [
+        user for user in users if user.is_active
+    ]
+    send_evening_after_training_motivation_message(users, db_session)
+
+def pre_training_notification_text(notification):
+    return text_constants.TRAINING_REMINDER_FIRST.format(
+        notification_time=notification.notification_time
+    )
 
-async def get_evening_after_training_motivation(context):
-    with next(get_db()) as db_session:
-        results = get_users_with_yesterday_trainings(db_session)
-        user_ids = [user.chat_id for user in results]
-        await send_evening_after_training_motivation_message(context, user_ids)
+def training_notification_text(notification):
+    return text_constants.TRAINING_REMINDER_SECOND.format(
+        notification_time=notification.notification_time
+    )
 
-async def send_pre_training_notifications(context, notification):
-    try:
-        logger.info(f"Sending pre-training notification to user {notification.user.chat_id}")
-        await context.bot.send_message(
-            chat_id=notification.user.chat_id,
-            text=text_constants.TRAINING_REMINDER_FIRST.format(
-                notification_time=notification.notification_time
-            ),
+async def send_custom_notifications(context: CallbackContext, notification_ids):
+    """Queue due custom notifications and move them to their next execution."""
+    async with get_async_batch_db() as db_session:
+        notifications = await async_db_utils.get_custom_notifications_to_send(
+            db_session=db_session, notification_ids=notification_ids
         )
-        with next(get_db()) as db_session:
-            update_notification_sent(notification.id, db_session)
-    except Exception as e:
-        logger.error(f"Unable to send message to {notification.user.chat_id}: {e}")
-
-async def send_training_notifications(context, notification):
-    try:
-        logger.info(f"Sending training notification to user {notification.user.chat_id}")
-        await context.bot.send_message(
-            chat_id=notification.user.chat_id,
-            text=text_constants.TRAINING_REMINDER_SECOND.format(
-                notification_time=notification.notification_time
-            ),
+        now = datetime.datetime.now(tz=timezone)
+        await async_db_utils.enqueue_outbound_messages(
+            [
+                build_outbound_message(
+                    user_id=notification.user_id,
+                    chat_id=notification.user.chat_id,
+                    kind=NotificationType.CUSTOM_NOTIFICATION.value,
+                    scheduled_for=scheduled_for,
+                    # Include the notification name in the message
+                    text=f"{notification.notification_name}\n\n{notification.notification_message or text_constants.DEFAULT_CUSTOM_NOTIFICATION_MESSAGE}",
+                    source_id=notification.id,
+                )
+                for notification in notifications
+                # More than one when missed occurrences are replayed
+                for scheduled_for in missed_occurrences(
+                    NotificationType.CUSTOM_NOTIFICATION,
+                    compile_notification_rule(notification),
+                    notification.next_execution_datetime,
+                    now,
+                )
+            ],
+            db_session,
         )
-        with next(get_db()) as db_session:
-            update_notification_sent(notification.id, db_session)
-    except Exception as e:
-        logger.error(f"Unable to send message to {notification.user.chat_id}: {e}")
-
-async def send_stop_training_notifications(context, notification):
-    try:
-        logger.info(f"Sending stop training notification to user {notification.user.chat_id}")
-        await context.bot.send_message(
-            chat_id=notification.user.chat_id,
-            text=text_constants.TRAINING_MORE_THEN_HOUR,
+        # Committed together with the queued messages
+        await async_db_utils.bulk_update_custom_notifications_sent(notifications, db_session)
+    if notifications:
+        outbox_worker.wake()
+
+async def skip_custom_notifications(context: CallbackContext, notification_ids):
+    async with get_async_batch_db() as db_session:
+        notifications = await async_db_utils.get_custom_notifications_to_send(
+            db_session=db_session, notification_ids=notification_ids
         )
-        with next(get_db()) as db_session:
-            update_notification_sent(notification.id, db_session)
-    except Exception as e:
-        logger.error(f"Unable to send message to {notification.user.chat_id}: {e}")
+        await async_db_utils.bulk_update_custom_notifications_sent(notifications, db_session)
 
-async def send_custom_notification(context, notification):
-    try:
-        logger.info(f"Sending custom notification {notification.id} to user {notification.user.chat_id}")
-        # Get the associated custom notification
-        with next(get_db()) as db_session:
-            custom_notification = (
-                db_session.query(CustomNotification)
-                .filter_by(notification_preference_id=notification.id, is_active=True)
-                .first()
-            )
-            
-            if not custom_notification:
-                return
-                
-            message = custom_notification.notification_message or text_constants.DEFAULT_CUSTOM_NOTIFICATION_MESSAGE
-            
-            # Include the notification name in the message
-            full_message = f"{custom_notification.notification_name}\n\n{message}"
-            
-            await context.bot.send_message(
-                chat_id=notification.user.chat_id,
-                text=full_message,
-            )
-            
-            # Mark as sent but don't deactivate - it will be sent again tomorrow
-            update_notification_sent(notification.id, db_session)
-    except Exception as e:
-        logger.error(f"Unable to send custom notification to {notification.user.chat_id}: {e}")
-        for chat_id in ADMIN_CHAT_IDS:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=text_constants.BOT_UNABLE_TO_SEND_MESSAGE.format(
-                    user_id=notification.user.chat_id
-                ),
-            )
+async def skip_notifications_by_type(context, notification_type, notification_ids):
+    async with get_async_batch_db() as db_session:
+        await async_db_utils.bulk_update_notifications_sent(
+            notification_type, notification_ids, db_session
+        )
 
-async def get_custom_notifications(context):
-    with next(get_db()) as db_session:
-        notifications = get_notifications_by_type(
-            notification_type=NotificationType.CUSTOM_NOTIFICATION,
+async def send_notifications_by_type(
+    context, notification_type, notification_ids, notification_text
+):
+    logger.info(f"Getting {notification_type.value} notifications")
+    async with get_async_batch_db() as db_session:
+        notifications = await async_db_utils.get_notifications_by_type(
+            notification_type=notification_type,
             db_session=db_session,
+            notification_ids=notification_ids,
         )
-    for notification in notifications:
-        await send_custom_notification(context, notification)
-
-async def send_custom_notifications(context: CallbackContext):
-    """Send custom notifications to users."""
-    with next(get_db()) as db_session:
-        notifications = get_custom_notifications_to_send(db_session=db_session)
-        for notification in notifications:
-            try:
-                # Include the notification name in the message
-                full_message = f"{notification.notification_name}\n\n{notification.notification_message or text_constants.DEFAULT_CUSTOM_NOTIFICATION_MESSAGE}"
-                
-                await context.bot.send_message(
+        logger.debug(f"Found {len(notifications)} {notification_type.value} notifications to send")
+        await async_db_utils.enqueue_outbound_messages(
+            [
+                build_outbound_message(
+                    user_id=notification.user_id,
                     chat_id=notification.user.chat_id,
-                    text=full_message,
+                    kind=notification_type.value,
+                    scheduled_for=notification.next_execution_datetime
+                    or datetime.datetime.now(tz=timezone),
+                    text=notification_text(notification),
+                    source_id=notification.id,
                 )
-                
-                # Mark as sent and update next execution time
-                update_custom_notification_sent(notification.id, db_session)
-            except Exception as e:
-                logger.error(f"Unable to send custom notification to {notification.user.chat_id}: {e}")
-
-async def get_pre_training_notifications(context):
-    logger.info("Getting pre-training notifications")
-    with next(get_db()) as db_session:
-        notifications = get_notifications_by_type(
-            notification_type=NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION,
-            db_session=db_session,
+                for notification in notifications
+            ],
+            db_session,
+        )
+        # Committed together with the queued messages
+        await async_db_utils.bulk_update_notifications_sent(
+            notification_type,
+            [notification.id for notification in notifications],
+            db_session,
         )
-    logger.debug(f"Found {len(notifications)} pre-training notifications to send")
-    for notification in notifications:
-        await send_pre_training_notifications(context, notification)
+    if notifications:
+        outbox_worker.wake()
+
+async def get_pre_training_notifications(context, notification_ids):
+    await send_notifications_by_type(
+        context,
+        NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION,
+        notification_ids,
+        pre_training_notification_text,
+    )
 
 
-async def get_training_notifications(context):
-    logger.info("Getting training notifications")
-    with next(get_db()) as db_session:
-        notifications = get_notifications_by_type(
-            notification_type=NotificationType.TRAINING_REMINDER_NOTIFICATION,
-            db_session=db_session,
-        )
-    logger.debug(f"Found {len(notifications)} training notifications to send")
-    for notification in notifications:
-        await send_training_notifications(context, notification)
+async def get_training_notifications(context, notification_ids):
+    await send_notifications_by_type(
+        context,
+        NotificationType.TRAINING_REMINDER_NOTIFICATION,
+        notification_ids,
+        training_notification_text,
+    )
 
+async def skip_pre_training_notifications(context, notification_ids):
+    await skip_notifications_by_type(
+        context, NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION, notification_ids
+    )
 
-async def stop_training_notification(context):
-    logger.info("Getting stop training notifications")
-    with next(get_db()) as db_session:
-        notifications = get_notifications_by_type(
-            notification_type=NotificationType.STOP_TRAINING_NOTIFICATION,
-            db_session=db_session,
-        )
-    logger.debug(f"Found {len(notifications)} stop training notifications to send")
-    for notification in notifications:
-        await send_stop_training_notifications(context, notification)
+async def skip_training_notifications(context, notification_ids):
+    await skip_notifications_by_type(
+        context, NotificationType.TRAINING_REMINDER_NOTIFICATION, notification_ids
+    )
 
 async def send_weekly_statistics(context: CallbackContext):
     """
@@ -293,33 +280,37 @@ async def send_weekly_statistics(context: CallbackContext):
     Runs every Monday at 12:00 Kyiv time.
     """
     current_date = datetime.datetime.now(tz=timezone)
-    
+
+    if not instance_coordinator.is_leader:
+        logger.debug("Not the leader instance, skipping statistics job")
+        return
+
     logger.info(f"Running scheduled statistics job at {current_date}")
     
     # Get all active users
-    with next(get_db()) as db_session:
-        users = db_session.query(User).filter(User.is_active).all()
+    async with get_async_batch_db() as db_session:
+        users = await async_db_utils.get_active_user_chats(db_session)
         
-        if not users:
-            logger.warning("No active users found for sending statistics")
-            return
-            
-        logger.info(f"Found {len(users)} active users for sending statistics")
+    if not users:
+        logger.warning("No active users found for sending statistics")
+        return
         
-        # Schedule individual jobs for each user with a small delay between them
-        delay = 0
-        for user in users:
-            # Schedule a job to process this user's statistics
-            # Use a small delay between users to avoid overloading the system
-            context.job_queue.run_once(
-                process_user_statistics,
-                delay,
-                data={"user_id": user.id, "chat_id": user.chat_id}
-            )
-            # Increment delay for the next user (2 seconds between users)
-            delay += 2
-            
-        logger.info(f"Scheduled statistics generation for {len(users)} users")
+    logger.info(f"Found {len(users)} active users for sending statistics")
+    
+    # Schedule individual jobs for each user with a small delay between them
+    delay = 0
+    for user_id, chat_id in users:
+        # Schedule a job to process this user's statistics
+        # Use a small delay between users to avoid overloading the system
+        context.job_queue.run_once(
+            process_user_statistics,
+            delay,
+            data={"user_id": user_id, "chat_id": chat_id}
+        )
+        # Increment delay for the next user (2 seconds between users)
+        delay += 2
+        
+    logger.info(f"Scheduled statistics generation for {len(users)} users")
 
 
 async def process_user_statistics(context: CallbackContext):
@@ -332,64 +323,64 @@ async def process_user_statistics(context: CallbackContext):
         chat_id = int(chat_id)
         logger.info(f"Processing statistics for user {chat_id}")
         
-        # Use a new database session
-        with next(get_db()) as db_session:
-            # Update the user's stats counter and determine if this is a monthly cycle
-            is_monthly, counter = update_user_stats_counter(user_id, db_session)
-            
-            # Set period and date range based on counter
-            period = "monthly" if is_monthly else "weekly"
-            end_date = datetime.datetime.now(tz=timezone)
-            
-            # For weekly stats, use last 7 days; for monthly stats, use last 28 days
-            if is_monthly:
-                start_date = end_date - datetime.timedelta(days=28)
-            else:
-                start_date = end_date - datetime.timedelta(days=7)
-            
-            logger.info(f"Generating {period} statistics for user {chat_id} (counter: {counter})")
-            
-            # Generate statistics image and analysis
-            image_path, analysis = await generate_statistics_image(
-                chat_id=user_id,
-                period=period,
-                start_date=start_date.strftime("%Y-%m-%d"),
-                end_date=end_date.strftime("%Y-%m-%d")
+        # Update the user's stats counter and determine if this is a monthly cycle
+        async with get_async_batch_db() as db_session:
+            is_monthly, counter = await async_db_utils.update_user_stats_counter(user_id, db_session)
+        
+        # Set period and date range based on counter
+        period = "monthly" if is_monthly else "weekly"
+        end_date = datetime.datetime.now(tz=timezone)
+        
+        # For weekly stats, use last 7 days; for monthly stats, use last 28 days
+        if is_monthly:
+            start_date = end_date - datetime.timedelta(days=28)
+        else:
+            start_date = end_date - datetime.timedelta(days=7)
+        
+        logger.info(f"Generating {period} statistics for user {chat_id} (counter: {counter})")
+        
+        # Generate statistics image and analysis
+        image_path, analysis = await generate_statistics_image(
+            chat_id=user_id,
+            period=period,
+            start_date=start_date.strftime("%Y-%m-%d"),
+            end_date=end_date.strftime("%Y-%m-%d"),
+            batch=True,
+        )
+        
+        if not image_path:
+            logger.error(f"Failed to generate statistics image for user {chat_id}")
+            return
+        
+        # Determine the period text for the caption
+        period_text = text_constants.LAST_MONTH if is_monthly else text_constants.LAST_WEEK
+        
+        # Send image to user
+        with open(image_path, 'rb') as photo:
+            await context.bot.send_photo(
+                chat_id=chat_id,
+                photo=photo,
+                caption=text_constants.WEEKLY_STATISTICS_CAPTION.format(period=period_text)
             )
+        
+        # Send AI analysis as a separate message if available
+        if analysis:
+            logger.info(f"Sending AI analysis to user {chat_id}")
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=f"📊 *Аналіз ваших тренувань*\n\n{analysis}",
+                parse_mode="Markdown"
+            )
+        
+        logger.info(f"Statistics sent successfully to user {chat_id}")
+        
+        # Clean up the image file
+        try:
+            import os
+            os.remove(image_path)
+        except Exception as e:
+            logger.error(f"Error removing temporary file: {e}")
             
-            if not image_path:
-                logger.error(f"Failed to generate statistics image for user {chat_id}")
-                return
-            
-            # Determine the period text for the caption
-            period_text = text_constants.LAST_MONTH if is_monthly else text_constants.LAST_WEEK
-            
-            # Send image to user
-            with open(image_path, 'rb') as photo:
-                await context.bot.send_photo(
-                    chat_id=chat_id,
-                    photo=photo,
-                    caption=text_constants.WEEKLY_STATISTICS_CAPTION.format(period=period_text)
-                )
-            
-            # Send AI analysis as a separate message if available
-            if analysis:
-                logger.info(f"Sending AI analysis to user {chat_id}")
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"📊 *Аналіз ваших тренувань*\n\n{analysis}",
-                    parse_mode="Markdown"
-                )
-            
-            logger.info(f"Statistics sent successfully to user {chat_id}")
-            
-            # Clean up the image file
-            try:
-                import os
-                os.remove(image_path)
-            except Exception as e:
-                logger.error(f"Error removing temporary file: {e}")
-                
     except Exception as e:
         logger.error(f"Error sending statistics to user {chat_id}: {e}")
         import traceback
@@ -397,7 +388,17 @@ async def process_user_statistics(context: CallbackContext):
 
 if __name__ == "__main__":
     logger.info("Starting ISLOB Bot")
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    # Chats run in parallel, each chat's updates in order
+    # Handlers of an update share one database session, closed when it's done
+    update_processor.add_middleware(update_session_scope)
+    update_processor.add_middleware(database_monitor.count_update_queries)
+    builder = ApplicationBuilder().token(BOT_TOKEN).concurrent_updates(update_processor)
+    if TELEGRAM_BASE_URL:
+        builder = builder.base_url(TELEGRAM_BASE_URL)
+    app = builder.build()
+
+    # Runs before every other handler; chats deactivated as unreachable come back on any update
+    app.add_handler(TypeHandler(Update, reactivate_unreachable_chat), group=-1)
 
     app.add_handler(conversations.intro_conversation.intro_conv_handler)
     app.add_handler(conversations.morning_quiz_conversation.morning_quiz_conv_handler)
@@ -461,35 +462,63 @@ if __name__ == "__main__":
     job_queue = app.job_queue
     logger.info("Configuring job queue")
 
-    logger.info("Adding scheduled message job (interval: 10s)")
-    job_queue.run_repeating(send_scheduled_message, interval=10, first=0)
-    
-    after_training_quiz_scheduled_time = datetime_time(
-        hour=15, minute=0, tzinfo=timezone
+    logger.info("Joining bot instances")
+    instance_coordinator.start(job_queue)
+
+    logger.info("Configuring notification scheduler")
+    notification_scheduler.register(
+        NotificationType.MORNING_NOTIFICATION,
+        send_scheduled_message,
+        skip_morning_notifications_job,
+    )
+    notification_scheduler.register(
+        NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION,
+        get_pre_training_notifications,
+        skip_pre_training_notifications,
+    )
+    notification_scheduler.register(
+        NotificationType.TRAINING_REMINDER_NOTIFICATION,
+        get_training_notifications,
+        skip_training_notifications,
     )
-    logger.info(f"Adding daily after training messages job at {after_training_quiz_scheduled_time}")
-    job_queue.run_daily(
-        send_after_training_messages, time=after_training_quiz_scheduled_time
+    notification_scheduler.register(
+        NotificationType.CUSTOM_NOTIFICATION,
+        send_custom_notifications,
+        skip_custom_notifications,
     )
 
-    after_training_motivation_time = datetime_time(hour=18, minute=0, tzinfo=timezone)
-    logger.info(f"Adding daily after training motivation job at {after_training_motivation_time}")
-    job_queue.run_daily(
-        get_evening_after_training_motivation, time=after_training_motivation_time
+    after_training_quiz_scheduled_time = datetime_time(hour=15, minute=0)
+    logger.info(f"Planning daily after training messages at {after_training_quiz_scheduled_time}")
+    notification_scheduler.register_after_training(
+        PlanKind.AFTER_TRAINING_QUIZ,
+        send_after_training_messages,
+        after_training_quiz_scheduled_time,
     )
 
-    logger.info("Adding pre-training notifications job (interval: 10s)")
-    job_queue.run_repeating(get_pre_training_notifications, interval=10, first=0)
-    
-    logger.info("Adding training notifications job (interval: 10s)")
-    job_queue.run_repeating(get_training_notifications, interval=10, first=0)
-    
-    logger.info("Adding stop training notification job (interval: 10s)")
-    job_queue.run_repeating(stop_training_notification, interval=10, first=0)
-    
-    logger.info("Adding custom notifications job (interval: 10s)")
-    job_queue.run_repeating(send_custom_notifications, interval=10, first=0)
-    
+    after_training_motivation_time = datetime_time(hour=18, minute=0)
+    logger.info(f"Planning daily after training motivation at {after_training_motivation_time}")
+    notification_scheduler.register_after_training(
+        PlanKind.EVENING_MOTIVATION,
+        get_evening_after_training_motivation,
+        after_training_motivation_time,
+    )
+    notification_scheduler.start(job_queue)
+
+    outbox_worker.start(job_queue)
+    update_processor.start(job_queue, app.update_queue)
+    blocking_pool.start(job_queue)
+    database_monitor.start(job_queue)
+    user_profile_cache.start(job_queue)
+    user_directory.start(job_queue)
+    motivation_messages.start(job_queue)
+    utils.menus.menu_router.start(job_queue)
+    admin_digest.start(job_queue)
+
+    logger.info("Restoring stop training reminders")
+    request_stop_training_reminders_restore(job_queue)
+    # Users moved to this instance keep their reminders
+    instance_coordinator.subscribe(lambda: request_stop_training_reminders_restore(job_queue))
+
     # Schedule weekly statistics job to run every Monday at 12:00 Kyiv time -> 9:00 UTC time
     kyiv_time = datetime_time(hour=18, minute=50) #UTC TIME
     job_queue.run_daily(send_weekly_statistics, time=kyiv_time, days=[5])  # 0 is Monday
@@ -505,6 +534,13 @@ if __name__ == "__main__":
     app.add_error_handler(error_handler)
     logger.info("Error handler configured")
 
-    logger.info("Starting the bot")
-    app.run_polling()
+    if BOT_MODE == "webhook":
+        import asyncio
+        from utils.webhook import run_webhook
+
+        logger.info("Starting the bot in webhook mode")
+        asyncio.run(run_webhook(app))
+    else:
+        logger.info("Starting the bot")
+        app.run_polling()
     logger.info("Bot stopped")
@@ -10,6 +10,10 @@ from sqlalchemy import (
     Time,
     UniqueConstraint,
     Float,
+    Index,
+    JSON,
+    func,
+    text,
 )
 from sqlalchemy.orm import relationship
 from database import Base
@@ -34,6 +38,12 @@ class NotificationType(PyEnum):
     STOP_TRAINING_NOTIFICATION = "stop_training_notification"
 
 
+class OutboundMessageStatus(PyEnum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
 class NotificationPreference(Base):
     __tablename__ = "notification_preferences"
 
@@ -51,6 +61,20 @@ class NotificationPreference(Base):
         UniqueConstraint(
             "user_id", "notification_type", name="uq_user_notification_type"
         ),
+        # Partial indexes matching the scheduler queries in utils/db_utils.py
+        Index(
+            "ix_notification_preferences_morning_due",
+            "next_execution_datetime",
+            postgresql_where=text(
+                "is_active AND notification_type = 'MORNING_NOTIFICATION'"
+            ),
+        ),
+        Index(
+            "ix_notification_preferences_pending_by_type",
+            "notification_type",
+            "next_execution_datetime",
+            postgresql_where=text("is_active AND NOT notification_sent"),
+        ),
     )
     user = relationship("User", back_populates="notification_preferences")
 
@@ -73,6 +97,14 @@ class CustomNotification(Base):
     periodicity_type = Column(String, nullable=False, default="daily")  # daily, weekly, monthly, specific_days
     specific_days = Column(String, nullable=True)  # Comma-separated days of week (0-6, where 0 is Monday)
     
+    __table_args__ = (
+        Index(
+            "ix_custom_notifications_pending_due",
+            "next_execution_datetime",
+            postgresql_where=text("is_active AND NOT notification_sent"),
+        ),
+    )
+
     user = relationship("User", back_populates="custom_notifications")
 
 
@@ -88,9 +120,24 @@ class User(Base):
     )
     role = Column(Enum(UserRole), nullable=False, default=UserRole.USER)
     training_pdf_message_id = Column(String, default=None, nullable=True)
-    is_active = Column(Boolean, default=True)
+    # False while the chat can't be reached; such users are skipped by the scheduler
+    is_active = Column(Boolean, default=True, server_default=text("true"), nullable=False)
+    # Consecutive deliveries that failed because the chat is unreachable
+    send_failures = Column(Integer, default=0, server_default=text("0"), nullable=False)
+    # Set when the user was deactivated after send_failures reached the threshold
+    deactivated_at = Column(DateTime(timezone=True), nullable=True)
     weekly_stats_counter = Column(Integer, default=0)
     last_stats_sent_date = Column(DateTime, nullable=True)
+    # Watermark for the in-memory user directory (utils/user_directory.py); also
+    # bumped by Core UPDATE statements through onupdate
+    updated_at = Column(
+        DateTime(timezone=True),
+        default=func.now(),
+        onupdate=func.now(),
+        server_default=func.now(),
+        nullable=False,
+        index=True,
+    )
 
     notification_preferences = relationship(
         "NotificationPreference",
@@ -146,3 +193,39 @@ class MorningQuiz(Base):
     expected_training_datetime = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="morning_quizzes")
+
+
+class OutboundMessage(Base):
+    __tablename__ = "outbound_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    chat_id = Column(String, nullable=False)
+    # NotificationType or PlanKind value of the job that produced the message
+    kind = Column(String, nullable=False)
+    # Id of the row the message was produced for (preference, notification, training)
+    source_id = Column(Integer, nullable=True)
+    scheduled_for = Column(DateTime(timezone=True), nullable=False)
+    # "<user_id>:<kind>:<scheduled_for>", one message per scheduled occurrence
+    idempotency_key = Column(String, nullable=False, unique=True)
+    text = Column(String, nullable=False)
+    reply_markup = Column(JSON, nullable=True)
+    status = Column(
+        Enum(OutboundMessageStatus),
+        nullable=False,
+        default=OutboundMessageStatus.PENDING,
+    )
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_outbound_messages_pending",
+            "next_attempt_at",
+            # The text column shadows sqlalchemy.text in this class body
+            postgresql_where=status == OutboundMessageStatus.PENDING,
+        ),
+    )
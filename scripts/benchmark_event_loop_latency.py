@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Event-loop latency under concurrent database load, sync vs async sessions.
+
+Runs the same workload twice inside one event loop: ``--handlers`` concurrent
+coroutines, each issuing ``--queries`` slow queries (``SELECT pg_sleep``),
+first through the synchronous get_db() sessions the handlers used to block
+on, then through get_async_db(). Meanwhile a ticker measures how late the
+loop wakes it up, i.e. how long any other chat would wait for its update to
+be picked up.
+
+Usage:
+    python scripts/benchmark_event_loop_latency.py [--handlers 20] [--queries 10] [--query-seconds 0.05]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from loguru import logger
+from sqlalchemy import text
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import async_engine, engine, get_async_db, get_db
+
+SLOW_QUERY = text("SELECT pg_sleep(:seconds)")
+
+
+async def sync_handler(queries, seconds):
+    for _ in range(queries):
+        with next(get_db()) as db_session:
+            db_session.execute(SLOW_QUERY, {"seconds": seconds})
+
+
+async def async_handler(queries, seconds):
+    for _ in range(queries):
+        async with get_async_db() as db_session:
+            await db_session.execute(SLOW_QUERY, {"seconds": seconds})
+
+
+async def measure_loop_lag(interval, lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run(name, handler, args):
+    lags, stop = [], asyncio.Event()
+    ticker = asyncio.create_task(measure_loop_lag(args.tick, lags, stop))
+    # Let the ticker take its first measurement on an idle loop
+    await asyncio.sleep(args.tick * 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(handler(args.queries, args.query_seconds) for _ in range(args.handlers))
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    lags.sort()
+    total = args.handlers * args.queries
+    logger.info(
+        f"{name}: {total} queries in {elapsed:.2f}s ({total / elapsed:.1f}/s), "
+        f"loop lag p50 {percentile(lags, 0.5) * 1000:.1f} ms, "
+        f"p95 {percentile(lags, 0.95) * 1000:.1f} ms, max {lags[-1] * 1000:.1f} ms"
+    )
+
+
+async def main_async(args):
+    # Open the connections up front so neither run pays for the handshakes
+    await run("warm-up sync", sync_handler, argparse.Namespace(**{**vars(args), "queries": 1}))
+    await run("warm-up async", async_handler, argparse.Namespace(**{**vars(args), "queries": 1}))
+
+    await run("sync get_db()", sync_handler, args)
+    await run("async get_async_db()", async_handler, args)
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--handlers", type=int, default=20, help="Concurrent handlers")
+    parser.add_argument("--queries", type=int, default=10, help="Queries per handler")
+    parser.add_argument("--query-seconds", type=float, default=0.05, help="Duration of each query")
+    parser.add_argument("--tick", type=float, default=0.01, help="Loop lag sampling interval in seconds")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Memory footprint and lookup cost of the in-memory user directory.
+
+Builds ``--users`` synthetic users (names drawn from a small pool, as real
+names repeat) three ways and reports the memory each keeps per user, measured
+with tracemalloc, and the cost of a chat_id lookup:
+
+- detached ORM User objects in a dict by chat_id, what loading all users
+  with get_all_users() keeps alive;
+- a dict of plain tuples by chat_id;
+- utils.user_directory.UserDirectory.
+
+No database is needed.
+
+Usage:
+    python scripts/benchmark_user_directory.py [--users 100000] [--lookups 200000]
+"""
+
+import argparse
+import datetime
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from loguru import logger
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import User, UserPaymentStatus, UserRole
+from utils.user_directory import UserDirectory
+
+FIRST_NAMES = ["Олександр", "Марія", "Андрій", "Олена", "Дмитро", "Анна", "Іван", "Юлія", "Максим", "Софія"]
+LAST_NAMES = ["Шевченко", "Коваленко", "Бондаренко", "Ткаченко", "Кравченко", "Олійник", "Мельник", "Лисенко"]
+FIRST_CHAT_ID = 100_000_000
+
+
+def user_rows(count):
+    """Rows shaped like users_changed_since_query results."""
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    return [
+        (
+            str(FIRST_CHAT_ID + index * 7),
+            index + 1,
+            UserRole.ADMIN if index % 1000 == 0 else UserRole.USER,
+            UserPaymentStatus.ACTIVE if index % 10 else UserPaymentStatus.INACTIVE,
+            index % 50 != 0,
+            # Names are built per row, like strings decoded from the database
+            f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}",
+            f"user_{index}",
+            now,
+        )
+        for index in range(count)
+    ]
+
+
+def build_orm_objects(rows):
+    return {
+        chat_id: User(
+            id=user_id,
+            chat_id=chat_id,
+            role=role,
+            payment_status=payment_status,
+            is_active=is_active,
+            full_name=full_name,
+            username=username,
+            updated_at=updated_at,
+        )
+        for chat_id, user_id, role, payment_status, is_active, full_name, username, updated_at in rows
+    }
+
+
+def build_tuples(rows):
+    return {row[0]: row[1:7] for row in rows}
+
+
+def build_directory(rows):
+    directory = UserDirectory()
+    directory.apply(rows)
+    return directory
+
+
+def measure(build, count):
+    """The structure built from ``count`` rows and the bytes it keeps."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # Rows are created and freed inside the measurement so shared strings are counted once
+    structure = build(user_rows(count))
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return structure, retained
+
+
+def time_lookups(lookup, chat_ids):
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        lookup(chat_id)
+    return (time.perf_counter() - started) / len(chat_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000, help="Users to load")
+    parser.add_argument("--lookups", type=int, default=200_000, help="chat_id lookups to time")
+    args = parser.parse_args()
+
+    random.seed(0)
+    chat_ids = [
+        str(FIRST_CHAT_ID + random.randrange(args.users) * 7) for _ in range(args.lookups)
+    ]
+    for name, build, lookup in (
+        ("ORM User objects", build_orm_objects, lambda users: users.get),
+        ("dict of tuples", build_tuples, lambda users: users.get),
+        ("user directory", build_directory, lambda directory: directory.user_id),
+    ):
+        structure, retained = measure(build, args.users)
+        lookup_seconds = time_lookups(lookup(structure), chat_ids)
+        logger.info(
+            f"{name}: {retained / 1024 / 1024:.1f} MiB for {args.users} users, "
+            f"{retained / args.users:.0f} bytes per user, "
+            f"chat_id lookup {lookup_seconds * 1e9:.0f} ns"
+        )
+        del structure
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Regression check for the scheduler query plans.
+
+Builds a throwaway schema next to the real tables, fills it with synthetic
+users, notification preferences and custom notifications, then runs the
+scheduler queries from utils/db_utils.py against it and inspects their
+EXPLAIN output. Exits with status 1 if any of them falls back to a sequential
+scan of notification_preferences or custom_notifications.
+
+Usage:
+    python scripts/check_scheduler_indexes.py [--rows 1000000] [--keep]
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+from loguru import logger
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DATABASE_URL, timezone
+from database import Base
+from models import NotificationType
+from utils.db_utils import (
+    enqueue_morning_notifications,
+    get_custom_notifications_to_send,
+    get_notifications_by_type,
+    get_notifications_to_send_by_time,
+    get_scheduled_notifications,
+)
+
+SCHEMA = "scheduler_index_check"
+CHECKED_TABLES = {"notification_preferences", "custom_notifications"}
+
+SEED_USERS = """
+INSERT INTO users (id, username, chat_id, payment_status, role, is_active, weekly_stats_counter)
+SELECT u, 'user_' || u, (100000000 + u)::text,
+       'ACTIVE'::userpaymentstatus, 'USER'::userrole, true, 0
+FROM generate_series(1, :users) AS u
+"""
+
+# Four preferences per user. Morning rows are mostly due tomorrow, the
+# training reminders have mostly been sent already.
+SEED_PREFERENCES = """
+INSERT INTO notification_preferences
+    (user_id, notification_type, notification_time, next_execution_datetime,
+     is_active, notification_sent)
+SELECT u,
+       (ARRAY['MORNING_NOTIFICATION', 'PRE_TRAINING_REMINDER_NOTIFICATION',
+              'TRAINING_REMINDER_NOTIFICATION', 'STOP_TRAINING_NOTIFICATION'])[t]::notificationtype,
+       make_time(6 + u % 6, (u % 4) * 15, 0),
+       CASE
+           WHEN t = 1 AND u % 500 = 0 THEN localtimestamp - interval '1 minute'
+           WHEN t = 1 THEN date_trunc('day', localtimestamp) + interval '1 day'
+                           + make_interval(hours => 6 + u % 6)
+           ELSE localtimestamp - make_interval(days => u % 30)
+       END,
+       u % 20 <> 0,
+       t <> 1 AND u % 100 <> 0
+FROM generate_series(1, :users) AS u, generate_series(1, 4) AS t
+"""
+
+# Spread over a week, a handful of them due right now
+SEED_CUSTOM_NOTIFICATIONS = """
+INSERT INTO custom_notifications
+    (user_id, notification_name, notification_message, notification_time,
+     next_execution_datetime, is_active, notification_sent, periodicity_type)
+SELECT n % :users + 1, 'notification_' || n, 'Synthetic notification',
+       make_time(n % 24, n % 60, 0),
+       now() + make_interval(mins => n % 10080 - 5),
+       n % 10 <> 0, false, 'daily'
+FROM generate_series(1, :rows) AS n
+"""
+
+
+def find_seq_scans(plan):
+    """Yield relation names scanned sequentially anywhere in a JSON plan node."""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan.get("Relation Name")
+    for child in plan.get("Plans", []):
+        yield from find_seq_scans(child)
+
+
+def seed(connection, rows):
+    users = max(rows // 4, 1)
+    logger.info(f"Seeding {users} users, {users * 4} preferences, {rows} custom notifications")
+    connection.execute(text(SEED_USERS), {"users": users})
+    connection.execute(text(SEED_PREFERENCES), {"users": users})
+    connection.execute(text(SEED_CUSTOM_NOTIFICATIONS), {"users": users, "rows": rows})
+    connection.execute(text("ANALYZE"))
+
+
+def explain_scheduler_queries(session):
+    """Run every scheduler query and collect the plan of each SELECT/UPDATE it issues."""
+    plans = []
+    current_query = {"name": None}
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(("SELECT", "UPDATE")):
+            return
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        plans.append((current_query["name"], statement, cursor.fetchone()[0][0]["Plan"]))
+
+    now = datetime.datetime.now(tz=timezone)
+    plan_end = datetime.datetime.combine(
+        now.date() + datetime.timedelta(days=1), datetime.time(0)
+    )
+    queries = [
+        ("get_notifications_to_send_by_time", lambda: get_notifications_to_send_by_time(now, session)),
+        (
+            "enqueue_morning_notifications",
+            lambda: enqueue_morning_notifications(now, session, text="Synthetic notification"),
+        ),
+        *(
+            (
+                f"get_notifications_by_type({notification_type.name})",
+                lambda notification_type=notification_type: get_notifications_by_type(
+                    notification_type, session
+                ),
+            )
+            for notification_type in (
+                NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION,
+                NotificationType.TRAINING_REMINDER_NOTIFICATION,
+                NotificationType.STOP_TRAINING_NOTIFICATION,
+            )
+        ),
+        ("get_custom_notifications_to_send", lambda: get_custom_notifications_to_send(session)),
+        ("get_scheduled_notifications", lambda: get_scheduled_notifications(session, until=plan_end)),
+    ]
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", explain)
+    try:
+        for name, run in queries:
+            current_query["name"] = name
+            run()
+    finally:
+        event.remove(engine, "before_cursor_execute", explain)
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Synthetic rows per notification table")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {SCHEMA} schema afterwards")
+    args = parser.parse_args()
+
+    admin_engine = create_engine(DATABASE_URL)
+    with admin_engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    # Every connection of this engine resolves the model tables in the check schema
+    check_engine = create_engine(
+        DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA}"}
+    )
+    failures = []
+    try:
+        Base.metadata.create_all(bind=check_engine)
+        with check_engine.begin() as connection:
+            seed(connection, args.rows)
+
+        with sessionmaker(bind=check_engine)() as session:
+            plans = explain_scheduler_queries(session)
+
+        for name, statement, plan in plans:
+            seq_scans = sorted(set(find_seq_scans(plan)) & CHECKED_TABLES)
+            if seq_scans:
+                failures.append(name)
+                logger.error(f"{name}: sequential scan on {', '.join(seq_scans)}\n{statement}")
+            else:
+                logger.info(f"{name}: {plan['Node Type']}, total cost {plan['Total Cost']}")
+    finally:
+        check_engine.dispose()
+        if not args.keep:
+            with admin_engine.begin() as connection:
+                connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        admin_engine.dispose()
+
+    if failures:
+        logger.error(f"{len(failures)} scheduler queries are not using an index")
+        sys.exit(1)
+    logger.info("All scheduler queries use an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for webhook mode without Telegram.
+
+Starts a stub Bot API server that answers every method the bot calls, then
+POSTs synthetic text-message updates to the bot's webhook and matches them
+with the sendMessage calls the handlers make. Reports accepted updates per
+second, replies per second and reply latency percentiles.
+
+Start the script first, it waits until the bot's /health endpoint is up:
+    python scripts/webhook_load_test.py --secret load-test [--updates 1000] [--concurrency 50]
+
+Then run the bot against the stub:
+    BOT_MODE=webhook WEBHOOK_SECRET_TOKEN=load-test PORT=8443 \\
+    TELEGRAM_BASE_URL=http://127.0.0.1:8081/bot python main.py
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import ClientSession, web
+from loguru import logger
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Load test bot",
+    "username": "load_test_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+FIRST_CHAT_ID = 900_000_000
+
+
+class StubBotApi:
+    """Minimal Bot API: getMe, message sending methods and True for the rest."""
+
+    def __init__(self):
+        self.sent_at = {}
+        self.calls = 0
+        self._message_id = 0
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post("/{path:.*}", self.handle)
+        return app
+
+    async def handle(self, request):
+        method = request.match_info["path"].rsplit("/", 1)[-1]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls += 1
+
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": BOT_USER})
+        if method in ("sendMessage", "sendPhoto", "sendDocument"):
+            chat_id = int(params.get("chat_id", 0))
+            self.sent_at.setdefault(chat_id, time.perf_counter())
+            self._message_id += 1
+            return web.json_response(
+                {
+                    "ok": True,
+                    "result": {
+                        "message_id": self._message_id,
+                        "date": int(time.time()),
+                        "chat": {"id": chat_id, "type": "private"},
+                        "from": BOT_USER,
+                        "text": params.get("text", ""),
+                    },
+                }
+            )
+        return web.json_response({"ok": True, "result": True})
+
+
+def synthetic_update(update_id, chat_id, text):
+    user = {"id": chat_id, "is_bot": False, "first_name": "Load", "username": f"load_{chat_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Load"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+async def post_updates(args, posted_at):
+    url = f"{args.webhook_url.rstrip('/')}{args.path}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret, "Content-Type": "application/json"}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    statuses = {}
+
+    async def post(session, index):
+        chat_id = FIRST_CHAT_ID + index
+        body = json.dumps(synthetic_update(index + 1, chat_id, args.text))
+        async with semaphore:
+            posted_at[chat_id] = time.perf_counter()
+            async with session.post(url, data=body, headers=headers) as response:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    async with ClientSession() as session:
+        await asyncio.gather(*(post(session, index) for index in range(args.updates)))
+    return statuses
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def wait_for_bot(args):
+    url = f"{args.webhook_url.rstrip('/')}/health"
+    deadline = time.perf_counter() + args.start_timeout
+    async with ClientSession() as session:
+        while time.perf_counter() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return True
+            except OSError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+
+async def run(args):
+    stub = StubBotApi()
+    runner = web.AppRunner(stub.build_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.stub_port).start()
+    logger.info(f"Stub Bot API listening on http://127.0.0.1:{args.stub_port}/bot")
+
+    posted_at = {}
+    try:
+        logger.info(f"Waiting for the bot at {args.webhook_url}")
+        if not await wait_for_bot(args):
+            logger.error("The bot did not become healthy in time")
+            return
+        started = time.perf_counter()
+        statuses = await post_updates(args, posted_at)
+        accepted_in = time.perf_counter() - started
+        logger.info(f"Posted {args.updates} updates in {accepted_in:.2f}s, responses {statuses}")
+
+        deadline = time.perf_counter() + args.reply_timeout
+        while len(stub.sent_at.keys() & posted_at.keys()) < args.updates and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        replied = stub.sent_at.keys() & posted_at.keys()
+        if not replied:
+            logger.error("No replies received; is the bot using TELEGRAM_BASE_URL of this stub?")
+            return
+        replied_in = max(stub.sent_at[chat_id] for chat_id in replied) - started
+        latencies = sorted(stub.sent_at[chat_id] - posted_at[chat_id] for chat_id in replied)
+    finally:
+        await runner.cleanup()
+
+    logger.info(f"Accepted: {args.updates / accepted_in:.1f} updates/s")
+    logger.info(f"Replied: {len(replied)}/{args.updates} chats, {len(replied) / replied_in:.1f} replies/s")
+    logger.info(
+        f"Reply latency: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+        f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--webhook-url", default="http://127.0.0.1:8443", help="Where the bot listens")
+    parser.add_argument("--path", default="/telegram", help="WEBHOOK_PATH of the bot")
+    parser.add_argument("--secret", required=True, help="WEBHOOK_SECRET_TOKEN of the bot")
+    parser.add_argument("--stub-port", type=int, default=8081, help="Port of the stub Bot API")
+    parser.add_argument("--updates", type=int, default=1000, help="Synthetic updates to send, one chat each")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent webhook requests")
+    parser.add_argument("--text", default="load test", help="Message text of every update")
+    parser.add_argument("--start-timeout", type=float, default=120, help="Seconds to wait for the bot")
+    parser.add_argument("--reply-timeout", type=float, default=60, help="Seconds to wait for replies")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -66,7 +66,7 @@ def prepare_chart_data(df, value_column):
     }
 
 
-def get_statistics_data(user_id, start_date=None, end_date=None, period=None):
+def get_statistics_data(user_id, start_date=None, end_date=None, period=None, db_session=None):
     """
     Extract statistics data for a specific user and date range
     Returns data formatted for web visualization
@@ -76,8 +76,12 @@ def get_statistics_data(user_id, start_date=None, end_date=None, period=None):
     - start_date: Start date (datetime or string in format YYYY-MM-DD)
     - end_date: End date (datetime or string in format YYYY-MM-DD)
     - period: Predefined period ("weekly", "monthly") - only used if start_date and end_date are None
+    - db_session: Session to query with (default: a new one, closed afterwards)
     """
-    session = next(get_db())
+    if db_session is None:
+        with next(get_db()) as db_session:
+            return get_statistics_data(user_id, start_date, end_date, period, db_session)
+    session = db_session
     
     # Get user information
     user = session.query(User).filter(User.id == user_id).first()
@@ -0,0 +1,87 @@
+import datetime
+
+import pytest
+
+from config import timezone
+from models import NotificationType
+from utils import catch_up
+from utils.catch_up import (
+    DEFAULT_CATCH_UP_RULES,
+    MAX_REPLAYED_OCCURRENCES,
+    CatchUpPolicy,
+    CatchUpRule,
+    is_late,
+    load_catch_up_rules,
+    missed_occurrences,
+    should_skip,
+)
+from utils.recurrence import compile_rule
+from utils.send_plan import PlanKind
+
+MORNING = NotificationType.MORNING_NOTIFICATION
+CUSTOM = NotificationType.CUSTOM_NOTIFICATION
+NOW = timezone.localize(datetime.datetime(2026, 1, 10, 12, 0))
+
+
+@pytest.fixture(autouse=True)
+def default_rules(monkeypatch):
+    monkeypatch.setattr(catch_up, "catch_up_rules", dict(DEFAULT_CATCH_UP_RULES))
+
+
+def test_load_catch_up_rules_applies_overrides():
+    rules = load_catch_up_rules(
+        {
+            "morning_notification": {"policy": "coalesce"},
+            "evening_motivation": {"policy": "skip", "max_age_minutes": 15},
+        }
+    )
+    assert rules[MORNING] == CatchUpRule(CatchUpPolicy.COALESCE)
+    assert rules[PlanKind.EVENING_MOTIVATION] == CatchUpRule(
+        CatchUpPolicy.SKIP, datetime.timedelta(minutes=15)
+    )
+    assert rules[CUSTOM] == DEFAULT_CATCH_UP_RULES[CUSTOM]
+
+
+def test_load_catch_up_rules_rejects_unknown_policies():
+    with pytest.raises(ValueError):
+        load_catch_up_rules({"morning_notification": {"policy": "sometimes"}})
+
+
+def test_is_late_after_the_grace_period():
+    assert not is_late(NOW - datetime.timedelta(seconds=60), NOW)
+    assert is_late(NOW - datetime.timedelta(seconds=61), NOW)
+
+
+def test_skip_policy_drops_sends_older_than_max_age():
+    assert not should_skip(MORNING, NOW - datetime.timedelta(hours=3), NOW)
+    assert should_skip(MORNING, NOW - datetime.timedelta(hours=3, minutes=1), NOW)
+
+
+def test_coalesce_policy_never_drops_sends():
+    assert not should_skip(CUSTOM, NOW - datetime.timedelta(days=2), NOW)
+    # Kinds without a rule coalesce as well
+    assert not should_skip(
+        NotificationType.STOP_TRAINING_NOTIFICATION, NOW - datetime.timedelta(days=2), NOW
+    )
+
+
+def test_coalesce_policy_sends_missed_occurrences_once():
+    rule = compile_rule("daily", None, datetime.time(9, 0))
+    first = NOW - datetime.timedelta(days=3, hours=3)
+    assert missed_occurrences(CUSTOM, rule, first, NOW) == [first]
+
+
+def test_replay_policy_sends_every_missed_occurrence(monkeypatch):
+    monkeypatch.setitem(catch_up.catch_up_rules, CUSTOM, CatchUpRule(CatchUpPolicy.REPLAY))
+    rule = compile_rule("daily", None, datetime.time(9, 0))
+    first = timezone.localize(datetime.datetime(2026, 1, 7, 9, 0))
+    assert missed_occurrences(CUSTOM, rule, first, NOW) == [
+        timezone.localize(datetime.datetime(2026, 1, day, 9, 0)) for day in (7, 8, 9, 10)
+    ]
+
+
+def test_replay_is_capped(monkeypatch):
+    monkeypatch.setitem(catch_up.catch_up_rules, CUSTOM, CatchUpRule(CatchUpPolicy.REPLAY))
+    rule = compile_rule("daily", None, datetime.time(9, 0))
+    first = NOW - datetime.timedelta(days=30)
+    assert len(missed_occurrences(CUSTOM, rule, first, NOW)) == MAX_REPLAYED_OCCURRENCES
@@ -0,0 +1,47 @@
+from utils.coordination import InstanceCoordinator
+
+
+def coordinator(slot, members, is_leader=False):
+    coordinator = InstanceCoordinator()
+    coordinator._apply((slot, members, is_leader))
+    return coordinator
+
+
+def test_shard_is_the_position_among_live_members():
+    assert coordinator(7, [2, 7, 9]).shard == (1, 3)
+
+
+def test_non_members_own_nothing():
+    assert coordinator(None, [2, 9]).shard is None
+    assert coordinator(7, [2, 9]).shard is None
+    assert not coordinator(7, [2, 9]).owns(1)
+
+
+def test_every_user_has_exactly_one_owner():
+    members = [0, 3, 5]
+    instances = [coordinator(slot, members) for slot in members]
+    for user_id in range(100):
+        owners = [instance for instance in instances if instance.owns(user_id)]
+        assert len(owners) == 1
+        assert owners[0].shard[0] == user_id % len(members)
+
+
+def test_listeners_run_only_when_shard_or_leadership_changes():
+    instance = InstanceCoordinator()
+    calls = []
+    instance.subscribe(lambda: calls.append(instance.shard))
+    instance._apply((0, [0], False))
+    instance._apply((0, [0, 1], False))
+    instance._apply((0, [0, 1], True))
+    # Another member replacing the second one leaves the shard as it is
+    instance._apply((0, [0, 4], True))
+    assert calls == [(0, 1), (0, 2), (0, 2)]
+
+
+def test_failing_listener_does_not_stop_the_others():
+    instance = InstanceCoordinator()
+    calls = []
+    instance.subscribe(lambda: 1 / 0)
+    instance.subscribe(lambda: calls.append(instance.is_leader))
+    instance._apply((0, [0], True))
+    assert calls == [True]
@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import datetime
+import types
+
+import pytest
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+
+from utils import outbox
+from utils.outbox import OutboxWorker
+
+
+async def send_message(**kwargs):
+    pass
+
+
+def test_retry_delay_doubles_up_to_the_maximum():
+    worker = OutboxWorker(retry_base_delay=30, retry_max_delay=3600)
+    delays = [worker.retry_delay(attempts).total_seconds() for attempts in range(9)]
+    assert delays == [30, 30, 60, 120, 240, 480, 960, 1920, 3600]
+
+
+@pytest.fixture
+def delivery(monkeypatch):
+    """Run one _deliver_batch over the given (attempts, result) pairs."""
+    completed = {}
+    chat_results = {}
+    digest = []
+
+    @contextlib.asynccontextmanager
+    async def fake_session():
+        yield None
+
+    async def complete(finished_at, db_session, sent_ids, retries, failed):
+        completed.update(
+            finished_at=finished_at, sent_ids=sent_ids, retries=retries, failed=failed
+        )
+
+    async def record(db_session, reachable_user_ids, unreachable_user_ids):
+        chat_results.update(reachable=reachable_user_ids, unreachable=unreachable_user_ids)
+
+    monkeypatch.setattr(outbox, "get_async_batch_db", fake_session)
+    monkeypatch.setattr(outbox, "complete_outbound_messages", complete)
+    monkeypatch.setattr(outbox, "record_chat_send_results", record)
+    monkeypatch.setattr(
+        outbox.admin_digest, "record", lambda *args: digest.append(args)
+    )
+
+    def deliver(outcomes, max_attempts=5):
+        messages = [
+            types.SimpleNamespace(
+                id=index,
+                chat_id=100 + index,
+                user_id=index,
+                kind="morning_notification",
+                text="text",
+                reply_markup=None,
+                attempts=attempts,
+            )
+            for index, (attempts, _) in enumerate(outcomes)
+        ]
+
+        async def claim(current_datetime, db_session, limit):
+            return messages
+
+        async def send_all(label, items):
+            return [result for _, result in outcomes]
+
+        monkeypatch.setattr(outbox, "claim_outbound_messages", claim)
+        monkeypatch.setattr(outbox.send_pipeline, "send_all", send_all)
+        worker = OutboxWorker(
+            max_attempts=max_attempts, retry_base_delay=30, retry_max_delay=3600
+        )
+        context = types.SimpleNamespace(bot=types.SimpleNamespace(send_message=send_message))
+        claimed = asyncio.run(worker._deliver_batch(context))
+        return claimed, completed, chat_results, digest
+
+    return deliver
+
+
+def test_sent_messages_are_completed(delivery):
+    claimed, completed, chat_results, digest = delivery([(1, object()), (1, object())])
+    assert claimed == 2
+    assert completed["sent_ids"] == [0, 1]
+    assert completed["retries"] == [] and completed["failed"] == []
+    assert chat_results == {"reachable": {0, 1}, "unreachable": set()}
+    assert digest == []
+
+
+def test_transient_errors_are_retried_with_backoff(delivery):
+    _, completed, _, _ = delivery([(3, TimedOut())])
+    [(message_id, next_attempt_at, error)] = completed["retries"]
+    assert message_id == 0
+    assert next_attempt_at - completed["finished_at"] == datetime.timedelta(seconds=120)
+    assert error.startswith("transient: TimedOut")
+
+
+def test_retry_after_postpones_the_retry(delivery):
+    _, completed, _, _ = delivery([(1, RetryAfter(600))])
+    [(_, next_attempt_at, _)] = completed["retries"]
+    assert next_attempt_at - completed["finished_at"] == datetime.timedelta(seconds=600)
+
+
+def test_exhausted_retries_fail(delivery):
+    _, completed, _, digest = delivery([(5, TimedOut())], max_attempts=5)
+    assert completed["retries"] == []
+    assert [message_id for message_id, _ in completed["failed"]] == [0]
+    assert digest == [("morning_notification", "transient", 100)]
+
+
+def test_permanent_errors_fail_without_retry(delivery):
+    _, completed, chat_results, _ = delivery(
+        [(1, Forbidden("bot was blocked by the user")), (1, BadRequest("Message is too long"))]
+    )
+    assert completed["retries"] == []
+    assert [error.split(":")[0] for _, error in completed["failed"]] == [
+        "unreachable",
+        "invalid",
+    ]
+    assert chat_results == {"reachable": set(), "unreachable": {0}}
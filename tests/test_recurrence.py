@@ -0,0 +1,96 @@
+import datetime
+
+import pytz
+
+from config import timezone
+from utils.recurrence import (
+    ALL_WEEKDAYS_MASK,
+    compile_rule,
+    localize_wall_time,
+    next_occurrence,
+    occurrences_between,
+)
+
+
+def kyiv(*args):
+    return timezone.localize(datetime.datetime(*args))
+
+
+def test_compile_rule_defaults_malformed_rules_to_daily():
+    rule = compile_rule("specific_days", "", datetime.time(9, 0))
+    assert rule.periodicity_type == "daily"
+    assert rule.weekday_mask == ALL_WEEKDAYS_MASK
+
+
+def test_to_rrule():
+    assert (
+        compile_rule("specific_days", "0,2", datetime.time(9, 30)).to_rrule()
+        == "FREQ=WEEKLY;BYDAY=MO,WE;BYHOUR=9;BYMINUTE=30"
+    )
+    assert (
+        compile_rule("monthly", "15", datetime.time(8, 0)).to_rrule()
+        == "FREQ=MONTHLY;BYMONTHDAY=15;BYHOUR=8;BYMINUTE=0"
+    )
+
+
+def test_next_occurrence_is_strictly_after():
+    rule = compile_rule("daily", None, datetime.time(9, 0))
+    assert next_occurrence(rule, kyiv(2026, 1, 10, 8, 0)) == kyiv(2026, 1, 10, 9, 0)
+    assert next_occurrence(rule, kyiv(2026, 1, 10, 9, 0)) == kyiv(2026, 1, 11, 9, 0)
+
+
+def test_next_occurrence_takes_naive_input_as_kyiv_wall_time():
+    rule = compile_rule("daily", None, datetime.time(9, 0))
+    naive = datetime.datetime(2026, 1, 10, 8, 30)
+    assert next_occurrence(rule, naive) == next_occurrence(rule, timezone.localize(naive))
+
+
+def test_next_occurrence_converts_aware_input_to_kyiv():
+    rule = compile_rule("daily", None, datetime.time(9, 0))
+    # 06:30 UTC is 08:30 in Kyiv in winter
+    after = pytz.utc.localize(datetime.datetime(2026, 1, 10, 6, 30))
+    assert next_occurrence(rule, after) == kyiv(2026, 1, 10, 9, 0)
+
+
+def test_weekly_rule():
+    # 2026-01-10 is a Saturday; 2 is Wednesday
+    rule = compile_rule("weekly", "2", datetime.time(18, 0))
+    assert next_occurrence(rule, kyiv(2026, 1, 10, 12, 0)) == kyiv(2026, 1, 14, 18, 0)
+
+
+def test_monthly_rule_clamps_to_the_month_length():
+    rule = compile_rule("monthly", "31", datetime.time(10, 0))
+    assert next_occurrence(rule, kyiv(2026, 2, 1, 0, 0)) == kyiv(2026, 2, 28, 10, 0)
+    assert next_occurrence(rule, kyiv(2026, 2, 28, 11, 0)) == kyiv(2026, 3, 31, 10, 0)
+
+
+def test_time_skipped_by_spring_forward_moves_past_the_gap():
+    # Clocks jump from 03:00 to 04:00 on 2026-03-29
+    occurrence = localize_wall_time(datetime.date(2026, 3, 29), datetime.time(3, 30))
+    assert occurrence.replace(tzinfo=None) == datetime.datetime(2026, 3, 29, 4, 30)
+    assert occurrence.utcoffset() == datetime.timedelta(hours=3)
+
+
+def test_time_repeated_by_fall_back_resolves_to_the_first_one():
+    # Clocks go back from 04:00 to 03:00 on 2026-10-25
+    occurrence = localize_wall_time(datetime.date(2026, 10, 25), datetime.time(3, 30))
+    assert occurrence.replace(tzinfo=None) == datetime.datetime(2026, 10, 25, 3, 30)
+    assert occurrence.utcoffset() == datetime.timedelta(hours=3)
+
+
+def test_daily_rule_keeps_its_wall_time_across_dst():
+    rule = compile_rule("daily", None, datetime.time(9, 0))
+    before = next_occurrence(rule, kyiv(2026, 3, 27, 12, 0))
+    after = next_occurrence(rule, before)
+    assert before.replace(tzinfo=None) == datetime.datetime(2026, 3, 28, 9, 0)
+    assert after.replace(tzinfo=None) == datetime.datetime(2026, 3, 29, 9, 0)
+    # The day clocks spring forward is an hour short
+    assert after - before == datetime.timedelta(hours=23)
+
+
+def test_occurrences_between_is_half_open():
+    rule = compile_rule("daily", None, datetime.time(9, 0))
+    occurrences = occurrences_between(
+        rule, kyiv(2026, 1, 10, 9, 0), datetime.datetime(2026, 1, 12, 9, 0)
+    )
+    assert occurrences == [kyiv(2026, 1, 10, 9, 0), kyiv(2026, 1, 11, 9, 0)]
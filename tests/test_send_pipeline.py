@@ -0,0 +1,71 @@
+import asyncio
+import types
+
+import pytest
+
+from utils import send_pipeline
+from utils.send_pipeline import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(send_pipeline, "time", clock)
+    monkeypatch.setattr(
+        send_pipeline,
+        "asyncio",
+        types.SimpleNamespace(Lock=asyncio.Lock, sleep=clock.sleep),
+    )
+    return clock
+
+
+def test_capacity_defaults_to_rate_and_at_least_one():
+    assert TokenBucket(30).capacity == 30
+    assert TokenBucket(0.5).capacity == 1
+    assert TokenBucket(30, capacity=5).capacity == 5
+
+
+def test_acquire_spends_the_burst_without_waiting(clock):
+    bucket = TokenBucket(rate=3)
+
+    async def acquire_all():
+        for _ in range(3):
+            await bucket.acquire()
+
+    asyncio.run(acquire_all())
+    assert clock.sleeps == []
+    assert not bucket.is_idle()
+
+
+def test_acquire_waits_for_the_next_token(clock):
+    bucket = TokenBucket(rate=2, capacity=1)
+
+    async def acquire_twice():
+        await bucket.acquire()
+        await bucket.acquire()
+
+    asyncio.run(acquire_twice())
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    asyncio.run(bucket.acquire())
+    assert not bucket.is_idle()
+
+    clock.now += 60
+    assert bucket.is_idle()
+    assert bucket._tokens == 2
@@ -0,0 +1,84 @@
+import datetime
+
+import pytest
+
+from utils.send_plan import PlanKind, SendPlan
+
+QUIZ = PlanKind.AFTER_TRAINING_QUIZ
+MOTIVATION = PlanKind.EVENING_MOTIVATION
+START = datetime.datetime(2026, 1, 10)
+
+
+def at(hour, minute=0):
+    return START.replace(hour=hour, minute=minute)
+
+
+@pytest.fixture
+def plan():
+    plan = SendPlan()
+    plan.replace(
+        [
+            (at(20), 1, MOTIVATION, 1),
+            (at(9), 2, QUIZ, 10),
+            (at(12), 3, QUIZ, 11),
+        ],
+        plan_end=at(23),
+    )
+    return plan
+
+
+def test_replace_sorts_and_drops_entries_past_the_end():
+    plan = SendPlan()
+    plan.replace([(at(12), 1, QUIZ, 1), (at(9), 2, QUIZ, 2), (at(23), 3, QUIZ, 3)], at(23))
+    assert len(plan) == 2
+    assert plan.get(QUIZ, 3) is None
+    assert plan.next_fire_time() == at(9)
+
+
+def test_advance_returns_due_entries_once(plan):
+    assert plan.advance(at(8)) == []
+    assert plan.advance(at(12)) == [(at(9), 2, QUIZ, 10), (at(12), 3, QUIZ, 11)]
+    assert plan.advance(at(12)) == []
+    assert plan.next_fire_time() == at(20)
+    assert len(plan) == 1
+
+
+def test_patch_moves_an_entry(plan):
+    plan.patch(QUIZ, 10, at(15), chat_id=2)
+    assert plan.advance(at(12)) == [(at(12), 3, QUIZ, 11)]
+    assert plan.advance(at(15)) == [(at(15), 2, QUIZ, 10)]
+
+
+def test_patch_without_fire_time_drops_the_entry(plan):
+    plan.patch(QUIZ, 10)
+    assert plan.get(QUIZ, 10) is None
+    assert plan.next_fire_time() == at(12)
+
+
+def test_patch_past_the_end_drops_the_entry(plan):
+    plan.patch(MOTIVATION, 1, at(23, 30), chat_id=1)
+    assert plan.get(MOTIVATION, 1) is None
+    assert plan.advance(at(23)) == [(at(9), 2, QUIZ, 10), (at(12), 3, QUIZ, 11)]
+
+
+def test_overdue_patch_is_queued_at_the_cursor(plan):
+    plan.advance(at(13))
+    plan.patch(QUIZ, 12, at(10), chat_id=4)
+    assert plan.next_fire_time() == at(10)
+    assert plan.advance(at(13)) == [(at(10), 4, QUIZ, 12)]
+
+
+def test_patch_before_the_first_build_is_ignored():
+    plan = SendPlan()
+    plan.patch(QUIZ, 1, at(9), chat_id=1)
+    assert len(plan) == 0
+
+
+def test_consumed_entries_are_compacted():
+    plan = SendPlan()
+    entries = [(START + datetime.timedelta(seconds=i), i, QUIZ, i) for i in range(3000)]
+    plan.replace(entries, plan_end=START + datetime.timedelta(days=1))
+    assert len(plan.advance(START + datetime.timedelta(seconds=2000))) == 2001
+    assert plan._cursor == 0
+    assert len(plan._entries) == 999
+    assert plan.next_fire_time() == START + datetime.timedelta(seconds=2001)
@@ -0,0 +1,36 @@
+import pytest
+from telegram.error import (
+    BadRequest,
+    ChatMigrated,
+    Forbidden,
+    NetworkError,
+    RetryAfter,
+    TimedOut,
+)
+
+from utils.telegram_errors import SendErrorClass, classify_send_error
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (RetryAfter(5), SendErrorClass.RATE_LIMITED),
+        (Forbidden("Forbidden: bot was blocked by the user"), SendErrorClass.UNREACHABLE),
+        (BadRequest("Chat not found"), SendErrorClass.UNREACHABLE),
+        (BadRequest("PEER_ID_INVALID"), SendErrorClass.UNREACHABLE),
+        (BadRequest("Message is too long"), SendErrorClass.INVALID),
+        (ChatMigrated(-100123), SendErrorClass.INVALID),
+        (TimedOut(), SendErrorClass.TRANSIENT),
+        (NetworkError("Connection reset"), SendErrorClass.TRANSIENT),
+        (ValueError("unexpected"), SendErrorClass.TRANSIENT),
+    ],
+)
+def test_classify_send_error(error, expected):
+    assert classify_send_error(error) == expected
+
+
+def test_only_rate_limits_and_transient_errors_are_retryable():
+    assert {error_class for error_class in SendErrorClass if error_class.is_retryable} == {
+        SendErrorClass.RATE_LIMITED,
+        SendErrorClass.TRANSIENT,
+    }
@@ -196,6 +196,8 @@ UNABLE_TO_RECEIVE_USER_DATA = "Unable to retrieve user data. Please, contact dev
 
 MORNING_NOTIFICATION_TEXT = " 🌞 Морген!\nЧас швиденько пройти ранкове опитування!\nНатискай кнопку, і погнілі "
 BOT_UNABLE_TO_SEND_MESSAGE = "Бот спробував надіслати користувачу {user_id} повідомлення, але користувач обмежив надсилання повідомлень!"
+ADMIN_FAILURE_DIGEST_HEADER = "⚠️ Не вдалося доставити {total} повідомлень за останні {minutes} хв:"
+ADMIN_FAILURE_DIGEST_LINE = "• {kind} / {error_class}: {count} (користувачі: {chat_ids})"
 AFTER_TRAINING_NOTIFICATION_TEXT = (
     "👋 Дароу!\nТреба пройти опитування по минулому тренуванню. \nНатискай на кнопку "
 )
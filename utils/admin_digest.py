@@ -0,0 +1,91 @@
+"""
+Periodic failure digests for admins.
+
+Delivery failures are buffered and flushed as a single message per admin
+every ADMIN_DIGEST_INTERVAL seconds, grouped by notification kind and error
+class, instead of one alert per failing user and admin. At most
+ADMIN_DIGEST_MAX_PER_HOUR digests are sent per hour; failures beyond the cap
+stay buffered and are reported in the next allowed digest.
+"""
+import time
+from collections import Counter, defaultdict, deque
+
+from config import ADMIN_CHAT_IDS, ADMIN_DIGEST_INTERVAL, ADMIN_DIGEST_MAX_PER_HOUR
+import text_constants
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Chat ids listed per group; the rest are only counted
+MAX_CHAT_IDS_PER_LINE = 10
+
+
+class AdminFailureDigest:
+    def __init__(
+        self,
+        interval=ADMIN_DIGEST_INTERVAL,
+        max_per_hour=ADMIN_DIGEST_MAX_PER_HOUR,
+    ):
+        self.interval = interval
+        self.max_per_hour = max_per_hour
+        self._counts = Counter()
+        self._chat_ids = defaultdict(set)
+        self._buffered_since = None
+        self._sent_at = deque()
+
+    def record(self, kind, error_class, chat_id):
+        """Buffer one failed delivery of a ``kind`` message."""
+        key = (kind, error_class)
+        self._counts[key] += 1
+        if len(self._chat_ids[key]) < MAX_CHAT_IDS_PER_LINE:
+            self._chat_ids[key].add(str(chat_id))
+        if self._buffered_since is None:
+            self._buffered_since = time.monotonic()
+
+    def start(self, job_queue):
+        job_queue.run_repeating(
+            self.flush, interval=self.interval, first=self.interval, name="admin_failure_digest"
+        )
+
+    def _format(self):
+        total = sum(self._counts.values())
+        minutes = max(round((time.monotonic() - self._buffered_since) / 60), 1)
+        lines = [text_constants.ADMIN_FAILURE_DIGEST_HEADER.format(total=total, minutes=minutes)]
+        for (kind, error_class), count in self._counts.most_common():
+            chat_ids = ", ".join(sorted(self._chat_ids[(kind, error_class)]))
+            if count > len(self._chat_ids[(kind, error_class)]):
+                chat_ids += ", …"
+            lines.append(
+                text_constants.ADMIN_FAILURE_DIGEST_LINE.format(
+                    kind=kind, error_class=error_class, count=count, chat_ids=chat_ids
+                )
+            )
+        return "\n".join(lines)
+
+    async def flush(self, context):
+        if not self._counts:
+            return
+        now = time.monotonic()
+        while self._sent_at and now - self._sent_at[0] >= 3600:
+            self._sent_at.popleft()
+        if len(self._sent_at) >= self.max_per_hour:
+            logger.warning(
+                f"Admin digest cap of {self.max_per_hour}/h reached, "
+                f"keeping {sum(self._counts.values())} failures for the next digest"
+            )
+            return
+
+        text = self._format()
+        self._counts.clear()
+        self._chat_ids.clear()
+        self._buffered_since = None
+        self._sent_at.append(now)
+        for chat_id in ADMIN_CHAT_IDS:
+            try:
+                await context.bot.send_message(chat_id=chat_id, text=text)
+            except Exception as e:
+                logger.error(f"Failed to send failure digest to admin {chat_id}: {e}")
+        logger.info(f"Sent failure digest to {len(ADMIN_CHAT_IDS)} admins")
+
+
+admin_digest = AdminFailureDigest()
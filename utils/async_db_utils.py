@@ -0,0 +1,442 @@
+"""
+AsyncSession variants of the hot utils/db_utils.py functions.
+
+Each function has the name and behaviour of its synchronous counterpart and
+shares its statements, but awaits the database instead of blocking the event
+loop. Use them with ``async with get_async_db() as db_session``.
+"""
+import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import UNREACHABLE_CHAT_FAILURE_THRESHOLD, timezone as tz
+from exceptions import UserNotFoundError
+from models import CustomNotification, NotificationPreference, NotificationType, User
+from utils.db_utils import (
+    active_user_chats_query,
+    advance_morning_notifications_statement,
+    advance_stats_counter,
+    apply_training_notification,
+    build_morning_quiz,
+    claim_outbound_messages_statement,
+    complete_outbound_messages_statements,
+    custom_notifications_sent_parameters,
+    custom_notifications_to_send_query,
+    deactivate_users_statements,
+    due_morning_notifications_query,
+    enqueue_outbound_messages_statement,
+    group_notification_ids,
+    increment_send_failures_statement,
+    latest_stop_training_reminders,
+    morning_notification_exists_query,
+    morning_outbound_messages,
+    morning_quiz_taken_query,
+    notifications_by_type_query,
+    notifications_sent_statement,
+    pending_stop_training_reminders_query,
+    reactivate_user_statement,
+    renew_outbound_message_leases_statement,
+    reset_send_failures_statement,
+    running_training_query,
+    scheduled_notification_rows,
+    scheduled_notifications_queries,
+    skip_morning_notifications_statement,
+    training_notification_times,
+    trainings_by_ids_query,
+    trainings_started_on_query,
+    user_notification_sent_statement,
+    user_notifications_queries,
+    users_to_deactivate,
+)
+from utils.logger import get_logger
+from utils.notification_bus import notification_bus
+from utils.user_cache import UserProfile, user_profile_cache
+from utils.user_directory import user_directory
+
+logger = get_logger(__name__)
+
+
+async def notify_notifications_changed(notification_type, notification_ids, db_session):
+    await notification_bus.publish_async(notification_type, notification_ids, db_session)
+
+
+async def get_user_by_chat_id(chat_id, db_session: AsyncSession):
+    user = await db_session.scalar(select(User).where(User.chat_id == str(chat_id)))
+    if not user:
+        logger.error(f"User not found with chat_id={chat_id}")
+        raise UserNotFoundError(chat_id)
+    return user
+
+
+async def get_user_id_by_chat_id(chat_id, db_session: AsyncSession):
+    user_id = user_directory.user_id(chat_id)
+    if user_id is None:
+        user_id = await db_session.scalar(select(User.id).where(User.chat_id == str(chat_id)))
+        if user_id is None:
+            logger.error(f"User not found with chat_id={chat_id}")
+            raise UserNotFoundError(chat_id)
+    return user_id
+
+
+async def get_user_profile(chat_id, db_session: AsyncSession):
+    profile = user_profile_cache.get(chat_id)
+    if profile is None:
+        user = await get_user_by_chat_id(chat_id, db_session)
+        is_ready = bool(user.full_name) and await db_session.scalar(
+            morning_notification_exists_query(user.id)
+        )
+        profile = UserProfile.from_user(user, is_ready)
+        user_profile_cache.put(profile)
+    return profile
+
+
+async def is_active_user(chat_id: int, db_session: AsyncSession):
+    return (await get_user_profile(chat_id, db_session)).is_active
+
+
+async def is_admin_user(chat_id: int, db_session: AsyncSession):
+    return (await get_user_profile(chat_id, db_session)).is_admin
+
+
+async def get_user_notifications(chat_id, db_session: AsyncSession, is_active=True):
+    user_id = await get_user_id_by_chat_id(chat_id, db_session)
+    return (
+        await db_session.scalars(
+            select(NotificationPreference).where(
+                (NotificationPreference.user_id == user_id)
+                & (NotificationPreference.is_active == is_active)
+                & (NotificationPreference.notification_type == NotificationType.MORNING_NOTIFICATION)
+            )
+        )
+    ).all()
+
+
+async def reactivate_user(chat_id, db_session: AsyncSession):
+    profile = user_profile_cache.get(chat_id)
+    if profile is not None and not profile.is_deactivated:
+        return False
+    reactivated_ids = (
+        await db_session.execute(reactivate_user_statement(chat_id))
+    ).scalars().all()
+    if reactivated_ids:
+        await notify_user_notifications_changed(reactivated_ids, db_session)
+    await db_session.commit()
+    if not reactivated_ids:
+        return False
+
+    user_profile_cache.invalidate(chat_ids=[chat_id])
+    logger.info(f"Reactivated user {chat_id}")
+    return True
+
+
+async def notify_user_notifications_changed(user_ids, db_session: AsyncSession):
+    preferences_query, custom_notifications_query = user_notifications_queries(user_ids)
+    preferences = (await db_session.execute(preferences_query)).all()
+    custom_notification_ids = (
+        await db_session.execute(custom_notifications_query)
+    ).scalars().all()
+    for notification_type, notification_ids in group_notification_ids(
+        preferences, custom_notification_ids
+    ).items():
+        await notify_notifications_changed(notification_type, notification_ids, db_session)
+
+
+async def is_user_had_morning_quiz_today(chat_id, db_session: AsyncSession):
+    user_id = await get_user_id_by_chat_id(chat_id, db_session)
+    return await db_session.scalar(morning_quiz_taken_query(user_id, datetime.datetime.now(tz=tz).date()))
+
+
+async def save_morning_quiz_results(
+    user_id,
+    quiz_datetime,
+    user_feelings,
+    user_sleeping_hours,
+    user_weight,
+    db_session: AsyncSession,
+    is_going_to_have_training,
+    expected_training_datetime=None,
+):
+    user = await get_user_by_chat_id(user_id, db_session)
+    db_session.add(
+        build_morning_quiz(
+            user,
+            quiz_datetime,
+            user_feelings,
+            user_sleeping_hours,
+            user_weight,
+            is_going_to_have_training,
+            expected_training_datetime,
+        )
+    )
+    await db_session.commit()
+    logger.info(f"Saved morning quiz results for user {user_id}")
+
+
+async def create_training_notifications(chat_id, notification_time, db_session: AsyncSession):
+    user_id = await get_user_id_by_chat_id(chat_id, db_session)
+    for notification_type, next_execution_datetime in training_notification_times(
+        notification_time
+    ):
+        notification_preference = await db_session.scalar(
+            select(NotificationPreference).where(
+                (NotificationPreference.user_id == user_id)
+                & (NotificationPreference.notification_type == notification_type)
+            )
+        )
+        notification_preference = apply_training_notification(
+            notification_preference,
+            user_id,
+            notification_type,
+            notification_time,
+            next_execution_datetime,
+        )
+        db_session.add(notification_preference)
+
+        await db_session.flush()
+        await notify_notifications_changed(
+            notification_type, [notification_preference.id], db_session
+        )
+        await db_session.commit()
+        logger.info(f"Created training notification for user {chat_id}, type {notification_type}")
+
+
+async def _update_user_notification_sent(chat_id, notification_type, db_session):
+    notification_ids = (
+        await db_session.execute(user_notification_sent_statement(chat_id, notification_type))
+    ).scalars().all()
+    await notify_notifications_changed(notification_type, notification_ids, db_session)
+    await db_session.commit()
+    if notification_ids:
+        logger.info(f"Updated {notification_type.value} sent for user {chat_id}")
+
+
+async def update_training_stop_notification(chat_id, db_session: AsyncSession):
+    await _update_user_notification_sent(
+        chat_id, NotificationType.STOP_TRAINING_NOTIFICATION, db_session
+    )
+
+
+async def update_training_start_notification(chat_id, db_session: AsyncSession):
+    await _update_user_notification_sent(
+        chat_id, NotificationType.TRAINING_REMINDER_NOTIFICATION, db_session
+    )
+
+
+async def update_pre_training_notification(chat_id, db_session: AsyncSession):
+    await _update_user_notification_sent(
+        chat_id, NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION, db_session
+    )
+
+
+async def enqueue_morning_notifications(
+    current_datetime,
+    db_session: AsyncSession,
+    text,
+    reply_markup=None,
+    notification_ids=None,
+):
+    notifications = (
+        await db_session.execute(
+            due_morning_notifications_query(current_datetime, notification_ids)
+        )
+    ).all()
+    if not notifications:
+        await db_session.rollback()
+        return 0
+
+    await enqueue_outbound_messages(
+        morning_outbound_messages(notifications, text, reply_markup), db_session
+    )
+    notification_ids = [notification.id for notification in notifications]
+    await db_session.execute(
+        advance_morning_notifications_statement(current_datetime, notification_ids)
+    )
+    await notify_notifications_changed(
+        NotificationType.MORNING_NOTIFICATION, notification_ids, db_session
+    )
+    await db_session.commit()
+    logger.info(f"Queued {len(notification_ids)} morning notifications")
+    return len(notification_ids)
+
+
+async def skip_morning_notifications(current_datetime, db_session: AsyncSession, notification_ids):
+    skipped_ids = (
+        await db_session.execute(
+            skip_morning_notifications_statement(current_datetime, notification_ids)
+        )
+    ).scalars().all()
+    await notify_notifications_changed(
+        NotificationType.MORNING_NOTIFICATION, skipped_ids, db_session
+    )
+    await db_session.commit()
+    logger.info(f"Skipped {len(skipped_ids)} missed morning notifications")
+    return skipped_ids
+
+
+async def enqueue_outbound_messages(messages, db_session: AsyncSession):
+    """Does not commit, see utils.db_utils.enqueue_outbound_messages."""
+    if not messages:
+        return
+    await db_session.execute(enqueue_outbound_messages_statement(messages))
+
+
+async def claim_outbound_messages(current_datetime, db_session: AsyncSession, limit):
+    claimed = (
+        await db_session.execute(claim_outbound_messages_statement(current_datetime, limit))
+    ).all()
+    await db_session.commit()
+
+    logger.debug(f"Claimed {len(claimed)} outbound messages")
+    return claimed
+
+
+async def renew_outbound_message_leases(current_datetime, db_session: AsyncSession, messages):
+    """See utils.db_utils.renew_outbound_message_leases."""
+    renewed = (
+        await db_session.execute(
+            renew_outbound_message_leases_statement(current_datetime, messages)
+        )
+    ).rowcount
+    await db_session.commit()
+    return renewed
+
+
+async def complete_outbound_messages(
+    current_datetime,
+    db_session: AsyncSession,
+    sent_ids=(),
+    retries=(),
+    failed=(),
+):
+    for statement, parameters in complete_outbound_messages_statements(
+        current_datetime, sent_ids, retries, failed
+    ):
+        await db_session.execute(statement, parameters)
+    await db_session.commit()
+    logger.info(
+        f"Completed outbound messages: {len(sent_ids)} sent, "
+        f"{len(retries)} to retry, {len(failed)} failed"
+    )
+
+
+async def record_chat_send_results(
+    db_session: AsyncSession,
+    reachable_user_ids=(),
+    unreachable_user_ids=(),
+    failure_threshold=UNREACHABLE_CHAT_FAILURE_THRESHOLD,
+):
+    unreachable_user_ids = set(unreachable_user_ids) - set(reachable_user_ids)
+    if reachable_user_ids:
+        await db_session.execute(reset_send_failures_statement(reachable_user_ids))
+    deactivated_ids = []
+    if unreachable_user_ids:
+        failures = (
+            await db_session.execute(increment_send_failures_statement(unreachable_user_ids))
+        ).all()
+        deactivated_ids = users_to_deactivate(failures, failure_threshold)
+    if deactivated_ids:
+        for statement in deactivate_users_statements(deactivated_ids):
+            await db_session.execute(statement)
+        await notify_user_notifications_changed(deactivated_ids, db_session)
+    await db_session.commit()
+
+    if deactivated_ids:
+        user_profile_cache.invalidate(user_ids=deactivated_ids)
+        logger.warning(f"Deactivated {len(deactivated_ids)} unreachable users: {deactivated_ids}")
+    return deactivated_ids
+
+
+async def get_notifications_by_type(notification_type, db_session: AsyncSession, notification_ids=None):
+    return (
+        await db_session.scalars(notifications_by_type_query(notification_type, notification_ids))
+    ).all()
+
+
+async def bulk_update_notifications_sent(notification_type, notification_ids, db_session: AsyncSession):
+    if not notification_ids:
+        return
+    await db_session.execute(notifications_sent_statement(notification_ids))
+    await notify_notifications_changed(notification_type, notification_ids, db_session)
+    await db_session.commit()
+    logger.info(f"Updated {len(notification_ids)} sent {notification_type} notifications")
+
+
+async def get_scheduled_notifications(
+    db_session: AsyncSession,
+    notification_type=None,
+    notification_ids=None,
+    until=None,
+    shard=None,
+):
+    preferences_query, custom_notifications_query = scheduled_notifications_queries(
+        notification_type, notification_ids, until, shard
+    )
+    preferences = (
+        (await db_session.execute(preferences_query)).all()
+        if preferences_query is not None
+        else []
+    )
+    custom_notifications = (
+        (await db_session.execute(custom_notifications_query)).all()
+        if custom_notifications_query is not None
+        else []
+    )
+    return scheduled_notification_rows(preferences, custom_notifications)
+
+
+async def get_trainings_started_on(training_date, db_session: AsyncSession):
+    return (await db_session.execute(trainings_started_on_query(training_date))).all()
+
+
+async def get_trainings_by_ids(training_ids, db_session: AsyncSession):
+    return (await db_session.scalars(trainings_by_ids_query(training_ids))).all()
+
+
+async def get_active_user_chats(db_session: AsyncSession):
+    return (await db_session.execute(active_user_chats_query())).all()
+
+
+async def get_custom_notifications_to_send(db_session: AsyncSession, notification_ids=None):
+    return (
+        await db_session.scalars(
+            custom_notifications_to_send_query(datetime.datetime.now(tz=tz), notification_ids)
+        )
+    ).all()
+
+
+async def bulk_update_custom_notifications_sent(notifications, db_session: AsyncSession):
+    if not notifications:
+        return
+    await db_session.execute(
+        update(CustomNotification),
+        custom_notifications_sent_parameters(notifications, datetime.datetime.now(tz=tz)),
+    )
+    await notify_notifications_changed(
+        NotificationType.CUSTOM_NOTIFICATION,
+        [notification.id for notification in notifications],
+        db_session,
+    )
+    await db_session.commit()
+    logger.info(f"Updated {len(notifications)} sent custom notifications")
+
+
+async def update_user_stats_counter(user_id: int, db_session: AsyncSession):
+    user = await db_session.get(User, user_id)
+    if not user:
+        logger.error(f"User not found with id={user_id}")
+        return False, 0
+    is_monthly, counter = advance_stats_counter(user)
+    await db_session.commit()
+    logger.info(f"Updated stats counter for user {user_id} to {counter}, is_monthly={is_monthly}")
+    return is_monthly, counter
+
+
+async def get_running_training(training_id: int, db_session: AsyncSession):
+    return await db_session.scalar(running_training_query(training_id))
+
+
+async def get_pending_stop_training_reminders(db_session: AsyncSession):
+    return latest_stop_training_reminders(
+        (await db_session.execute(pending_stop_training_reminders_query())).all()
+    )
@@ -1,17 +1,18 @@
 import datetime
-import os
 import re
 from datetime import time as datetime_time
-from random import shuffle
 
 from telegram import Update
 from telegram.ext import CallbackContext
 
-from database import get_db
-from utils.db_utils import is_active_user, is_admin_user, get_all_users
-from config import BASE_DIR
+from database import get_db, update_db_session
+from utils import async_db_utils
+from utils.db_utils import get_all_users
+from utils.user_directory import user_directory
+from config import MOTIVATION_NO_REPEAT
 import text_constants
 from utils.logger import get_logger
+from utils.motivation import motivation_messages
 
 logger = get_logger(__name__)
 
@@ -20,9 +21,12 @@ def payment_restricted(func):
     async def wrapper(update: Update, context: CallbackContext):
         chat_id = update.effective_chat.id
         logger.debug(f"Checking payment restriction for user {chat_id}")
-        db_session = next(get_db())
+        db_session = update_db_session()
+        is_active = await async_db_utils.is_active_user(chat_id, db_session)
+        # Don't hold the connection while the handler talks to Telegram
+        await db_session.commit()
 
-        if not is_active_user(chat_id, db_session):
+        if not is_active:
             logger.warning(f"User {chat_id} attempted to access payment-restricted function but is not active")
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -35,12 +39,21 @@ def payment_restricted(func):
     return wrapper
 
 
+async def reactivate_unreachable_chat(update: Update, context: CallbackContext):
+    """Re-enable a chat deactivated for failed deliveries as soon as it sends an update."""
+    if not update.effective_chat:
+        return
+    await async_db_utils.reactivate_user(update.effective_chat.id, update_db_session())
+
+
 def admin_restricted(func):
     async def wrapper(update: Update, context: CallbackContext):
         chat_id = update.effective_chat.id
         logger.debug(f"Checking admin restriction for user {chat_id}")
-        db_session = next(get_db())
-        if not is_admin_user(chat_id, db_session):
+        db_session = update_db_session()
+        is_admin = await async_db_utils.is_admin_user(chat_id, db_session)
+        await db_session.commit()
+        if not is_admin:
             logger.warning(f"User {chat_id} attempted to access admin-restricted function but is not admin")
             await context.bot.send_message(
                 chat_id=chat_id, text=text_constants.BOT_ACCESS_RESTRICTED_ADMIN
@@ -52,20 +65,16 @@ def admin_restricted(func):
     return wrapper
 
 
-def get_random_motivation_message():
-    logger.debug("Getting random motivation message")
-    motivation_file = os.path.join(BASE_DIR, "motivational_messages.txt")
-    try:
-        with open(
-            motivation_file, "r", encoding="UTF-8"
-        ) as input_file:
-            lines = input_file.read().split("\n")
-            shuffle(lines)
-            logger.debug(f"Selected motivation message: {lines[0]}")
-            return f"{text_constants.MOTIVATION_PREFIX} \n{lines[0]}"
-    except Exception as e:
-        logger.error(f"Error reading motivation messages file: {e}")
+def get_random_motivation_message(user_id=None):
+    """A motivation message; with MOTIVATION_NO_REPEAT, the user's message of the day."""
+    if user_id is not None and MOTIVATION_NO_REPEAT:
+        message = motivation_messages.sequence_message(user_id)
+    else:
+        message = motivation_messages.random_message()
+    if message is None:
         return text_constants.MOTIVATION_PREFIX
+    logger.debug(f"Selected motivation message: {message}")
+    return f"{text_constants.MOTIVATION_PREFIX} \n{message}"
 
 
 def is_valid_morning_time(time_str: str) -> bool:
@@ -108,15 +117,18 @@ def is_valid_time(time_str: str) -> bool:
 
 def get_user_list_as_buttons(action):
     logger.debug(f"Getting user list as buttons for action: {action}")
-    with next(get_db()) as db_session:
-        buttons = []
-        users = get_all_users(db_session)
-        logger.debug(f"Found {len(users)} users")
-        for user in users:
-            user_id = user.chat_id
-            user_full_name = user.full_name
-            user_username = user.username
-            buttons.append(
-                [f"{user_full_name} ({user_username}) - {user_id} action:{action}"]
-            )
+    if user_directory.loaded:
+        users = [user for user in user_directory.users() if user.is_paid]
+    else:
+        with next(get_db()) as db_session:
+            users = get_all_users(db_session)
+    logger.debug(f"Found {len(users)} users")
+    buttons = []
+    for user in users:
+        user_id = user.chat_id
+        user_full_name = user.full_name
+        user_username = user.username
+        buttons.append(
+            [f"{user_full_name} ({user_username}) - {user_id} action:{action}"]
+        )
     return buttons
@@ -0,0 +1,112 @@
+"""
+Catch-up policies for sends that were missed, e.g. while the bot was down.
+
+A planned send is late once it is more than CATCH_UP_GRACE behind schedule.
+What happens to it depends on the policy of its kind:
+
+- skip: sent once if at most ``max_age`` late, otherwise dropped
+- coalesce: sent once however late, for all missed occurrences together
+- replay: every missed occurrence is sent (only recurring custom
+  notifications have more than one occurrence to replay; other kinds
+  behave like coalesce)
+
+Defaults can be overridden per kind with the CATCH_UP_POLICIES setting.
+"""
+import datetime
+from enum import Enum
+from typing import NamedTuple, Optional
+
+from config import CATCH_UP_POLICIES
+from models import NotificationType
+from utils.logger import get_logger
+from utils.recurrence import next_occurrence
+from utils.send_plan import PlanKind
+
+logger = get_logger(__name__)
+
+# Sends less late than this are dispatched as on time
+CATCH_UP_GRACE = datetime.timedelta(minutes=1)
+# Upper bound of occurrences replayed for a single notification
+MAX_REPLAYED_OCCURRENCES = 10
+
+
+class CatchUpPolicy(Enum):
+    SKIP = "skip"
+    COALESCE = "coalesce"
+    REPLAY = "replay"
+
+
+class CatchUpRule(NamedTuple):
+    policy: CatchUpPolicy
+    max_age: Optional[datetime.timedelta] = None
+
+
+DEFAULT_CATCH_UP_RULES = {
+    NotificationType.MORNING_NOTIFICATION: CatchUpRule(
+        CatchUpPolicy.SKIP, datetime.timedelta(hours=3)
+    ),
+    NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION: CatchUpRule(
+        CatchUpPolicy.SKIP, datetime.timedelta(minutes=30)
+    ),
+    NotificationType.TRAINING_REMINDER_NOTIFICATION: CatchUpRule(
+        CatchUpPolicy.SKIP, datetime.timedelta(minutes=30)
+    ),
+    NotificationType.CUSTOM_NOTIFICATION: CatchUpRule(CatchUpPolicy.COALESCE),
+    PlanKind.AFTER_TRAINING_QUIZ: CatchUpRule(CatchUpPolicy.COALESCE),
+    PlanKind.EVENING_MOTIVATION: CatchUpRule(
+        CatchUpPolicy.SKIP, datetime.timedelta(hours=2)
+    ),
+}
+
+
+def load_catch_up_rules(overrides=CATCH_UP_POLICIES):
+    rules = dict(DEFAULT_CATCH_UP_RULES)
+    for kind in rules:
+        override = overrides.get(kind.value)
+        if not override:
+            continue
+        max_age_minutes = override.get("max_age_minutes")
+        rules[kind] = CatchUpRule(
+            CatchUpPolicy(override["policy"]),
+            datetime.timedelta(minutes=max_age_minutes) if max_age_minutes else None,
+        )
+        logger.info(f"Catch-up policy for {kind.value}: {rules[kind]}")
+    return rules
+
+
+catch_up_rules = load_catch_up_rules()
+
+
+def is_late(fire_time, now):
+    return now - fire_time > CATCH_UP_GRACE
+
+
+def should_skip(kind, fire_time, now):
+    """Whether a late send of ``kind`` planned for ``fire_time`` is dropped."""
+    rule = catch_up_rules.get(kind, CatchUpRule(CatchUpPolicy.COALESCE))
+    return (
+        rule.policy == CatchUpPolicy.SKIP
+        and rule.max_age is not None
+        and now - fire_time > rule.max_age
+    )
+
+
+def missed_occurrences(kind, rule, first_occurrence, now):
+    """
+    Occurrences of a recurrence rule to send, starting at the missed ``first_occurrence``.
+
+    Only the replay policy sends more than the first one; the number of
+    replayed occurrences is capped at MAX_REPLAYED_OCCURRENCES.
+    """
+    occurrences = [first_occurrence]
+    if catch_up_rules.get(kind, CatchUpRule(CatchUpPolicy.COALESCE)).policy != CatchUpPolicy.REPLAY:
+        return occurrences
+    occurrence = next_occurrence(rule, first_occurrence)
+    while (
+        occurrence is not None
+        and occurrence <= now
+        and len(occurrences) < MAX_REPLAYED_OCCURRENCES
+    ):
+        occurrences.append(occurrence)
+        occurrence = next_occurrence(rule, occurrence)
+    return occurrences
@@ -0,0 +1,147 @@
+"""
+Coordination between bot instances sharing one PostgreSQL database.
+
+Every instance holds a session-level advisory lock on a member slot for as
+long as it runs; the set of locked slots is the live membership. Users are
+sharded across members by ``user_id % len(members)``, and singleton jobs run
+only on the instance holding the leader lock. The locks live on a dedicated
+connection, so an instance that dies drops out as soon as its connection is
+closed and the others rebalance on their next refresh.
+"""
+import psycopg2
+import psycopg2.extensions
+
+from config import COORDINATION_INTERVAL
+from database import engine
+from utils.logger import get_logger
+from utils.offload import run_blocking
+
+logger = get_logger(__name__)
+
+# First key of the two-key advisory locks, keeping them apart from other users
+MEMBER_LOCK_CLASS = 72_001
+LEADER_LOCK_CLASS = 72_002
+MAX_INSTANCES = 64
+
+LIVE_MEMBERS_QUERY = """
+SELECT objid FROM pg_locks
+WHERE locktype = 'advisory'
+  AND granted
+  AND classid = %s
+  AND objsubid = 2
+  AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+ORDER BY objid
+"""
+
+
+class InstanceCoordinator:
+    def __init__(self):
+        self._connection = None
+        self._listeners = []
+        self.slot = None
+        self.members = []
+        self.is_leader = False
+
+    @property
+    def shard(self):
+        """(index, count) of this instance's shard, or None while it isn't a member."""
+        if self.slot is None or self.slot not in self.members:
+            return None
+        return self.members.index(self.slot), len(self.members)
+
+    def owns(self, user_id):
+        shard = self.shard
+        if shard is None:
+            return False
+        index, count = shard
+        return user_id % count == index
+
+    def subscribe(self, listener):
+        """
+        Register a callable() run when membership or leadership changes.
+
+        Listeners run on the event loop and must not block; database work
+        belongs in a job they schedule.
+        """
+        self._listeners.append(listener)
+
+    def start(self, job_queue):
+        self._refresh()
+        job_queue.run_repeating(
+            self._refresh_job,
+            interval=COORDINATION_INTERVAL,
+            first=COORDINATION_INTERVAL,
+            name="instance_coordination",
+        )
+
+    async def _refresh_job(self, context):
+        # The lock queries block, run them off the event loop
+        self._apply(await run_blocking(self._query_state))
+
+    def _connect(self):
+        # A dedicated connection outside the pool; the locks live as long as it does
+        connect_args, connect_kwargs = engine.dialect.create_connect_args(engine.url)
+        connection = psycopg2.connect(*connect_args, **connect_kwargs)
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return connection
+
+    def _try_lock(self, cursor, lock_class, key):
+        cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", (lock_class, key))
+        return cursor.fetchone()[0]
+
+    def _refresh(self):
+        self._apply(self._query_state())
+
+    def _query_state(self):
+        """
+        Take the free locks and read the membership; returns (slot, members, is_leader).
+
+        Only the connection is changed here, the state is applied on the event
+        loop by _apply so that owns() never sees a half updated shard.
+        """
+        slot, is_leader = self.slot, self.is_leader
+        try:
+            if self._connection is None or self._connection.closed:
+                self._connection = self._connect()
+                slot, is_leader = None, False
+            with self._connection.cursor() as cursor:
+                if slot is None:
+                    slot = next(
+                        (
+                            candidate
+                            for candidate in range(MAX_INSTANCES)
+                            if self._try_lock(cursor, MEMBER_LOCK_CLASS, candidate)
+                        ),
+                        None,
+                    )
+                    if slot is None:
+                        logger.error(f"All {MAX_INSTANCES} instance slots are taken")
+                if not is_leader:
+                    is_leader = self._try_lock(cursor, LEADER_LOCK_CLASS, 0)
+                cursor.execute(LIVE_MEMBERS_QUERY, (MEMBER_LOCK_CLASS,))
+                members = [member for member, in cursor.fetchall()]
+        except psycopg2.Error as e:
+            # Without the connection the locks are gone; another instance takes over
+            logger.error(f"Instance coordination failed: {e}")
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = None
+            return None, [], False
+        return slot, members, is_leader
+
+    def _apply(self, state):
+        previous = (self.shard, self.is_leader)
+        self.slot, self.members, self.is_leader = state
+
+        if (self.shard, self.is_leader) != previous:
+            logger.info(
+                f"Instance slot {self.slot}: shard {self.shard} of members {self.members}, "
+                f"{'leader' if self.is_leader else 'follower'}"
+            )
+            for listener in self._listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    logger.error(f"Coordination listener failed: {e}")
+
+instance_coordinator = InstanceCoordinator()
@@ -0,0 +1,239 @@
+"""
+Connection pool counters and a debug-mode session leak detector.
+
+Pool events of every engine count checkouts and new connections and track the
+peak of checked out (active) and overflow connections (beyond pool_size); the
+pools of database.py time how long checkouts wait for a connection.
+count_update_queries, an update processor middleware, counts the statements
+each update runs, e.g. to check that cached lookups keep taps off the
+database.
+
+With DB_SESSION_LEAK_SECONDS set, every session transaction is tracked from
+the moment it takes a connection; transactions still open after that many
+seconds are logged once with the stack that opened them, e.g. a
+next(get_db()) that is never closed.
+"""
+import contextvars
+import os
+import threading
+import time
+import traceback
+import weakref
+from contextlib import asynccontextmanager
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import DB_SESSION_LEAK_SECONDS, UPDATE_METRICS_INTERVAL
+from database import async_batch_engine, async_engine, batch_engine, engine
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Frames of our code kept in a leak report
+LEAK_STACK_DEPTH = 8
+
+# Statements run by the update being processed, shared with its pool threads
+_update_statements = contextvars.ContextVar("update_statements", default=None)
+
+
+def _opening_stack():
+    # AsyncSession runs the sync Session in a greenlet; the awaiting handler's
+    # frames belong to the parent greenlet
+    parent = greenlet.getcurrent().parent
+    frame = parent.gr_frame if parent is not None else None
+    frames = [
+        frame_summary
+        for frame_summary in traceback.extract_stack(frame)
+        if frame_summary.filename.startswith(PROJECT_DIR)
+        and "site-packages" not in frame_summary.filename
+        and frame_summary.filename != __file__
+    ]
+    return "".join(traceback.format_list(frames[-LEAK_STACK_DEPTH:]))
+
+
+class _PoolCounters:
+    def __init__(self, target_engine):
+        self.engine = target_engine
+        self.checkouts = 0
+        self.connects = 0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+        self.logged_timeouts = 0
+
+    @property
+    def pool(self):
+        # engine.dispose() replaces the pool
+        return self.engine.pool
+
+    def metrics(self):
+        pool = self.pool
+        checkout_waits = getattr(pool, "checkout_waits", 0)
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "peak_checked_out": self.peak_checked_out,
+            "peak_overflow": self.peak_overflow,
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "avg_checkout_wait_ms": round(
+                pool.checkout_wait_seconds / checkout_waits * 1000 if checkout_waits else 0, 2
+            ),
+            "max_checkout_wait_ms": round(getattr(pool, "max_checkout_wait_seconds", 0) * 1000, 2),
+            "checkout_timeouts": getattr(pool, "checkout_timeouts", 0),
+        }
+
+
+class DatabaseMonitor:
+    def __init__(self, leak_seconds=DB_SESSION_LEAK_SECONDS):
+        self.leak_seconds = leak_seconds
+        self._pools = {}
+        # Session events fire on the event loop and in blocking pool threads
+        self._lock = threading.Lock()
+        self._transactions = {}
+        self.leaks_reported = 0
+        self.updates = 0
+        self.update_statements = 0
+        self.updates_without_statements = 0
+
+    def instrument(self, name, target_engine):
+        if name in self._pools:
+            return
+        counters = self._pools[name] = _PoolCounters(target_engine)
+
+        @event.listens_for(target_engine, "checkout")
+        def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+            pool = counters.pool
+            counters.checkouts += 1
+            counters.peak_checked_out = max(counters.peak_checked_out, pool.checkedout())
+            counters.peak_overflow = max(counters.peak_overflow, pool.overflow())
+
+        @event.listens_for(target_engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            counters.connects += 1
+
+        @event.listens_for(target_engine, "before_cursor_execute")
+        def _on_execute(connection, cursor, statement, parameters, context, executemany):
+            statements = _update_statements.get()
+            if statements is not None:
+                statements[0] += 1
+
+    @asynccontextmanager
+    async def count_update_queries(self, update=None):
+        statements = [0]
+        token = _update_statements.set(statements)
+        try:
+            yield
+        finally:
+            _update_statements.reset(token)
+            self.updates += 1
+            self.update_statements += statements[0]
+            if not statements[0]:
+                self.updates_without_statements += 1
+
+    def enable_leak_detection(self):
+        event.listen(Session, "after_begin", self._after_begin)
+        event.listen(Session, "after_transaction_end", self._after_transaction_end)
+        logger.info(f"Session leak detection on, reporting transactions open over {self.leak_seconds}s")
+
+    def _after_begin(self, session, transaction, connection):
+        key = id(session)
+        with self._lock:
+            tracked = self._transactions.get(key)
+            if tracked is not None and tracked[0]() is session:
+                # Another bind of the same transaction
+                return
+        entry = [weakref.ref(session), time.monotonic(), _opening_stack(), False]
+        with self._lock:
+            self._transactions[key] = entry
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is not None:
+            return
+        with self._lock:
+            tracked = self._transactions.get(id(session))
+            if tracked is not None and tracked[0]() is session:
+                del self._transactions[id(session)]
+
+    def metrics(self):
+        with self._lock:
+            open_transactions = len(self._transactions)
+        return {
+            **{name: counters.metrics() for name, counters in self._pools.items()},
+            "open_transactions": open_transactions,
+            "leaks_reported": self.leaks_reported,
+            "updates": self.updates,
+            "statements_per_update": round(
+                self.update_statements / self.updates if self.updates else 0, 2
+            ),
+            "updates_without_statements": self.updates_without_statements,
+        }
+
+    def start(self, job_queue):
+        """Count pool events of every engine and log them every UPDATE_METRICS_INTERVAL seconds."""
+        self.instrument("sync", engine)
+        self.instrument("async", async_engine.sync_engine)
+        self.instrument("sync_batch", batch_engine)
+        self.instrument("async_batch", async_batch_engine.sync_engine)
+        job_queue.run_repeating(
+            self._log_metrics,
+            interval=UPDATE_METRICS_INTERVAL,
+            first=UPDATE_METRICS_INTERVAL,
+            name="database_pool_metrics",
+        )
+        if self.leak_seconds > 0:
+            self.enable_leak_detection()
+            job_queue.run_repeating(
+                self._report_leaks,
+                interval=max(self.leak_seconds / 2, 1),
+                first=self.leak_seconds,
+                name="database_leak_detector",
+            )
+
+    async def _log_metrics(self, context):
+        metrics = self.metrics()
+        if any(
+            metrics[name]["checkout_timeouts"] > counters.logged_timeouts
+            or metrics[name]["peak_overflow"]
+            for name, counters in self._pools.items()
+        ):
+            logger.warning(f"Database pools under contention: {metrics}")
+        else:
+            logger.info(f"Database pools: {metrics}")
+        # Peaks are reported per interval
+        for counters in self._pools.values():
+            pool = counters.pool
+            counters.logged_timeouts = getattr(pool, "checkout_timeouts", 0)
+            counters.peak_checked_out = pool.checkedout()
+            counters.peak_overflow = max(pool.overflow(), 0)
+            if hasattr(pool, "max_checkout_wait_seconds"):
+                pool.max_checkout_wait_seconds = 0.0
+
+    async def _report_leaks(self, context):
+        now = time.monotonic()
+        with self._lock:
+            tracked = list(self._transactions.items())
+        for key, entry in tracked:
+            session_ref, opened_at, stack, reported = entry
+            if session_ref() is None:
+                # Garbage collected without close, the pool got the connection back
+                if not reported:
+                    logger.warning(f"Session was never closed, opened at:\n{stack}")
+                    self.leaks_reported += 1
+                with self._lock:
+                    if self._transactions.get(key) is entry:
+                        del self._transactions[key]
+                continue
+            if reported or now - opened_at < self.leak_seconds:
+                continue
+            entry[3] = True
+            self.leaks_reported += 1
+            logger.warning(
+                f"Session transaction open for {now - opened_at:.0f}s, opened at:\n{stack}"
+            )
+
+
+database_monitor = DatabaseMonitor()
@@ -1,9 +1,10 @@
 import datetime
 
-from sqlalchemy import select, cast, Date
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, update, case, cast, exists, literal, tuple_, Date, Time
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, contains_eager, joinedload
 
-from config import timezone as tz
+from config import UNREACHABLE_CHAT_FAILURE_THRESHOLD, timezone as tz
 from database import get_db
 from exceptions import UserNotFoundError
 from models import (
@@ -13,15 +14,43 @@ from models import (
     NotificationPreference,
     CustomNotification,
     NotificationType,
-    UserRole,
+    OutboundMessage,
+    OutboundMessageStatus,
     UserPaymentStatus,
 )
 
 import text_constants
 from utils.logger import get_logger
+from utils.notification_bus import notification_bus
+from utils.recurrence import (
+    compile_notification_rule,
+    compile_rule,
+    next_occurrence,
+    next_occurrences,
+)
+from utils.user_cache import UserProfile, user_profile_cache
+from utils.user_directory import user_directory
 
 logger = get_logger(__name__)
 
+# How long a claimed outbox message stays reserved for the worker sending it
+OUTBOX_LEASE_DURATION = datetime.timedelta(minutes=5)
+# Delay between starting a training and the "still training?" reminder
+STOP_TRAINING_NOTIFICATION_DELAY = datetime.timedelta(hours=1, minutes=15)
+
+def add_notification_change_listener(listener):
+    """Register a callable(notification_type, notification_id) run after schedule-affecting writes."""
+    notification_bus.subscribe(listener)
+
+
+def notify_notification_changed(notification_type, notification_id, db_session):
+    """Publish a change made in db_session's transaction, before it commits."""
+    notification_bus.publish(notification_type, [notification_id], db_session)
+
+
+def notify_notifications_changed(notification_type, notification_ids, db_session):
+    notification_bus.publish(notification_type, notification_ids, db_session)
+
 
 def add_or_update_user(chat_id: int, username: str, db: Session):
     logger.debug(f"Adding or updating user with chat_id={chat_id}, username={username}")
@@ -50,6 +79,17 @@ def get_user_by_chat_id(chat_id, db_session):
     return user
 
 
+def get_user_id_by_chat_id(chat_id, db_session):
+    """The user's id from the user directory, queried while the directory doesn't have it."""
+    user_id = user_directory.user_id(chat_id)
+    if user_id is None:
+        user_id = db_session.scalar(select(User.id).where(User.chat_id == str(chat_id)))
+        if user_id is None:
+            logger.error(f"User not found with chat_id={chat_id}")
+            raise UserNotFoundError(chat_id)
+    return user_id
+
+
 def update_user_full_name(chat_id: int, full_name: str, db: Session):
     logger.debug(f"Updating full name for user with chat_id={chat_id} to '{full_name}'")
     user = db.query(User).filter_by(chat_id=str(chat_id)).first()
@@ -61,25 +101,36 @@ def update_user_full_name(chat_id: int, full_name: str, db: Session):
     logger.info(f"Updated full name for user with chat_id={chat_id}")
 
 
+def morning_notification_exists_query(user_id):
+    return select(
+        exists().where(
+            (NotificationPreference.user_id == user_id)
+            & (NotificationPreference.notification_type == NotificationType.MORNING_NOTIFICATION)
+        )
+    )
+
+
+def get_user_profile(chat_id, db: Session):
+    """The cached UserProfile of the user, loaded on a miss."""
+    profile = user_profile_cache.get(chat_id)
+    if profile is None:
+        user = get_user_by_chat_id(chat_id, db)
+        is_ready = bool(user.full_name) and db.scalar(
+            morning_notification_exists_query(user.id)
+        )
+        profile = UserProfile.from_user(user, is_ready)
+        user_profile_cache.put(profile)
+    return profile
+
+
 def is_user_ready_to_use(chat_id: int, db: Session):
     logger.debug(f"Checking if user with chat_id={chat_id} is ready to use")
-    user = db.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
-
-    if not user.full_name:
+    profile = get_user_profile(chat_id, db)
+    if not profile.full_name:
         logger.debug(f"User {chat_id} is not ready: missing full name")
         return False
 
-    user_notifications = (
-        db.query(NotificationPreference)
-        .filter_by(
-            user=user, notification_type=NotificationType.MORNING_NOTIFICATION
-        )
-        .first()
-    )
-    if not user_notifications:
+    if not profile.is_ready:
         logger.debug(f"User {chat_id} is not ready: missing morning notifications")
         return False
 
@@ -89,29 +140,23 @@ def is_user_ready_to_use(chat_id: int, db: Session):
 
 def is_active_user(chat_id: int, db: Session):
     logger.debug(f"Checking if user with chat_id={chat_id} is active")
-    user = db.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
-    if user.payment_status == UserPaymentStatus.ACTIVE or user.role == UserRole.ADMIN:
-        logger.debug(f"User {chat_id} is active (payment status: {user.payment_status}, role: {user.role})")
+    profile = get_user_profile(chat_id, db)
+    if profile.is_active:
+        logger.debug(f"User {chat_id} is active (payment status: {profile.payment_status}, role: {profile.role})")
         return True
 
-    logger.debug(f"User {chat_id} is not active (payment status: {user.payment_status}, role: {user.role})")
+    logger.debug(f"User {chat_id} is not active (payment status: {profile.payment_status}, role: {profile.role})")
     return False
 
 
 def is_admin_user(chat_id: int, db: Session):
     logger.debug(f"Checking if user with chat_id={chat_id} is admin")
-    user = db.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
-    if user.role == UserRole.ADMIN:
+    profile = get_user_profile(chat_id, db)
+    if profile.is_admin:
         logger.debug(f"User {chat_id} is admin")
         return True
 
-    logger.debug(f"User {chat_id} is not admin (role: {user.role})")
+    logger.debug(f"User {chat_id} is not admin (role: {profile.role})")
     return False
 
 
@@ -132,10 +177,7 @@ def save_user_notification_preference(
     notification_message: str = None,
 ):
     logger.debug(f"Saving notification preference for user {chat_id}, type {notification_type}, time {notification_time}")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
+    user_id = get_user_id_by_chat_id(chat_id, db_session)
     is_created = None
     
     # For custom notifications, we always create a new one
@@ -143,7 +185,7 @@ def save_user_notification_preference(
         logger.debug(f"Creating new custom notification for user {chat_id}")
         # Create a new notification preference for custom notification
         notification_preference = NotificationPreference(
-            user_id=user.id,
+            user_id=user_id,
             notification_type=notification_type,
             notification_time=notification_time,
             next_execution_datetime=next_execution_datetime,
@@ -159,7 +201,7 @@ def save_user_notification_preference(
             from datetime import datetime
             logger.debug(f"Creating associated CustomNotification record with name '{notification_name}'")
             custom_notification = CustomNotification(
-                user_id=user.id,
+                user_id=user_id,
                 notification_preference_id=notification_preference.id,
                 notification_name=notification_name,
                 notification_message=notification_message or "",
@@ -174,7 +216,7 @@ def save_user_notification_preference(
         # For other notification types, check if it already exists
         notification_preference = (
             db_session.query(NotificationPreference)
-            .filter_by(user_id=user.id, notification_type=notification_type)
+            .filter_by(user_id=user_id, notification_type=notification_type)
             .first()
         )
         
@@ -188,7 +230,7 @@ def save_user_notification_preference(
         else:
             logger.debug(f"Creating new notification preference for type {notification_type}")
             notification_preference = NotificationPreference(
-                user_id=user.id,
+                user_id=user_id,
                 notification_type=notification_type,
                 notification_time=notification_time,
                 next_execution_datetime=next_execution_datetime,
@@ -198,6 +240,8 @@ def save_user_notification_preference(
             db_session.add(notification_preference)
             is_created = True
         
+        db_session.flush()
+        notify_notification_changed(notification_type, notification_preference.id, db_session)
         db_session.commit()
 
     logger.info(f"{'Created' if is_created else 'Updated'} notification preference for user {chat_id}, type {notification_type}")
@@ -206,15 +250,12 @@ def save_user_notification_preference(
 
 def get_user_notifications(chat_id: int, db_session: Session, is_active: bool = True):
     logger.debug(f"Getting {'active' if is_active else 'inactive'} notifications for user {chat_id}")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
+    user_id = get_user_id_by_chat_id(chat_id, db_session)
 
     notifications = (
         db_session.query(NotificationPreference)
         .filter_by(
-            user_id=user.id,
+            user_id=user_id,
             is_active=is_active,
             notification_type=NotificationType.MORNING_NOTIFICATION,
         )
@@ -237,61 +278,524 @@ def update_user_notification_time(
         
     notification.notification_time = new_time
     notification.next_execution_datetime = next_execution_datetime
+    notify_notification_changed(notification.notification_type, notification_id, db_session)
     db_session.commit()
     logger.info(f"Updated notification {notification_id} time to {new_time}, next execution at {next_execution_datetime}")
 
 
-def get_notifications_to_send_by_time(current_datetime, db_session: Session):
+def get_notifications_to_send_by_time(
+    current_datetime, db_session: Session, notification_ids=None
+):
     logger.debug(f"Getting notifications to send at {current_datetime}")
-    notification_preferences = db_session.scalars(
+    query = (
         select(NotificationPreference)
-        .options(joinedload(NotificationPreference.user))
+        .join(NotificationPreference.user)
+        .options(contains_eager(NotificationPreference.user))
         .where(
             (NotificationPreference.next_execution_datetime <= current_datetime)
             & (NotificationPreference.is_active)
+            & (User.is_active)
         )
         .filter(
             NotificationPreference.notification_type
             == NotificationType.MORNING_NOTIFICATION
         )
-    ).all()
+    )
+    if notification_ids is not None:
+        query = query.filter(NotificationPreference.id.in_(notification_ids))
+    notification_preferences = db_session.scalars(query).all()
 
     logger.debug(f"Found {len(notification_preferences)} notifications to send")
     return notification_preferences
 
 
-def update_user_notification_preference_next_execution(
-    last_execution_datetime,
-    next_execution_datetime,
-    notification_id,
+def enqueue_morning_notifications(
+    current_datetime,
     db_session: Session,
+    text,
+    reply_markup=None,
+    notification_ids=None,
 ):
-    logger.debug(f"Updating next execution time for notification {notification_id}")
-    notification = (
-        db_session.query(NotificationPreference).filter_by(id=notification_id).first()
+    """
+    Hand due morning notifications over to the outbox.
+
+    Due rows are locked with FOR UPDATE SKIP LOCKED, written to
+    outbound_messages and moved to tomorrow in one transaction, so several
+    workers can share the load and a notification is never queued twice.
+
+    Returns:
+        int: Number of queued notifications
+    """
+    logger.debug(f"Queueing morning notifications due at {current_datetime}")
+    notifications = db_session.execute(
+        due_morning_notifications_query(current_datetime, notification_ids)
+    ).all()
+    if not notifications:
+        db_session.rollback()
+        return 0
+
+    enqueue_outbound_messages(
+        morning_outbound_messages(notifications, text, reply_markup), db_session
     )
-    notification.last_execution_datetime = last_execution_datetime
-    
-    # Create a timezone-aware next execution time based on the notification time
-    # This ensures DST changes are properly handled
-    current_time = datetime.datetime.now(tz=tz)
-    notification_time = notification.notification_time
-    
-    # Create a datetime with today's date and the notification time
-    next_time = tz.localize(
-        datetime.datetime(
-            current_time.year,
-            current_time.month,
-            current_time.day,
-            notification_time.hour,
-            notification_time.minute,
-            0
-        )
-    ) + datetime.timedelta(days=1)
-    
-    notification.next_execution_datetime = next_time
+    notification_ids = [notification.id for notification in notifications]
+    db_session.execute(advance_morning_notifications_statement(current_datetime, notification_ids))
+    notify_notifications_changed(
+        NotificationType.MORNING_NOTIFICATION, notification_ids, db_session
+    )
+    db_session.commit()
+    logger.info(f"Queued {len(notification_ids)} morning notifications")
+    return len(notification_ids)
+
+
+def due_morning_notifications_query(current_datetime, notification_ids=None):
+    query = (
+        select(
+            NotificationPreference.id,
+            NotificationPreference.user_id,
+            NotificationPreference.next_execution_datetime,
+            User.chat_id,
+        )
+        .join(User, User.id == NotificationPreference.user_id)
+        .where(
+            (NotificationPreference.next_execution_datetime <= wall_time(current_datetime))
+            & (NotificationPreference.is_active)
+            & (
+                NotificationPreference.notification_type
+                == NotificationType.MORNING_NOTIFICATION
+            )
+            & (User.is_active)
+        )
+        .with_for_update(of=NotificationPreference, skip_locked=True)
+    )
+    if notification_ids is not None:
+        query = query.filter(NotificationPreference.id.in_(notification_ids))
+    return query
+
+
+def morning_outbound_messages(notifications, text, reply_markup=None):
+    return [
+        build_outbound_message(
+            user_id=notification.user_id,
+            chat_id=notification.chat_id,
+            kind=NotificationType.MORNING_NOTIFICATION.value,
+            scheduled_for=notification.next_execution_datetime,
+            text=text,
+            reply_markup=reply_markup,
+            source_id=notification.id,
+        )
+        for notification in notifications
+    ]
+
+
+def advance_morning_notifications_statement(current_datetime, notification_ids):
+    return (
+        update(NotificationPreference)
+        .where(NotificationPreference.id.in_(notification_ids))
+        .values(
+            last_execution_datetime=wall_time(current_datetime),
+            next_execution_datetime=_next_daily_execution(current_datetime),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def skip_morning_notifications(current_datetime, db_session: Session, notification_ids):
+    """Move due morning notifications on to their next execution without sending them."""
+    skipped_ids = db_session.execute(
+        skip_morning_notifications_statement(current_datetime, notification_ids)
+    ).scalars().all()
+    notify_notifications_changed(NotificationType.MORNING_NOTIFICATION, skipped_ids, db_session)
+    db_session.commit()
+    logger.info(f"Skipped {len(skipped_ids)} missed morning notifications")
+    return skipped_ids
+
+
+def skip_morning_notifications_statement(current_datetime, notification_ids):
+    return (
+        update(NotificationPreference)
+        .where(
+            NotificationPreference.id.in_(notification_ids)
+            & (NotificationPreference.next_execution_datetime <= wall_time(current_datetime))
+            & (
+                NotificationPreference.notification_type
+                == NotificationType.MORNING_NOTIFICATION
+            )
+        )
+        .values(next_execution_datetime=_next_daily_execution(current_datetime))
+        .returning(NotificationPreference.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def wall_time(value):
+    """
+    Naive config.timezone wall time of ``value``, the way the naive DateTime
+    columns (e.g. NotificationPreference.next_execution_datetime) store it.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(tz).replace(tzinfo=None)
+
+
+def _next_daily_execution(current_datetime):
+    """
+    SQL expression for the first notification_time after current_datetime.
+
+    The result is a naive wall-clock time in config.timezone, so DST shifts
+    are handled. A notification missed yesterday whose time has not come yet
+    today is moved to today rather than tomorrow.
+    """
+    local_now = current_datetime.astimezone(tz)
+    today = local_now.date()
+    return case(
+        (
+            NotificationPreference.notification_time
+            > literal(local_now.time().replace(tzinfo=None), Time),
+            literal(today, Date) + NotificationPreference.notification_time,
+        ),
+        else_=literal(today + datetime.timedelta(days=1), Date)
+        + NotificationPreference.notification_time,
+    )
+
+
+def build_outbound_message(
+    user_id, chat_id, kind, scheduled_for, text, reply_markup=None, source_id=None
+):
+    """
+    Build the values of an outbox row.
+
+    The idempotency key is derived from the user, the kind of message and the
+    occurrence it was scheduled for, so re-running a job for the same
+    occurrence never queues a second copy.
+    """
+    if scheduled_for.tzinfo is None:
+        scheduled_for = tz.localize(scheduled_for)
+    scheduled_for = scheduled_for.astimezone(tz)
+    return {
+        "user_id": user_id,
+        "chat_id": str(chat_id),
+        "kind": kind,
+        "source_id": source_id,
+        "scheduled_for": scheduled_for,
+        "idempotency_key": f"{user_id}:{kind}:{scheduled_for.isoformat()}",
+        "text": text,
+        "reply_markup": reply_markup,
+    }
+
+
+def enqueue_outbound_messages(messages, db_session: Session):
+    """
+    Add messages built with build_outbound_message to the outbox.
+
+    Runs in the caller's transaction and does not commit, so the messages are
+    stored together with the state change that produced them. Messages whose
+    idempotency key is already queued are ignored.
+    """
+    if not messages:
+        return
+    logger.debug(f"Queueing {len(messages)} outbound messages")
+    db_session.execute(enqueue_outbound_messages_statement(messages))
+
+
+def enqueue_outbound_messages_statement(messages):
+    current_datetime = datetime.datetime.now(tz=tz)
+    return (
+        pg_insert(OutboundMessage)
+        .values(
+            [
+                {
+                    **message,
+                    "status": OutboundMessageStatus.PENDING,
+                    "attempts": 0,
+                    "next_attempt_at": current_datetime,
+                    "created_at": current_datetime,
+                }
+                for message in messages
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["idempotency_key"])
+    )
+
+
+def claim_outbound_messages(current_datetime, db_session: Session, limit):
+    """
+    Lease up to ``limit`` due outbox messages for delivery.
+
+    Rows are locked with FOR UPDATE SKIP LOCKED, their attempt counter is
+    incremented and next_attempt_at is pushed past the lease, then the
+    transaction is committed so no connection is held while sending. Messages
+    of a worker that died mid-send become due again when the lease runs out.
+
+    Returns:
+        list: Rows with id, user_id, chat_id, kind, source_id, text, reply_markup and attempts
+    """
+    logger.debug(f"Claiming outbound messages due at {current_datetime}")
+    claimed = db_session.execute(
+        claim_outbound_messages_statement(current_datetime, limit)
+    ).all()
     db_session.commit()
-    logger.info(f"Updated next execution time for notification {notification_id} to {next_time}")
+
+    logger.debug(f"Claimed {len(claimed)} outbound messages")
+    return claimed
+
+
+def claim_outbound_messages_statement(current_datetime, limit):
+    due_messages = (
+        select(OutboundMessage.id)
+        .where(
+            (OutboundMessage.status == OutboundMessageStatus.PENDING)
+            & (OutboundMessage.next_attempt_at <= current_datetime)
+        )
+        .order_by(OutboundMessage.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(OutboundMessage)
+        .where(OutboundMessage.id.in_(due_messages.scalar_subquery()))
+        .values(
+            attempts=OutboundMessage.attempts + 1,
+            next_attempt_at=current_datetime + OUTBOX_LEASE_DURATION,
+        )
+        .returning(
+            OutboundMessage.id,
+            OutboundMessage.user_id,
+            OutboundMessage.chat_id,
+            OutboundMessage.kind,
+            OutboundMessage.source_id,
+            OutboundMessage.text,
+            OutboundMessage.reply_markup,
+            OutboundMessage.attempts,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def renew_outbound_message_leases(current_datetime, db_session: Session, messages):
+    """
+    Push the lease of claimed messages that are still being sent past
+    current_datetime + OUTBOX_LEASE_DURATION.
+
+    A message is only renewed while its attempts still match the claim, so a
+    lease that already ran out and was claimed by another worker stays theirs.
+
+    Returns:
+        int: Number of renewed messages
+    """
+    renewed = db_session.execute(
+        renew_outbound_message_leases_statement(current_datetime, messages)
+    ).rowcount
+    db_session.commit()
+    return renewed
+
+
+def renew_outbound_message_leases_statement(current_datetime, messages):
+    return (
+        update(OutboundMessage)
+        .where(
+            (OutboundMessage.status == OutboundMessageStatus.PENDING)
+            & tuple_(OutboundMessage.id, OutboundMessage.attempts).in_(
+                [(message.id, message.attempts) for message in messages]
+            )
+        )
+        .values(next_attempt_at=current_datetime + OUTBOX_LEASE_DURATION)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def complete_outbound_messages(
+    current_datetime,
+    db_session: Session,
+    sent_ids=(),
+    retries=(),
+    failed=(),
+):
+    """
+    Record the outcome of claimed outbox messages in one transaction.
+
+    Args:
+        sent_ids: Delivered messages
+        retries: (id, next_attempt_at, error) of messages to try again
+        failed: (id, error) of messages that will not be retried
+    """
+    logger.debug(
+        f"Completing outbound messages: {len(sent_ids)} sent, "
+        f"{len(retries)} to retry, {len(failed)} failed"
+    )
+    for statement, parameters in complete_outbound_messages_statements(
+        current_datetime, sent_ids, retries, failed
+    ):
+        db_session.execute(statement, parameters)
+    db_session.commit()
+    logger.info(
+        f"Completed outbound messages: {len(sent_ids)} sent, "
+        f"{len(retries)} to retry, {len(failed)} failed"
+    )
+
+
+def complete_outbound_messages_statements(current_datetime, sent_ids, retries, failed):
+    """(statement, parameters) pairs recording the outcome of claimed outbox messages."""
+    statements = []
+    if sent_ids:
+        statements.append(
+            (
+                update(OutboundMessage)
+                .where(OutboundMessage.id.in_(sent_ids))
+                .values(
+                    status=OutboundMessageStatus.SENT,
+                    sent_at=current_datetime,
+                    last_error=None,
+                )
+                .execution_options(synchronize_session=False),
+                None,
+            )
+        )
+    if retries:
+        statements.append(
+            (
+                update(OutboundMessage),
+                [
+                    {"id": message_id, "next_attempt_at": next_attempt_at, "last_error": error}
+                    for message_id, next_attempt_at, error in retries
+                ],
+            )
+        )
+    if failed:
+        statements.append(
+            (
+                update(OutboundMessage),
+                [
+                    {"id": message_id, "status": OutboundMessageStatus.FAILED, "last_error": error}
+                    for message_id, error in failed
+                ],
+            )
+        )
+    return statements
+
+
+def record_chat_send_results(
+    db_session: Session,
+    reachable_user_ids=(),
+    unreachable_user_ids=(),
+    failure_threshold=UNREACHABLE_CHAT_FAILURE_THRESHOLD,
+):
+    """
+    Track consecutive "chat unreachable" delivery failures per user.
+
+    A delivered message resets the user's counter; an unreachable chat
+    increments it, and users reaching ``failure_threshold`` are deactivated
+    together with their pending outbox messages.
+
+    Returns:
+        list: Ids of the users deactivated by this call
+    """
+    unreachable_user_ids = set(unreachable_user_ids) - set(reachable_user_ids)
+    if reachable_user_ids:
+        db_session.execute(reset_send_failures_statement(reachable_user_ids))
+    deactivated_ids = []
+    if unreachable_user_ids:
+        failures = db_session.execute(
+            increment_send_failures_statement(unreachable_user_ids)
+        ).all()
+        deactivated_ids = users_to_deactivate(failures, failure_threshold)
+    if deactivated_ids:
+        for statement in deactivate_users_statements(deactivated_ids):
+            db_session.execute(statement)
+        notify_user_notifications_changed(deactivated_ids, db_session)
+    db_session.commit()
+
+    if deactivated_ids:
+        user_profile_cache.invalidate(user_ids=deactivated_ids)
+        logger.warning(f"Deactivated {len(deactivated_ids)} unreachable users: {deactivated_ids}")
+    return deactivated_ids
+
+
+def reset_send_failures_statement(user_ids):
+    return (
+        update(User)
+        .where(User.id.in_(user_ids) & (User.send_failures > 0))
+        .values(send_failures=0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def increment_send_failures_statement(user_ids):
+    return (
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(send_failures=User.send_failures + 1)
+        .returning(User.id, User.send_failures, User.is_active)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def users_to_deactivate(failures, failure_threshold):
+    return [
+        user_id
+        for user_id, send_failures, is_active in failures
+        if is_active and send_failures >= failure_threshold
+    ]
+
+
+def deactivate_users_statements(user_ids):
+    return [
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(is_active=False, deactivated_at=datetime.datetime.now(tz=tz))
+        .execution_options(synchronize_session=False),
+        update(OutboundMessage)
+        .where(
+            OutboundMessage.user_id.in_(user_ids)
+            & (OutboundMessage.status == OutboundMessageStatus.PENDING)
+        )
+        .values(status=OutboundMessageStatus.FAILED, last_error="Chat unreachable")
+        .execution_options(synchronize_session=False),
+    ]
+
+
+def reactivate_user_statement(chat_id):
+    return (
+        update(User)
+        .where((User.chat_id == str(chat_id)) & User.deactivated_at.isnot(None))
+        .values(is_active=True, send_failures=0, deactivated_at=None)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def notify_user_notifications_changed(user_ids, db_session: Session):
+    """Publish every notification of the given users, e.g. after they were (de)activated."""
+    preferences_query, custom_notifications_query = user_notifications_queries(user_ids)
+    for notification_type, notification_ids in group_notification_ids(
+        db_session.execute(preferences_query).all(),
+        db_session.execute(custom_notifications_query).scalars().all(),
+    ).items():
+        notify_notifications_changed(notification_type, notification_ids, db_session)
+
+
+def user_notifications_queries(user_ids):
+    preferences_query = select(
+        NotificationPreference.notification_type, NotificationPreference.id
+    ).where(
+        NotificationPreference.user_id.in_(user_ids),
+        # Custom notifications are keyed by CustomNotification.id, see below
+        NotificationPreference.notification_type
+        != NotificationType.CUSTOM_NOTIFICATION,
+    )
+    custom_notifications_query = select(CustomNotification.id).where(
+        CustomNotification.user_id.in_(user_ids)
+    )
+    return preferences_query, custom_notifications_query
+
+
+def group_notification_ids(preferences, custom_notification_ids):
+    ids_by_type = {}
+    for notification_type, notification_id in preferences:
+        ids_by_type.setdefault(notification_type, []).append(notification_id)
+    ids_by_type.setdefault(NotificationType.CUSTOM_NOTIFICATION, []).extend(
+        custom_notification_ids
+    )
+    return ids_by_type
 
 
 def save_morning_quiz_results(
@@ -310,9 +814,33 @@ def save_morning_quiz_results(
         logger.error(f"User not found with chat_id={user_id}")
         raise UserNotFoundError(user_id)
 
+    db_session.add(
+        build_morning_quiz(
+            user,
+            quiz_datetime,
+            user_feelings,
+            user_sleeping_hours,
+            user_weight,
+            is_going_to_have_training,
+            expected_training_datetime,
+        )
+    )
+    db_session.commit()
+    logger.info(f"Saved morning quiz results for user {user_id}")
+
+
+def build_morning_quiz(
+    user,
+    quiz_datetime,
+    user_feelings,
+    user_sleeping_hours,
+    user_weight,
+    is_going_to_have_training,
+    expected_training_datetime=None,
+):
     morning_quiz = MorningQuiz(
         user=user,
-        quiz_datetime=quiz_datetime,
+        quiz_datetime=wall_time(quiz_datetime),
         user_feelings=user_feelings,
         user_sleeping_hours=user_sleeping_hours,
         user_weight=user_weight,
@@ -324,50 +852,28 @@ def save_morning_quiz_results(
 
     if morning_quiz.is_going_to_have_training and expected_training_datetime:
         morning_quiz.expected_training_datetime = expected_training_datetime
-
-    db_session.add(morning_quiz)
-    db_session.commit()
-    logger.info(f"Saved morning quiz results for user {user_id}")
+    return morning_quiz
 
 
 def is_user_had_morning_quiz_today(chat_id, db_session):
     logger.debug(f"Checking if user {chat_id} had morning quiz today")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
+    user_id = get_user_id_by_chat_id(chat_id, db_session)
 
-    today_start = datetime.datetime.combine(
-        datetime.date.today(), datetime.datetime.min.time()
-    )
-    today_end = datetime.datetime.combine(
-        datetime.date.today(), datetime.datetime.max.time()
-    )
-    exists = db_session.query(
-        db_session.query(MorningQuiz)
-        .filter(
-            (MorningQuiz.user == user)
-            & (MorningQuiz.quiz_datetime >= today_start)
-            & (MorningQuiz.quiz_datetime <= today_end)
-        )
-        .exists()
-    ).scalar()
+    exists = db_session.scalar(morning_quiz_taken_query(user_id, datetime.datetime.now(tz=tz).date()))
 
     logger.debug(f"User {chat_id} had morning quiz today: {exists}")
     return exists
 
 
-def get_users_with_yesterday_trainings(session):
-    logger.debug("Getting users with yesterday trainings")
-    yesterday_date = datetime.datetime.now() - datetime.timedelta(days=1)
-    results = (
-        session.query(User)
-        .join(Training, User.id == Training.user_id)
-        .filter(cast(Training.training_start_date, Date) == cast(yesterday_date, Date))
-        .all()
+def morning_quiz_taken_query(user_id, quiz_date):
+    """Whether the user took a morning quiz on ``quiz_date`` (quiz_datetime is a config.timezone wall time)."""
+    return select(
+        exists().where(
+            (MorningQuiz.user_id == user_id)
+            & (MorningQuiz.quiz_datetime >= datetime.datetime.combine(quiz_date, datetime.time.min))
+            & (MorningQuiz.quiz_datetime <= datetime.datetime.combine(quiz_date, datetime.time.max))
+        )
     )
-    logger.debug(f"Found {len(results)} users with yesterday trainings")
-    return results
 
 
 def update_training_after_quiz(training_id, stress_level, soreness, db_session):
@@ -382,58 +888,210 @@ def update_training_after_quiz(training_id, stress_level, soreness, db_session):
     logger.info(f"Updated training {training_id} after quiz")
 
 
-def update_user_notification_preference_admin_message_sent(
-    db_session, sent_datetime, notification_id
-):
-    logger.debug(f"Updating admin message sent for notification {notification_id}")
-    notification = (
-        db_session.query(NotificationPreference).filter_by(id=notification_id).first()
-    )
-    notification.admin_warning_sent = sent_datetime
-    db_session.commit()
-    logger.info(f"Updated admin message sent for notification {notification_id}")
+def get_notifications_by_type(notification_type, db_session, notification_ids=None):
+    logger.debug(f"Getting notifications by type {notification_type}")
+    notifications = db_session.scalars(
+        notifications_by_type_query(notification_type, notification_ids)
+    ).all()
 
+    logger.debug(f"Found {len(notifications)} notifications by type {notification_type}")
+    return notifications
 
-def get_notifications_by_type(notification_type, db_session):
-    logger.debug(f"Getting notifications by type {notification_type}")
+
+def notifications_by_type_query(notification_type, notification_ids=None):
+    query = select(NotificationPreference)
     if notification_type == NotificationType.CUSTOM_NOTIFICATION:
         # For custom notifications, join with CustomNotification table
-        notifications = (
-            db_session.query(NotificationPreference)
-            .join(CustomNotification)
-            .filter(
-                NotificationPreference.notification_type == notification_type,
+        query = query.join(CustomNotification).where(CustomNotification.is_active)
+    query = (
+        query.join(NotificationPreference.user)
+        .where(
+            NotificationPreference.notification_type == notification_type,
+            NotificationPreference.is_active,
+            ~NotificationPreference.notification_sent,
+            User.is_active,
+        )
+        .options(contains_eager(NotificationPreference.user))
+    )
+    if notification_ids is not None:
+        query = query.where(NotificationPreference.id.in_(notification_ids))
+    return query
+
+
+def get_scheduled_notifications(
+    db_session: Session,
+    notification_type=None,
+    notification_ids=None,
+    until=None,
+    shard=None,
+):
+    """
+    Return (notification_type, notification_id, chat_id, next_execution_datetime)
+    tuples for every pending notification the scheduler has to fire.
+
+    Custom notifications are keyed by CustomNotification.id under
+    NotificationType.CUSTOM_NOTIFICATION; every other type is keyed by
+    NotificationPreference.id. With ``until`` only rows due before it are returned,
+    with ``shard`` = (index, count) only rows of users with user_id % count == index.
+    """
+    logger.debug(f"Getting scheduled notifications (type={notification_type}, ids={notification_ids}, until={until})")
+    preferences_query, custom_notifications_query = scheduled_notifications_queries(
+        notification_type, notification_ids, until, shard
+    )
+    scheduled = scheduled_notification_rows(
+        db_session.execute(preferences_query).all() if preferences_query is not None else [],
+        db_session.execute(custom_notifications_query).all()
+        if custom_notifications_query is not None
+        else [],
+    )
+
+    logger.debug(f"Found {len(scheduled)} scheduled notifications")
+    return scheduled
+
+
+def scheduled_notifications_queries(
+    notification_type=None, notification_ids=None, until=None, shard=None
+):
+    """
+    The notification preference and custom notification queries of
+    get_scheduled_notifications; either is None when the type rules it out.
+    """
+    preferences_query = custom_notifications_query = None
+
+    if notification_type != NotificationType.CUSTOM_NOTIFICATION:
+        preferences_query = (
+            select(
+                NotificationPreference.notification_type,
+                NotificationPreference.id,
+                User.chat_id,
+                NotificationPreference.next_execution_datetime,
+            )
+            .join(User, User.id == NotificationPreference.user_id)
+            .where(
+                NotificationPreference.notification_type
+                != NotificationType.CUSTOM_NOTIFICATION,
                 NotificationPreference.is_active,
+                NotificationPreference.next_execution_datetime.isnot(None),
+                User.is_active,
+                (
+                    NotificationPreference.notification_type
+                    == NotificationType.MORNING_NOTIFICATION
+                )
+                | ~NotificationPreference.notification_sent,
+            )
+        )
+        if notification_type is not None:
+            preferences_query = preferences_query.where(
+                NotificationPreference.notification_type == notification_type
+            )
+        if notification_ids is not None:
+            preferences_query = preferences_query.where(
+                NotificationPreference.id.in_(notification_ids)
+            )
+        if until is not None:
+            preferences_query = preferences_query.where(
+                NotificationPreference.next_execution_datetime < wall_time(until)
+            )
+        if shard is not None:
+            index, count = shard
+            preferences_query = preferences_query.where(
+                NotificationPreference.user_id % count == index
+            )
+
+    if notification_type in (None, NotificationType.CUSTOM_NOTIFICATION):
+        custom_notifications_query = (
+            select(
+                CustomNotification.id,
+                User.chat_id,
+                CustomNotification.next_execution_datetime,
+            )
+            .join(User, User.id == CustomNotification.user_id)
+            .where(
                 CustomNotification.is_active,
-                ~NotificationPreference.notification_sent,
+                ~CustomNotification.notification_sent,
+                CustomNotification.next_execution_datetime.isnot(None),
+                User.is_active,
             )
-            .all()
         )
-    else:
-        notifications = (
-            db_session.query(NotificationPreference)
-            .filter(
-                NotificationPreference.notification_type == notification_type,
-                NotificationPreference.is_active,
-                ~NotificationPreference.notification_sent,
+        if notification_ids is not None:
+            custom_notifications_query = custom_notifications_query.where(
+                CustomNotification.id.in_(notification_ids)
+            )
+        if until is not None:
+            custom_notifications_query = custom_notifications_query.where(
+                CustomNotification.next_execution_datetime < until
             )
-            .all()
+        if shard is not None:
+            index, count = shard
+            custom_notifications_query = custom_notifications_query.where(
+                CustomNotification.user_id % count == index
+            )
+    return preferences_query, custom_notifications_query
+
+
+def scheduled_notification_rows(preferences, custom_notifications):
+    scheduled = [tuple(row) for row in preferences]
+    scheduled.extend(
+        (NotificationType.CUSTOM_NOTIFICATION, notification_id, chat_id, next_execution)
+        for notification_id, chat_id, next_execution in custom_notifications
+    )
+    return scheduled
+
+
+def get_trainings_started_on(training_date, db_session: Session):
+    """Return (training_id, user_id, chat_id) rows for trainings started on a date, oldest first."""
+    logger.debug(f"Getting trainings started on {training_date}")
+    trainings = db_session.execute(trainings_started_on_query(training_date)).all()
+    logger.debug(f"Found {len(trainings)} trainings started on {training_date}")
+    return trainings
+
+
+def trainings_started_on_query(training_date):
+    return (
+        select(Training.id, User.id, User.chat_id)
+        .join(User, User.id == Training.user_id)
+        .where(
+            cast(Training.training_start_date, Date) == training_date,
+            User.is_active,
         )
-    
-    logger.debug(f"Found {len(notifications)} notifications by type {notification_type}")
-    return notifications
+        .order_by(Training.training_start_date)
+    )
+
+
+def get_trainings_by_ids(training_ids, db_session: Session):
+    logger.debug(f"Getting trainings by ids {training_ids}")
+    return db_session.scalars(trainings_by_ids_query(training_ids)).all()
+
+
+def trainings_by_ids_query(training_ids):
+    return (
+        select(Training)
+        .options(joinedload(Training.user))
+        .where(Training.id.in_(training_ids))
+    )
+
+
+def get_users_by_ids(user_ids, db_session: Session):
+    logger.debug(f"Getting users by ids {user_ids}")
+    return db_session.query(User).filter(User.id.in_(user_ids)).all()
+
+
+def get_active_user_chats(db_session: Session):
+    """Return (user_id, chat_id) rows of every reachable user."""
+    return db_session.execute(active_user_chats_query()).all()
+
+
+def active_user_chats_query():
+    return select(User.id, User.chat_id).where(User.is_active).order_by(User.id)
 
 
 def get_user_custom_notifications(chat_id: int, db_session: Session):
     logger.debug(f"Getting custom notifications for user {chat_id}")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
+    user_id = get_user_id_by_chat_id(chat_id, db_session)
     
     custom_notifications = (
         db_session.query(CustomNotification)
-        .filter_by(user_id=user.id)
+        .filter_by(user_id=user_id)
         .filter(CustomNotification.is_active)
         .all()
     )
@@ -452,6 +1110,9 @@ def delete_custom_notification(notification_id: int, db_session: Session):
     if custom_notification:
         # Delete the custom notification
         db_session.delete(custom_notification)
+        notify_notification_changed(
+            NotificationType.CUSTOM_NOTIFICATION, notification_id, db_session
+        )
         db_session.commit()
         logger.info(f"Deleted custom notification {notification_id}")
         return True
@@ -461,121 +1122,140 @@ def delete_custom_notification(notification_id: int, db_session: Session):
 
 def create_training_notifications(chat_id, notification_time, db_session):
     logger.debug(f"Creating training notifications for user {chat_id}")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
+    user_id = get_user_id_by_chat_id(chat_id, db_session)
 
-    notification_types = [
-        NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION,
-        NotificationType.TRAINING_REMINDER_NOTIFICATION,
-    ]
-
-    for notification_type in notification_types:
+    for notification_type, next_execution_datetime in training_notification_times(
+        notification_time
+    ):
         notification_preference = (
             db_session.query(NotificationPreference)
-            .filter_by(user_id=user.id, notification_type=notification_type)
+            .filter_by(user_id=user_id, notification_type=notification_type)
             .first()
         )
-
-        hours, minutes = map(int, notification_time.split(":"))
-        datetime_now = datetime.datetime.now(tz=tz)
-        next_execution_datetime = datetime_now.replace(
-            hour=hours, minute=minutes, second=0, microsecond=0
+        notification_preference = apply_training_notification(
+            notification_preference,
+            user_id,
+            notification_type,
+            notification_time,
+            next_execution_datetime,
         )
+        db_session.add(notification_preference)
 
-        if notification_type == NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION:
-            next_execution_datetime = next_execution_datetime - datetime.timedelta(
-                hours=1
-            )
-
-        if notification_preference:
-            notification_preference.notification_time = notification_time
-            notification_preference.is_active = True
-            notification_preference.notification_sent = False
-            notification_preference.next_execution_datetime = next_execution_datetime
-        else:
-            notification_preference = NotificationPreference(
-                user_id=user.id,
-                notification_type=notification_type,
-                notification_time=notification_time,
-                notification_sent=False,
-                next_execution_datetime=next_execution_datetime,
-                is_active=True,
-            )
-            db_session.add(notification_preference)
-
+        db_session.flush()
+        notify_notification_changed(notification_type, notification_preference.id, db_session)
         db_session.commit()
         logger.info(f"Created training notification for user {chat_id}, type {notification_type}")
 
 
-def update_notification_sent(notification_id, db_session):
-    logger.debug(f"Updating notification sent for notification {notification_id}")
-    notification = (
-        db_session.query(NotificationPreference).filter_by(id=notification_id).first()
+def training_notification_times(notification_time):
+    """(notification_type, next_execution_datetime) of the reminders for a training at ``notification_time``."""
+    hours, minutes = map(int, notification_time.split(":"))
+    training_datetime = datetime.datetime.now(tz=tz).replace(
+        hour=hours, minute=minutes, second=0, microsecond=0
+    )
+    return [
+        (
+            NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION,
+            training_datetime - datetime.timedelta(hours=1),
+        ),
+        (NotificationType.TRAINING_REMINDER_NOTIFICATION, training_datetime),
+    ]
+
+
+def apply_training_notification(
+    notification_preference,
+    user_id,
+    notification_type,
+    notification_time,
+    next_execution_datetime,
+):
+    """Re-arm an existing training reminder or create it; returns the preference."""
+    if isinstance(notification_time, str):
+        # asyncpg only binds datetime.time to TIME columns
+        notification_time = datetime.datetime.strptime(notification_time, "%H:%M").time()
+    next_execution_datetime = wall_time(next_execution_datetime)
+    if notification_preference:
+        notification_preference.notification_time = notification_time
+        notification_preference.is_active = True
+        notification_preference.notification_sent = False
+        notification_preference.next_execution_datetime = next_execution_datetime
+        return notification_preference
+    return NotificationPreference(
+        user_id=user_id,
+        notification_type=notification_type,
+        notification_time=notification_time,
+        notification_sent=False,
+        next_execution_datetime=next_execution_datetime,
+        is_active=True,
     )
-    notification.notification_sent = True
+
+
+def bulk_update_notifications_sent(notification_type, notification_ids, db_session):
+    if not notification_ids:
+        return
+    logger.debug(f"Bulk updating {len(notification_ids)} sent {notification_type} notifications")
+    db_session.execute(notifications_sent_statement(notification_ids))
+    notify_notifications_changed(notification_type, notification_ids, db_session)
     db_session.commit()
-    logger.info(f"Updated notification sent for notification {notification_id}")
+    logger.info(f"Updated {len(notification_ids)} sent {notification_type} notifications")
 
 
-def update_training_stop_notification(chat_id, db_session):
-    logger.debug(f"Updating training stop notification for user {chat_id}")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    user_notification = (
-        db_session.query(NotificationPreference)
-        .filter(
-            (NotificationPreference.user == user)
-            & (
-                NotificationPreference.notification_type
-                == NotificationType.STOP_TRAINING_NOTIFICATION
+def notifications_sent_statement(notification_ids):
+    return (
+        update(NotificationPreference)
+        .where(NotificationPreference.id.in_(notification_ids))
+        .values(notification_sent=True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def user_notification_sent_statement(chat_id, notification_type):
+    """Mark a user's notification of ``notification_type`` as sent, returning its id."""
+    return (
+        update(NotificationPreference)
+        .where(
+            (
+                NotificationPreference.user_id
+                == select(User.id).where(User.chat_id == str(chat_id)).scalar_subquery()
             )
+            & (NotificationPreference.notification_type == notification_type)
         )
-        .first()
+        .values(notification_sent=True)
+        .returning(NotificationPreference.id)
+        .execution_options(synchronize_session=False)
     )
-    if user_notification:
-        user_notification.notification_sent = True
-        db_session.commit()
+
+
+def _update_user_notification_sent(chat_id, notification_type, db_session):
+    notification_ids = db_session.execute(
+        user_notification_sent_statement(chat_id, notification_type)
+    ).scalars().all()
+    notify_notifications_changed(notification_type, notification_ids, db_session)
+    db_session.commit()
+    return bool(notification_ids)
+
+
+def update_training_stop_notification(chat_id, db_session):
+    logger.debug(f"Updating training stop notification for user {chat_id}")
+    if _update_user_notification_sent(
+        chat_id, NotificationType.STOP_TRAINING_NOTIFICATION, db_session
+    ):
         logger.info(f"Updated training stop notification for user {chat_id}")
 
 
 def update_training_start_notification(chat_id, db_session):
     logger.debug(f"Updating training start notification for user {chat_id}")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    user_notification = (
-        db_session.query(NotificationPreference)
-        .filter(
-            (NotificationPreference.user == user)
-            & (
-                NotificationPreference.notification_type
-                == NotificationType.TRAINING_REMINDER_NOTIFICATION
-            )
-        )
-        .first()
-    )
-    if user_notification:
-        user_notification.notification_sent = True
-        db_session.commit()
+    if _update_user_notification_sent(
+        chat_id, NotificationType.TRAINING_REMINDER_NOTIFICATION, db_session
+    ):
         logger.info(f"Updated training start notification for user {chat_id}")
 
 
 def update_pre_training_notification(chat_id, db_session):
     logger.debug(f"Updating pre-training notification for user {chat_id}")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    user_notification = (
-        db_session.query(NotificationPreference)
-        .filter(
-            (NotificationPreference.user == user)
-            & (
-                NotificationPreference.notification_type
-                == NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION
-            )
-        )
-        .first()
-    )
-    if user_notification:
-        user_notification.notification_sent = True
-        db_session.commit()
+    if _update_user_notification_sent(
+        chat_id, NotificationType.PRE_TRAINING_REMINDER_NOTIFICATION, db_session
+    ):
         logger.info(f"Updated pre-training notification for user {chat_id}")
 
 
@@ -612,7 +1292,8 @@ def start_user_training(chat_id: int, user_state_mark: str, db_session: Session)
     )
 
     datetime_now = datetime.datetime.now(tz=tz)
-    next_execution_datetime = datetime_now + datetime.timedelta(hours=1, minutes=15)
+    # Naive wall time, as restore_stop_training_reminders reads it back
+    next_execution_datetime = wall_time(datetime_now + STOP_TRAINING_NOTIFICATION_DELAY)
 
     if notification_preference:
         notification_preference.notification_time = "00:00"
@@ -631,20 +1312,15 @@ def start_user_training(chat_id: int, user_state_mark: str, db_session: Session)
         db_session.add(notification_preference)
 
     db_session.add(training)
+    db_session.flush()
+    notify_notification_changed(
+        NotificationType.STOP_TRAINING_NOTIFICATION, notification_preference.id, db_session
+    )
     db_session.commit()
     logger.info(f"Started user training for user {chat_id}")
     return training.id
 
 
-def cancel_training(training_id: int, db_session: Session):
-    logger.debug(f"Canceling training {training_id}")
-    training = db_session.query(Training).filter_by(id=training_id).first()
-    if training:
-        training.canceled = True
-        db_session.commit()
-        logger.info(f"Canceled training {training_id}")
-
-
 def stop_training(
     training_id: int,
     training_hardness: str,
@@ -669,6 +1345,57 @@ def stop_training(
         return training.training_duration
 
 
+def running_training_query(training_id):
+    """The training if it is neither finished nor canceled."""
+    return (
+        select(Training)
+        .options(joinedload(Training.user))
+        .where(
+            Training.id == training_id,
+            Training.training_finish_date.is_(None),
+            ~Training.canceled,
+        )
+    )
+
+
+def pending_stop_training_reminders_query():
+    """Running trainings whose stop-training reminder has not been sent yet, oldest first."""
+    return (
+        select(
+            Training.id,
+            User.chat_id,
+            NotificationPreference.next_execution_datetime,
+            User.id,
+        )
+        .join(User, User.id == Training.user_id)
+        .join(NotificationPreference, NotificationPreference.user_id == User.id)
+        .where(
+            NotificationPreference.notification_type
+            == NotificationType.STOP_TRAINING_NOTIFICATION,
+            NotificationPreference.is_active,
+            ~NotificationPreference.notification_sent,
+            Training.training_finish_date.is_(None),
+            ~Training.canceled,
+            User.is_active,
+        )
+        .order_by(Training.training_start_date)
+    )
+
+
+def latest_stop_training_reminders(rows):
+    """
+    (training_id, chat_id, next_execution_datetime, user_id) of the latest
+    running training of every user, from pending_stop_training_reminders_query rows.
+    """
+    latest_trainings = {}
+    for training_id, chat_id, next_execution_datetime, user_id in rows:
+        latest_trainings[chat_id] = (
+            training_id, chat_id, next_execution_datetime, user_id
+        )
+    logger.debug(f"Found {len(latest_trainings)} pending stop training reminders")
+    return list(latest_trainings.values())
+
+
 def set_training_pdf_message_id(pdf_user_id, message_id, chat_id, db_session):
     logger.debug(f"Setting training PDF message ID for user {pdf_user_id}")
     user = db_session.query(User).filter_by(chat_id=str(pdf_user_id)).first()
@@ -704,70 +1431,21 @@ def save_custom_notification(
     if db_session is None:
         db_session = next(get_db())
         
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
+    user_id = get_user_id_by_chat_id(chat_id, db_session)
     
     # Parse time string to Time object
     hours, minutes = map(int, notification_time.split(":")[:2])
     time_obj = datetime.time(hour=hours, minute=minutes)
     
-    # Create a timezone-aware next execution datetime
+    # First occurrence of the periodicity rule that is still in the future
     current_time = datetime.datetime.now(tz=tz)
-    
-    # Create a datetime with today's date and the notification time
-    notification_datetime = tz.localize(
-        datetime.datetime(
-            current_time.year,
-            current_time.month,
-            current_time.day,
-            hours,
-            minutes,
-            0
-        )
+    notification_datetime = next_occurrence(
+        compile_rule(periodicity_type, specific_days, time_obj), current_time
     )
     
-    # Check if the notification should be sent today based on periodicity
-    should_send_today = False
-    
-    if periodicity_type == "daily":
-        should_send_today = True
-    elif periodicity_type == "weekly":
-        # For weekly, we'll set it to the next Monday
-        days_until_monday = (7 - current_time.weekday()) % 7
-        if days_until_monday == 0:
-            days_until_monday = 7  # If today is Monday, set to next Monday
-        notification_datetime += datetime.timedelta(days=days_until_monday)
-        should_send_today = False
-    elif periodicity_type == "monthly":
-        # For monthly, we'll set it to the 1st of next month
-        next_month = current_time.month + 1 if current_time.month < 12 else 1
-        next_year = current_time.year if current_time.month < 12 else current_time.year + 1
-        notification_datetime = tz.localize(
-            datetime.datetime(
-                next_year,
-                next_month,
-                1,
-                hours,
-                minutes,
-                0
-            )
-        )
-        should_send_today = False
-    elif periodicity_type == "specific_days" and specific_days:
-        # For specific days, check if today is one of the specified days
-        day_of_week = current_time.weekday()
-        specific_days_list = [int(day) for day in specific_days.split(",")]
-        should_send_today = day_of_week in specific_days_list
-    
-    # If the time has already passed today and it should be sent today, set it for tomorrow
-    if should_send_today and notification_datetime < current_time:
-        notification_datetime += datetime.timedelta(days=1)
-    
     # Create a new custom notification
     custom_notification = CustomNotification(
-        user_id=user.id,
+        user_id=user_id,
         notification_name=notification_name,
         notification_message=notification_message,
         notification_time=time_obj,
@@ -780,152 +1458,102 @@ def save_custom_notification(
     )
     
     db_session.add(custom_notification)
+    db_session.flush()
+    notify_notification_changed(
+        NotificationType.CUSTOM_NOTIFICATION, custom_notification.id, db_session
+    )
     db_session.commit()
     logger.info(f"Saved custom notification for user {chat_id}")
     return custom_notification
 
 
-def get_custom_notifications_to_send(db_session: Session):
+def get_custom_notifications_to_send(db_session: Session, notification_ids=None):
     logger.debug("Getting custom notifications to send")
-    current_datetime = datetime.datetime.now(tz=tz)
+    notifications = db_session.scalars(
+        custom_notifications_to_send_query(datetime.datetime.now(tz=tz), notification_ids)
+    ).all()
     
-    # Get all active notifications that need to be sent
-    notifications = (
-        db_session.query(CustomNotification)
-        .options(joinedload(CustomNotification.user))
-        .filter(
+    logger.debug(f"Found {len(notifications)} custom notifications to send")
+    return notifications
+
+
+def custom_notifications_to_send_query(current_datetime, notification_ids=None):
+    # All active notifications that need to be sent
+    query = (
+        select(CustomNotification)
+        .join(CustomNotification.user)
+        .options(contains_eager(CustomNotification.user))
+        .where(
             (CustomNotification.next_execution_datetime <= current_datetime) &
             (CustomNotification.is_active) &
-            (~CustomNotification.notification_sent)
+            (~CustomNotification.notification_sent) &
+            (User.is_active)
         )
-        .all()
     )
-    
-    logger.debug(f"Found {len(notifications)} custom notifications to send")
-    return notifications
+    if notification_ids is not None:
+        query = query.where(CustomNotification.id.in_(notification_ids))
+    return query
 
 
-def update_custom_notification_sent(notification_id: int, db_session: Session):
-    logger.debug(f"Updating custom notification sent for notification {notification_id}")
-    notification = (
-        db_session.query(CustomNotification)
-        .filter_by(id=notification_id)
-        .first()
-    )
-    if notification:
-        # Mark as sent
-        notification.notification_sent = True
-        
-        # Update last execution time
-        notification.last_execution_datetime = datetime.datetime.now(tz=tz)
-        
-        # Calculate next execution time based on periodicity
+def calculate_next_execution_datetimes(notifications, current_time=None):
+    """
+    Calculate the next execution datetime for many custom notifications at once.
+
+    Args:
+        notifications: Objects with notification_time, periodicity_type and specific_days
+        current_time: Reference time, defaults to now in config.timezone
+
+    Returns:
+        list: Timezone-aware next execution datetimes, in input order
+    """
+    if current_time is None:
         current_time = datetime.datetime.now(tz=tz)
-        notification_time = notification.notification_time
-        
-        if notification.periodicity_type == "daily":
-            # For daily, set to tomorrow at the same time
-            next_time = tz.localize(
-                datetime.datetime(
-                    current_time.year,
-                    current_time.month,
-                    current_time.day,
-                    notification_time.hour,
-                    notification_time.minute,
-                    0
-                )
-            ) + datetime.timedelta(days=1)
-        elif notification.periodicity_type == "weekly":
-            # For weekly, set to 7 days from now
-            next_time = tz.localize(
-                datetime.datetime(
-                    current_time.year,
-                    current_time.month,
-                    current_time.day,
-                    notification_time.hour,
-                    notification_time.minute,
-                    0
-                )
-            ) + datetime.timedelta(days=7)
-        elif notification.periodicity_type == "monthly":
-            # For monthly, set to the same day next month
-            month = current_time.month + 1
-            year = current_time.year
-            if month > 12:
-                month = 1
-                year += 1
-            
-            # Handle month length differences
-            day = min(current_time.day, [31, 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1])
-            
-            next_time = tz.localize(
-                datetime.datetime(
-                    year,
-                    month,
-                    day,
-                    notification_time.hour,
-                    notification_time.minute,
-                    0
-                )
-            )
-        elif notification.periodicity_type == "specific_days" and notification.specific_days:
-            # For specific days, find the next day in the list
-            specific_days = [int(day) for day in notification.specific_days.split(",")]
-            current_day = current_time.weekday()
-            
-            # Find the next day in the list
-            next_days = [day for day in specific_days if day > current_day]
-            if next_days:
-                # There's a day later this week
-                days_to_add = min(next_days) - current_day
-            else:
-                # Wrap around to the first day next week
-                days_to_add = 7 - current_day + min(specific_days)
-            
-            next_time = tz.localize(
-                datetime.datetime(
-                    current_time.year,
-                    current_time.month,
-                    current_time.day,
-                    notification_time.hour,
-                    notification_time.minute,
-                    0
-                )
-            ) + datetime.timedelta(days=days_to_add)
-        else:
-            # Default to daily if something goes wrong
-            next_time = tz.localize(
-                datetime.datetime(
-                    current_time.year,
-                    current_time.month,
-                    current_time.day,
-                    notification_time.hour,
-                    notification_time.minute,
-                    0
-                )
-            ) + datetime.timedelta(days=1)
-        
-        notification.next_execution_datetime = next_time
-        
-        # Reset notification_sent flag for the next execution
-        notification.notification_sent = False
-        
-        db_session.commit()
-        logger.info(f"Updated custom notification sent for notification {notification_id}")
-        return True
-    logger.error(f"Custom notification not found with id={notification_id}")
-    return False
+    return next_occurrences(
+        [compile_notification_rule(notification) for notification in notifications],
+        current_time,
+    )
+
+
+def bulk_update_custom_notifications_sent(notifications, db_session: Session):
+    """
+    Move every sent custom notification to its next execution in one executemany statement.
+    """
+    if not notifications:
+        return
+    logger.debug(f"Bulk updating {len(notifications)} sent custom notifications")
+    db_session.execute(
+        update(CustomNotification),
+        custom_notifications_sent_parameters(notifications, datetime.datetime.now(tz=tz)),
+    )
+    notify_notifications_changed(
+        NotificationType.CUSTOM_NOTIFICATION,
+        [notification.id for notification in notifications],
+        db_session,
+    )
+    db_session.commit()
+    logger.info(f"Updated {len(notifications)} sent custom notifications")
+
+
+def custom_notifications_sent_parameters(notifications, current_time):
+    """executemany parameters of update(CustomNotification) moving sent notifications on."""
+    next_times = calculate_next_execution_datetimes(notifications, current_time)
+    return [
+        {
+            "id": notification.id,
+            "last_execution_datetime": current_time,
+            "next_execution_datetime": next_time,
+            "notification_sent": False,
+        }
+        for notification, next_time in zip(notifications, next_times)
+    ]
 
 
 def get_user_notification_by_time(chat_id: int, time: str, db_session: Session):
     logger.debug(f"Getting user notification by time for user {chat_id}, time {time}")
-    user = db_session.query(User).filter_by(chat_id=str(chat_id)).first()
-    if not user:
-        logger.error(f"User not found with chat_id={chat_id}")
-        raise UserNotFoundError(chat_id)
+    user_id = get_user_id_by_chat_id(chat_id, db_session)
     notification = (
         db_session.query(NotificationPreference)
-        .filter_by(user=user, notification_time=time)
+        .filter_by(user_id=user_id, notification_time=time)
         .first()
     )
     logger.debug(f"Found notification: {notification.id if notification else 'None'}")
@@ -942,6 +1570,7 @@ def toggle_user_notification(notification_id: int, db_session: Session):
         return
         
     notification.is_active = not notification.is_active
+    notify_notification_changed(notification.notification_type, notification_id, db_session)
     db_session.commit()
     logger.info(f"Toggled notification {notification_id} to {notification.is_active}")
 
@@ -961,7 +1590,14 @@ def update_user_stats_counter(user_id: int, db_session: Session):
     if not user:
         logger.error(f"User not found with id={user_id}")
         return False, 0
-        
+    is_monthly, counter = advance_stats_counter(user)
+    db_session.commit()
+    logger.info(f"Updated stats counter for user {user_id} to {counter}, is_monthly={is_monthly}")
+    return is_monthly, counter
+
+
+def advance_stats_counter(user):
+    """Count one more statistics report for the user; returns (is_monthly, counter)."""
     # Increment the counter (handle case where field doesn't exist in DB yet)
     if user.weekly_stats_counter is None:
         user.weekly_stats_counter = 1
@@ -970,12 +1606,8 @@ def update_user_stats_counter(user_id: int, db_session: Session):
     counter = user.weekly_stats_counter
     
     # Update the last sent date
-    user.last_stats_sent_date = datetime.datetime.now(tz=tz)
+    user.last_stats_sent_date = wall_time(datetime.datetime.now(tz=tz))
     
     # Determine if this is a monthly stats cycle (every 4th time)
     is_monthly = counter % 4 == 0
-    
-    db_session.commit()
-    logger.info(f"Updated stats counter for user {user_id} to {counter}, is_monthly={is_monthly}")
-    
     return is_monthly, counter
@@ -1,20 +1,78 @@
+"""
+Reply and inline keyboards.
+
+Markups are immutable once built, so keyboards that don't depend on the
+user are built on the first call and shared (functools.cache). The
+notifications keyboard is cached per chat until the user's notification
+preferences change, see utils.user_cache.NotificationVersions.
+"""
+import functools
+import time
+from collections import OrderedDict
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 
 import text_constants
-from database import get_db
-from utils.db_utils import get_user_notifications
+from database import update_db_session
+from utils.async_db_utils import get_user_id_by_chat_id, get_user_notifications
 from utils.bot_utils import get_user_list_as_buttons
-from config import ADMIN_CHAT_IDS
+from config import ADMIN_CHAT_IDS, USER_CACHE_SIZE, USER_CACHE_TTL
 from utils.logger import get_logger
+from utils.user_cache import notification_versions
 
 logger = get_logger(__name__)
 
 
+class NotificationsKeyboardCache:
+    """Notifications keyboard per chat, valid while the user's notification version holds."""
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE):
+        # The TTL bounds staleness after changes made by another instance
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chat_id, version):
+        entry = self._entries.get(chat_id)
+        if entry is None or entry[0] != version or entry[1] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(chat_id)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, chat_id, version, reply_markup):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        self._entries[chat_id] = (version, time.monotonic() + self.ttl, reply_markup)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+        }
+
+
+notifications_keyboard_cache = NotificationsKeyboardCache()
+
+
 def main_menu_keyboard(chat_id):
-    logger.debug(f"Creating main menu keyboard for user {chat_id}")
+    return _main_menu_keyboard(str(chat_id) in ADMIN_CHAT_IDS)
+
+
+@functools.cache
+def _main_menu_keyboard(is_admin):
+    logger.debug(f"Creating main menu keyboard (admin: {is_admin})")
     keyboard = [[text_constants.TRAINING]]
-    if str(chat_id) in ADMIN_CHAT_IDS:
-        logger.debug(f"User {chat_id} is admin, adding admin options")
+    if is_admin:
         keyboard.append([text_constants.TRAINING_PDF])
     keyboard.append([text_constants.CUSTOM_NOTIFICATIONS])
     keyboard.append([text_constants.STATISTICS])
@@ -25,6 +83,7 @@ def main_menu_keyboard(chat_id):
     )
 
 
+@functools.cache
 def settings_menu_keyboard():
     logger.debug("Creating settings menu keyboard")
     return ReplyKeyboardMarkup(
@@ -34,6 +93,7 @@ def settings_menu_keyboard():
     )
 
 
+@functools.cache
 def notification_configuration_keyboard():
     logger.debug("Creating notification configuration keyboard")
     return ReplyKeyboardMarkup(
@@ -51,15 +111,25 @@ def notification_configuration_keyboard():
     )
 
 
-def get_notifications_keyboard(chat_id: int):
+async def get_notifications_keyboard(chat_id: int):
+    db_session = update_db_session()
+    user_id = await get_user_id_by_chat_id(chat_id, db_session)
+    # Read before the preferences: a change committed meanwhile leaves the entry outdated
+    version = notification_versions.get(user_id)
+    reply_markup = notifications_keyboard_cache.get(str(chat_id), version)
+    if reply_markup is not None:
+        await db_session.commit()
+        logger.debug(f"Using cached notifications keyboard for user {chat_id}")
+        return reply_markup
+
     logger.debug(f"Creating notifications keyboard for user {chat_id}")
-    db_session = next(get_db())
-    active_notifications = get_user_notifications(
+    active_notifications = await get_user_notifications(
         chat_id=chat_id, db_session=db_session, is_active=True
     )
-    inactive_notifications = get_user_notifications(
+    inactive_notifications = await get_user_notifications(
         chat_id=chat_id, db_session=db_session, is_active=False
     )
+    await db_session.commit()
     logger.debug(f"Found {len(active_notifications)} active and {len(inactive_notifications)} inactive notifications")
     
     buttons = []
@@ -71,9 +141,12 @@ def get_notifications_keyboard(chat_id: int):
 
     buttons.append(text_constants.GO_BACK)
 
-    return ReplyKeyboardMarkup([buttons], resize_keyboard=True, one_time_keyboard=True)
+    reply_markup = ReplyKeyboardMarkup([buttons], resize_keyboard=True, one_time_keyboard=True)
+    notifications_keyboard_cache.put(str(chat_id), version, reply_markup)
+    return reply_markup
 
 
+@functools.cache
 def training_menu_keyboard():
     logger.debug("Creating training menu keyboard")
     return ReplyKeyboardMarkup(
@@ -88,6 +161,7 @@ def training_menu_keyboard():
     )
 
 
+@functools.cache
 def training_first_question_marks_keyboard():
     logger.debug("Creating training first question marks keyboard")
     return ReplyKeyboardMarkup(
@@ -100,6 +174,7 @@ def training_first_question_marks_keyboard():
     )
 
 
+@functools.cache
 def default_one_to_ten_keyboard():
     logger.debug("Creating default one to ten keyboard")
     return ReplyKeyboardMarkup(
@@ -112,6 +187,7 @@ def default_one_to_ten_keyboard():
     )
 
 
+@functools.cache
 def training_in_progress_keyboard():
     logger.debug("Creating training in progress keyboard")
     return ReplyKeyboardMarkup(
@@ -123,6 +199,7 @@ def training_in_progress_keyboard():
     )
 
 
+@functools.cache
 def start_morning_quiz_keyboard():
     logger.debug("Creating start morning quiz keyboard")
     keyboard = [
@@ -132,6 +209,7 @@ def start_morning_quiz_keyboard():
     return reply_markup
 
 
+@functools.cache
 def yes_no_keyboard():
     logger.debug("Creating yes/no keyboard")
     return ReplyKeyboardMarkup(
@@ -149,6 +227,7 @@ def pdf_user_list_keyboard():
     return ReplyKeyboardMarkup(buttons, resize_keyboard=True, one_time_keyboard=True)
 
 
+@functools.cache
 def custom_notification_keyboard():
     """Keyboard for custom notification settings."""
     logger.debug("Creating custom notification keyboard")
@@ -0,0 +1,134 @@
+"""
+Dispatch of menu text messages by (menu_state, text).
+
+MenuRouter compiles a table of routes into one dict when it is created: a
+message runs exactly one handler, the first match of
+  1. the route for its menu_state and text,
+  2. the route for its text in any state (ANY_STATE),
+  3. the fallback of its menu_state (NO_STATE when there is none yet).
+A message matching nothing is counted and ignored.
+
+Every route times its handler, Telegram calls included; calls, errors, and
+average and maximum latency per route are logged every
+UPDATE_METRICS_INTERVAL seconds, routes slower than MENU_SLOW_ROUTE_MS as a
+warning.
+"""
+import time
+
+from config import MENU_SLOW_ROUTE_MS, UPDATE_METRICS_INTERVAL
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Route key matching every menu state
+ANY_STATE = "*"
+# Fallback key for users without a menu_state, e.g. after a restart
+NO_STATE = None
+
+
+class _RouteStats:
+    __slots__ = ("calls", "errors", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+
+class MenuRouter:
+    def __init__(self, routes, fallbacks=None):
+        """routes: {(menu_state, text): handler}; fallbacks: {menu_state: handler}."""
+        self._routes = {
+            (menu_state, text): (self._route_name(menu_state, handler), handler)
+            for (menu_state, text), handler in routes.items()
+        }
+        self._fallbacks = {
+            menu_state: (f"{menu_state or 'no_state'}:fallback:{handler.__name__}", handler)
+            for menu_state, handler in (fallbacks or {}).items()
+        }
+        self._stats = {
+            name: _RouteStats()
+            for name, _ in (*self._routes.values(), *self._fallbacks.values())
+        }
+        self.unrouted = 0
+
+    @staticmethod
+    def _route_name(menu_state, handler):
+        if menu_state == ANY_STATE:
+            return handler.__name__
+        return f"{menu_state}:{handler.__name__}"
+
+    def match(self, menu_state, text):
+        """(route name, handler) for the message, None if no route matches."""
+        return (
+            self._routes.get((menu_state, text))
+            or self._routes.get((ANY_STATE, text))
+            or self._fallbacks.get(menu_state)
+        )
+
+    async def dispatch(self, update, context):
+        """Run the handler matching the message; returns the route name or None."""
+        route = self.match(context.user_data.get("menu_state", NO_STATE), update.message.text)
+        if route is None:
+            self.unrouted += 1
+            return None
+
+        name, handler = route
+        stats = self._stats[name]
+        started = time.perf_counter()
+        try:
+            await handler(update, context)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.calls += 1
+            stats.seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+        return name
+
+    def metrics(self):
+        return {
+            "unrouted": self.unrouted,
+            "routes": {
+                name: {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "avg_ms": round(stats.seconds / stats.calls * 1000, 1),
+                    "max_ms": round(stats.max_seconds * 1000, 1),
+                }
+                # Slowest first
+                for name, stats in sorted(
+                    self._stats.items(),
+                    key=lambda item: item[1].seconds / item[1].calls if item[1].calls else 0,
+                    reverse=True,
+                )
+                if stats.calls
+            },
+        }
+
+    def start(self, job_queue):
+        """Log the metrics every UPDATE_METRICS_INTERVAL seconds."""
+        job_queue.run_repeating(
+            self._log_metrics,
+            interval=UPDATE_METRICS_INTERVAL,
+            first=UPDATE_METRICS_INTERVAL,
+            name="menu_router_metrics",
+        )
+
+    async def _log_metrics(self, context):
+        metrics = self.metrics()
+        slow = [
+            name
+            for name, route in metrics["routes"].items()
+            if route["max_ms"] >= MENU_SLOW_ROUTE_MS
+        ]
+        if slow:
+            logger.warning(f"Slow menu routes {slow}: {metrics}")
+        else:
+            logger.info(f"Menu routes: {metrics}")
+        # Maximums are reported per interval
+        for stats in self._stats.values():
+            stats.max_seconds = 0.0
@@ -4,6 +4,7 @@ from telegram.ext import ContextTypes
 import text_constants
 import conversations
 from utils import keyboards
+from utils.menu_router import ANY_STATE, NO_STATE, MenuRouter
 from utils.notification_utils import (
     switch_notifications,
     change_user_notification_time,
@@ -46,7 +47,7 @@ async def notification_time_change_menu(update, context):
     context.user_data["menu_state"] = "change_notification_time"
     await update.message.reply_text(
         text=text_constants.CHANGE_NOTIFICATION_TIME_TEXT,
-        reply_markup=keyboards.get_notifications_keyboard(update.effective_user.id),
+        reply_markup=await keyboards.get_notifications_keyboard(update.effective_user.id),
     )
 
 
@@ -59,83 +60,64 @@ async def training_menu(update, context):
     )
 
 
+async def custom_notifications_menu(update, context):
+    # conversations import this module, resolve their handlers at call time
+    await conversations.custom_notification_conversation.manage_custom_notifications(update, context)
+
+
+async def statistics_menu(update, context):
+    await conversations.statistics_conversation.start_statistics(update, context)
+
+
+async def start_training(update, context):
+    await conversations.training_start_conversation.handle_training_startup(update, context)
+
+
+async def notification_time_input(update, context):
+    # First the notification to change is picked, then its new time entered
+    if "notification_to_change" in context.user_data:
+        await change_user_notification_time(update, context)
+    else:
+        await handle_notification_time_change(update, context)
+
+
+menu_router = MenuRouter(
+    routes={
+        # main menu
+        (ANY_STATE, text_constants.TRAINING): training_menu,
+        (ANY_STATE, text_constants.SETTINGS): settings_menu,
+        (ANY_STATE, text_constants.CUSTOM_NOTIFICATIONS): custom_notifications_menu,
+        (ANY_STATE, text_constants.STATISTICS): statistics_menu,
+        # settings and notifications menus
+        (ANY_STATE, text_constants.CONFIGURE_NOTIFICATIONS): configure_notifications_menu,
+        (ANY_STATE, text_constants.TURN_ON_OFF_NOTIFICATIONS): switch_notifications,
+        (ANY_STATE, text_constants.CHANGE_NOTIFICATION_TIME): notification_time_change_menu,
+        # training menu
+        ("training_menu", text_constants.START_TRAINING): start_training,
+        # back buttons
+        ("settings_menu", text_constants.GO_BACK): main_menu,
+        ("notifications_menu", text_constants.GO_BACK): settings_menu,
+        ("switch_notifications", text_constants.GO_BACK): configure_notifications_menu,
+        ("change_notification_time", text_constants.GO_BACK): configure_notifications_menu,
+        ("training_menu", text_constants.GO_BACK): main_menu,
+    },
+    fallbacks={
+        NO_STATE: main_menu,
+        "switch_notifications": switch_notifications,
+        "change_notification_time": notification_time_input,
+    },
+)
+
+
 async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_input = update.message.text
     user_id = update.effective_user.id
     logger.info(f"User {user_id} menu input: '{user_input}'")
 
-    if "menu_state" not in context.user_data:
-        logger.debug(f"No menu state for user {user_id}, showing main menu")
-        await main_menu(update, context)
-
-    # main menu handling
-    if user_input == text_constants.TRAINING:
-        logger.debug(f"User {user_id} selected training option")
-        await training_menu(update, context)
-
-    if user_input == text_constants.SETTINGS:
-        logger.debug(f"User {user_id} selected settings option")
-        await settings_menu(update, context)
-        
-    if user_input == text_constants.CUSTOM_NOTIFICATIONS:
-        logger.debug(f"User {user_id} selected custom notifications option")
-        await conversations.custom_notification_conversation.manage_custom_notifications(update, context)
-        
-    if user_input == text_constants.STATISTICS:
-        logger.debug(f"User {user_id} selected statistics option")
-        await conversations.statistics_conversation.start_statistics(update, context)
-
-    # settings menu handling
-
-    if user_input == text_constants.GO_BACK:
-        current_state = context.user_data.get("menu_state", "unknown")
-        logger.debug(f"User {user_id} selected go back from {current_state}")
-        if context.user_data["menu_state"] == "settings_menu":
-            await main_menu(update, context)
-        if context.user_data["menu_state"] == "notifications_menu":
-            await settings_menu(update, context)
-        if context.user_data["menu_state"] == "switch_notifications":
-            await configure_notifications_menu(update, context)
-        if context.user_data["menu_state"] == "change_notification_time":
-            await configure_notifications_menu(update, context)
-        if context.user_data["menu_state"] == "training_menu":
-            await main_menu(update, context)
-
-    if user_input == text_constants.CONFIGURE_NOTIFICATIONS:
-        logger.debug(f"User {user_id} selected configure notifications")
-        await configure_notifications_menu(update, context)
-
-    # Notifications config menu
-    if user_input == text_constants.TURN_ON_OFF_NOTIFICATIONS:
-        logger.debug(f"User {user_id} selected turn on/off notifications")
-        await switch_notifications(update, context)
-
-    if user_input == text_constants.CHANGE_NOTIFICATION_TIME:
-        logger.debug(f"User {user_id} selected change notification time")
-        await notification_time_change_menu(update, context)
-
-    # training menu handling
-
-    if (
-        context.user_data["menu_state"] == "training_menu"
-        and user_input == text_constants.START_TRAINING
-    ):
-        logger.debug(f"User {user_id} selected start training")
-        await conversations.training_start_conversation.handle_training_startup(
-            update, context
+    route = await menu_router.dispatch(update, context)
+    if route is None:
+        logger.debug(
+            f"No menu route for user {user_id} in state {context.user_data.get('menu_state')}"
         )
-
-    # handle anything else
-
-    if context.user_data["menu_state"] == "switch_notifications":
-        logger.debug(f"User {user_id} in switch notifications state")
-        await switch_notifications(update, context)
-
-    if context.user_data["menu_state"] == "change_notification_time":
-        logger.debug(f"User {user_id} in change notification time state")
-        if "notification_to_change" in context.user_data:
-            await change_user_notification_time(update, context)
-        else:
-            await handle_notification_time_change(update, context)
-
-    return
+    else:
+        logger.debug(f"User {user_id} menu route: {route}")
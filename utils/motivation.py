@@ -0,0 +1,108 @@
+"""
+Motivational messages, loaded once and reloaded when the file changes.
+
+The messages of MOTIVATION_MESSAGES_FILE are kept in a tuple; drawing one
+is a random.choice without touching the disk. A job checks the file's
+mtime every MOTIVATION_RELOAD_INTERVAL seconds in the blocking pool and
+swaps in the new tuple after an edit, so no restart is needed.
+
+sequence_message gives a user a different message every day until all of
+them were sent: day d maps to message (a * d + b) mod n, with a coprime to n
+and a, b derived from the user id. Nothing is stored per user, so the
+sequence survives restarts and is the same on every instance; it starts
+over in a different order when the number of messages changes.
+"""
+import datetime
+import math
+import os
+import random
+
+from config import (
+    MOTIVATION_MESSAGES_FILE,
+    MOTIVATION_RELOAD_INTERVAL,
+    timezone,
+)
+from utils.logger import get_logger
+from utils.offload import run_blocking
+
+logger = get_logger(__name__)
+
+# Knuth's multiplicative hash, spreads consecutive user ids
+_HASH_MULTIPLIER = 2654435761
+
+
+class MotivationMessages:
+    def __init__(self, path=MOTIVATION_MESSAGES_FILE, reload_interval=MOTIVATION_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        # (messages, multipliers coprime with len(messages)), swapped as one;
+        # every multiplier cycles through all messages
+        self._pool = None
+        self._mtime = None
+        self.reloads = 0
+
+    def _current_pool(self):
+        if self._pool is None:
+            # start() wasn't called, e.g. in scripts
+            self.reload_if_changed()
+        return self._pool
+
+    @property
+    def messages(self):
+        return self._current_pool()[0]
+
+    def reload_if_changed(self):
+        """Read the file if its mtime changed; keeps the current messages on errors."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime and self._pool is not None:
+                return False
+            with open(self.path, "r", encoding="UTF-8") as input_file:
+                messages = tuple(
+                    line.strip() for line in input_file.read().split("\n") if line.strip()
+                )
+        except OSError as e:
+            logger.error(f"Error reading motivation messages file: {e}")
+            if self._pool is None:
+                self._pool = ((), ())
+            return False
+
+        count = len(messages)
+        multipliers = tuple(a for a in range(1, count + 1) if math.gcd(a, count) == 1)
+        self._pool = (messages, multipliers)
+        self._mtime = mtime
+        self.reloads += 1
+        logger.info(f"Loaded {count} motivation messages from {self.path}")
+        return True
+
+    def random_message(self):
+        messages = self.messages
+        return random.choice(messages) if messages else None
+
+    def sequence_message(self, user_id, day=None):
+        """The user's message for ``day`` (a date, today by default); no repeats within len(messages) days."""
+        messages, multipliers = self._current_pool()
+        if not messages:
+            return None
+        if day is None:
+            day = datetime.datetime.now(tz=timezone).date()
+        user_hash = user_id * _HASH_MULTIPLIER
+        multiplier = multipliers[user_hash % len(multipliers)]
+        offset = (user_hash >> 16) % len(messages)
+        return messages[(multiplier * day.toordinal() + offset) % len(messages)]
+
+    def start(self, job_queue):
+        """Load the messages and check the file for changes every reload_interval seconds."""
+        self.reload_if_changed()
+        job_queue.run_repeating(
+            self._reload_job,
+            interval=self.reload_interval,
+            first=self.reload_interval,
+            name="motivation_messages_reload",
+        )
+
+    async def _reload_job(self, context):
+        await run_blocking(self.reload_if_changed)
+
+
+motivation_messages = MotivationMessages()
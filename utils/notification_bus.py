@@ -0,0 +1,179 @@
+"""
+Change notifications for scheduler-relevant rows.
+
+Write paths publish the ids they touched on their session, before they
+commit. Subscribers in this process are called once the session commits; on
+PostgreSQL the change is also sent with a NOTIFY in the same transaction, so
+other bot processes holding a LISTEN connection get it exactly when the rows
+are visible and a rolled back transaction publishes nothing.
+
+The LISTEN connection is opened in the blocking pool; only its socket is
+watched on the event loop.
+"""
+import asyncio
+import json
+import uuid
+
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from database import engine
+from models import NotificationType
+from utils.logger import get_logger
+from utils.offload import run_blocking
+
+logger = get_logger(__name__)
+
+CHANNEL = "notification_changes"
+# NOTIFY payloads are limited to 8000 bytes
+MAX_IDS_PER_PAYLOAD = 500
+RECONNECT_DELAY = 5
+NOTIFY_STATEMENT = text("SELECT pg_notify(:channel, :payload)")
+
+# Changes published in a session's transaction, delivered in-process on commit
+_PENDING_CHANGES = "notification_bus_pending_changes"
+
+
+class NotificationBus:
+    def __init__(self):
+        self.instance_id = uuid.uuid4().hex
+        self._listeners = []
+        self._reconnect_listeners = []
+        self._loop = None
+        self._connection = None
+        # fileno() fails once the connection is closed
+        self._fileno = None
+        self._listen_task = None
+
+    def subscribe(self, listener):
+        """Register a callable(notification_type, notification_id)."""
+        self._listeners.append(listener)
+
+    def subscribe_reconnect(self, listener):
+        """Register a callable() run after the LISTEN connection is re-established."""
+        self._reconnect_listeners.append(listener)
+
+    def _deliver(self, notification_type, notification_ids):
+        for listener in self._listeners:
+            for notification_id in notification_ids:
+                try:
+                    listener(notification_type, notification_id)
+                except Exception as e:
+                    logger.error(f"Notification change listener failed for {notification_type} {notification_id}: {e}")
+
+    def _payloads(self, notification_type, notification_ids):
+        for start in range(0, len(notification_ids), MAX_IDS_PER_PAYLOAD):
+            yield json.dumps(
+                {
+                    "instance": self.instance_id,
+                    "type": notification_type.value,
+                    "ids": notification_ids[start:start + MAX_IDS_PER_PAYLOAD],
+                }
+            )
+
+    def _queue(self, notification_type, notification_ids, db_session):
+        notification_ids = list(notification_ids)
+        if not notification_ids:
+            return []
+        db_session.info.setdefault(_PENDING_CHANGES, []).append(
+            (notification_type, notification_ids)
+        )
+        return [
+            {"channel": CHANNEL, "payload": payload}
+            for payload in self._payloads(notification_type, notification_ids)
+        ]
+
+    def publish(self, notification_type, notification_ids, db_session):
+        """Publish changes made in db_session's transaction; call before it commits."""
+        for parameters in self._queue(notification_type, notification_ids, db_session):
+            db_session.execute(NOTIFY_STATEMENT, parameters)
+
+    async def publish_async(self, notification_type, notification_ids, db_session):
+        """publish() for an AsyncSession."""
+        for parameters in self._queue(notification_type, notification_ids, db_session):
+            await db_session.execute(NOTIFY_STATEMENT, parameters)
+
+    def deliver_committed(self, session):
+        for notification_type, notification_ids in session.info.pop(_PENDING_CHANGES, ()):
+            self._deliver(notification_type, notification_ids)
+
+    def start_listening(self, loop):
+        if self._loop is not None:
+            return
+        self._loop = loop
+        self._listen_task = loop.create_task(self._listen())
+
+    def _open_connection(self):
+        # A dedicated connection outside the pool, with the engine's settings
+        connect_args, connect_kwargs = engine.dialect.create_connect_args(engine.url)
+        connection = psycopg2.connect(*connect_args, **connect_kwargs)
+        try:
+            connection.set_isolation_level(
+                psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    async def _listen(self, reconnect=False):
+        """Open the LISTEN connection, retrying every RECONNECT_DELAY seconds."""
+        while True:
+            if reconnect:
+                await asyncio.sleep(RECONNECT_DELAY)
+            reconnect = True
+            try:
+                connection = await run_blocking(self._open_connection)
+            except Exception as e:
+                logger.error(f"Unable to LISTEN on {CHANNEL}: {e}")
+                continue
+            break
+        self._connection = connection
+        self._fileno = connection.fileno()
+        self._loop.add_reader(self._fileno, self._on_readable)
+        logger.info(f"Listening for notification changes on {CHANNEL}")
+
+    async def _reconnect(self):
+        await self._listen(reconnect=True)
+        for listener in self._reconnect_listeners:
+            listener()
+
+    def _on_readable(self):
+        connection = self._connection
+        try:
+            connection.poll()
+        except Exception as e:
+            logger.error(f"LISTEN connection lost: {e}")
+            self._loop.remove_reader(self._fileno)
+            connection.close()
+            self._connection = None
+            self._listen_task = self._loop.create_task(self._reconnect())
+            return
+
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+                if payload["instance"] == self.instance_id:
+                    # Already delivered in-process when it was published
+                    continue
+                self._deliver(NotificationType(payload["type"]), payload["ids"])
+            except Exception as e:
+                logger.error(f"Invalid notification change payload {notify.payload!r}: {e}")
+
+
+notification_bus = NotificationBus()
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_committed_changes(session):
+    notification_bus.deliver_committed(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_changes(session, previous_transaction):
+    session.info.pop(_PENDING_CHANGES, None)
@@ -23,7 +23,7 @@ async def switch_notifications(update, context):
     context.user_data["menu_state"] = "switch_notifications"
     await update.message.reply_text(
         text=text_constants.NOTIFICATION_TOGGLE_TEXT,
-        reply_markup=keyboards.get_notifications_keyboard(user_id),
+        reply_markup=await keyboards.get_notifications_keyboard(user_id),
     )
 
 
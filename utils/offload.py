@@ -0,0 +1,176 @@
+"""
+Run blocking work (sync database calls, file I/O) off the event loop.
+
+Until every handler is on utils/async_db_utils.py, synchronous utils/db_utils.py
+calls and file access go through a bounded thread pool, so a slow query delays
+its own update instead of all chats. Each pool thread keeps its own Session
+(one per engine); run_db passes it to the function and closes it afterwards,
+returning the connection to the engine pool. Wait time for a free thread is
+tracked: calls waiting while every thread is busy mean the database (or disk)
+is the bottleneck, not the bot.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import BLOCKING_POOL_SIZE, UPDATE_METRICS_INTERVAL
+from database import BatchSessionLocal, SessionLocal
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BlockingPool:
+    def __init__(self, max_workers=BLOCKING_POOL_SIZE):
+        self.max_workers = max(max_workers, 1)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="blocking"
+        )
+        self._local = threading.local()
+        # Counters are updated from the loop and from pool threads
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.saturated = 0
+        self.peak_queued = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def db_session(self, batch=False):
+        """The Session of the current pool thread, on the batch engine for jobs."""
+        attribute = "batch_db_session" if batch else "db_session"
+        db_session = getattr(self._local, attribute, None)
+        if db_session is None:
+            db_session = (BatchSessionLocal if batch else SessionLocal)()
+            setattr(self._local, attribute, db_session)
+        return db_session
+
+    async def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in the pool and await its result."""
+        return await self._submit(func, args, kwargs, None, False)
+
+    async def run_db(self, func, *args, session_arg="db_session", batch=False, **kwargs):
+        """Like run, passing the pool thread's Session as the session_arg keyword."""
+        return await self._submit(func, args, kwargs, session_arg, batch)
+
+    async def _submit(self, func, args, kwargs, session_arg, batch):
+        submitted_at = time.monotonic()
+        with self._lock:
+            if self.running + self.queued >= self.max_workers:
+                self.saturated += 1
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        # Keep contextvars (e.g. loguru contextualize) like asyncio.to_thread does
+        context = contextvars.copy_context()
+        future = self._executor.submit(
+            context.run, self._call, submitted_at, func, args, kwargs, session_arg, batch
+        )
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Still waiting for a thread: it never starts, so it is no longer queued
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def _call(self, submitted_at, func, args, kwargs, session_arg, batch):
+        started_at = time.monotonic()
+        waited = started_at - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        failed = False
+        try:
+            if session_arg is None:
+                return func(*args, **kwargs)
+            db_session = self.db_session(batch)
+            try:
+                return func(*args, **{session_arg: db_session}, **kwargs)
+            finally:
+                # Ends the transaction and returns the connection; the Session is reused
+                db_session.close()
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.failed += failed
+                self._run_seconds += time.monotonic() - started_at
+
+    def metrics(self):
+        with self._lock:
+            completed = self.completed
+            return {
+                "max_workers": self.max_workers,
+                "running": self.running,
+                "queued": self.queued,
+                "peak_queued": self.peak_queued,
+                "completed": completed,
+                "failed": self.failed,
+                "saturated": self.saturated,
+                "avg_wait_ms": round(self._wait_seconds / completed * 1000 if completed else 0, 1),
+                "max_wait_ms": round(self._max_wait_seconds * 1000, 1),
+                "avg_run_ms": round(self._run_seconds / completed * 1000 if completed else 0, 1),
+            }
+
+    def start(self, job_queue):
+        """Log the metrics every UPDATE_METRICS_INTERVAL seconds."""
+        job_queue.run_repeating(
+            self._log_metrics,
+            interval=UPDATE_METRICS_INTERVAL,
+            first=UPDATE_METRICS_INTERVAL,
+            name="blocking_pool_metrics",
+        )
+
+    async def _log_metrics(self, context):
+        metrics = self.metrics()
+        if metrics["peak_queued"]:
+            logger.warning(
+                f"Blocking pool saturated, calls waited for a thread up to "
+                f"{metrics['max_wait_ms']} ms: {metrics}"
+            )
+        else:
+            logger.info(f"Blocking pool: {metrics}")
+        # Peak and max wait are reported per interval
+        with self._lock:
+            self.peak_queued = self.queued
+            self._max_wait_seconds = 0.0
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+blocking_pool = BlockingPool()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Await a blocking call (file I/O, CPU-bound work) without stalling the event loop."""
+    return await blocking_pool.run(func, *args, **kwargs)
+
+
+async def run_db(func, *args, session_arg="db_session", batch=False, **kwargs):
+    """Await a sync utils/db_utils.py function; its session argument is filled in."""
+    return await blocking_pool.run_db(
+        func, *args, session_arg=session_arg, batch=batch, **kwargs
+    )
+
+
+def offload(func):
+    """Decorator: the blocking function becomes awaitable and runs in the pool."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await blocking_pool.run(func, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,185 @@
+"""
+Delivery worker for the outbound_messages outbox.
+
+Scheduler jobs queue their messages in the same transaction that marks the
+notification as handled (see enqueue_outbound_messages in utils/db_utils.py).
+This worker leases due messages, sends them through the send pipeline and
+retries transient failures with exponential backoff until OUTBOX_MAX_ATTEMPTS is
+reached. A claimed batch is leased for OUTBOX_LEASE_DURATION and the lease is
+renewed while the batch is still being sent, e.g. through long RetryAfter
+pauses, so no other worker picks the messages up again. Chats that turn out to be unreachable are tracked per user and
+deactivated after UNREACHABLE_CHAT_FAILURE_THRESHOLD consecutive failures.
+Messages that fail for good are reported to admins in the failure digest.
+"""
+import asyncio
+import datetime
+from functools import partial
+
+from telegram import InlineKeyboardMarkup, ReplyKeyboardMarkup
+from telegram.error import RetryAfter
+
+from config import (
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_RETRY_BASE_DELAY,
+    OUTBOX_RETRY_MAX_DELAY,
+    timezone,
+)
+from database import get_async_batch_db
+from utils.admin_digest import admin_digest
+from utils.async_db_utils import (
+    claim_outbound_messages,
+    complete_outbound_messages,
+    record_chat_send_results,
+    renew_outbound_message_leases,
+)
+from utils.db_utils import OUTBOX_LEASE_DURATION
+from utils.logger import get_logger
+from utils.send_pipeline import retry_after_seconds, send_pipeline
+from utils.telegram_errors import SendErrorClass, classify_send_error
+
+logger = get_logger(__name__)
+
+# Leases of a batch still being sent are renewed this often, well before they run out
+OUTBOX_LEASE_RENEW_INTERVAL = OUTBOX_LEASE_DURATION / 3
+
+
+def _reply_markup(data, bot):
+    if not data:
+        return None
+    if "inline_keyboard" in data:
+        return InlineKeyboardMarkup.de_json(data, bot)
+    return ReplyKeyboardMarkup.de_json(data, bot)
+
+
+class OutboxWorker:
+    def __init__(
+        self,
+        batch_size=OUTBOX_BATCH_SIZE,
+        max_attempts=OUTBOX_MAX_ATTEMPTS,
+        retry_base_delay=OUTBOX_RETRY_BASE_DELAY,
+        retry_max_delay=OUTBOX_RETRY_MAX_DELAY,
+    ):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._job_queue = None
+        self._lock = asyncio.Lock()
+        self._wake_requested = False
+
+    def start(self, job_queue):
+        self._job_queue = job_queue
+        job_queue.run_repeating(
+            self._drain, interval=OUTBOX_POLL_INTERVAL, first=1, name="outbox_delivery"
+        )
+        logger.info(f"Outbox delivery started, polling every {OUTBOX_POLL_INTERVAL}s")
+
+    def wake(self):
+        """Deliver freshly queued messages without waiting for the next poll."""
+        if self._job_queue is None:
+            return
+        self._job_queue.run_once(self._drain, when=0, name="outbox_delivery_wake")
+
+    def retry_delay(self, attempts):
+        return datetime.timedelta(
+            seconds=min(
+                self.retry_base_delay * 2 ** max(attempts - 1, 0), self.retry_max_delay
+            )
+        )
+
+    async def _drain(self, context):
+        if self._lock.locked():
+            # The running drain picks the new messages up before it stops
+            self._wake_requested = True
+            return
+        async with self._lock:
+            while True:
+                self._wake_requested = False
+                claimed = await self._deliver_batch(context)
+                if claimed < self.batch_size and not self._wake_requested:
+                    return
+
+    async def _renew_leases(self, messages):
+        """Keep the claimed messages leased until cancelled when their batch is done."""
+        while True:
+            await asyncio.sleep(OUTBOX_LEASE_RENEW_INTERVAL.total_seconds())
+            try:
+                async with get_async_batch_db() as db_session:
+                    renewed = await renew_outbound_message_leases(
+                        datetime.datetime.now(tz=timezone), db_session, messages
+                    )
+            except Exception as e:
+                logger.error(f"Failed to renew the lease of {len(messages)} outbound messages: {e}")
+                continue
+            logger.debug(f"Renewed the lease of {renewed} outbound messages")
+
+    async def _deliver_batch(self, context):
+        async with get_async_batch_db() as db_session:
+            messages = await claim_outbound_messages(
+                datetime.datetime.now(tz=timezone), db_session, self.batch_size
+            )
+        if not messages:
+            return 0
+
+        lease_renewal = asyncio.create_task(self._renew_leases(messages))
+        try:
+            results = await send_pipeline.send_all(
+                "outbox",
+                [
+                    (
+                        message.chat_id,
+                        partial(
+                            context.bot.send_message,
+                            chat_id=message.chat_id,
+                            text=message.text,
+                            reply_markup=_reply_markup(message.reply_markup, context.bot),
+                        ),
+                    )
+                    for message in messages
+                ],
+            )
+        finally:
+            lease_renewal.cancel()
+            # A renewal in flight must not overwrite the outcome recorded below
+            await asyncio.gather(lease_renewal, return_exceptions=True)
+
+        finished_at = datetime.datetime.now(tz=timezone)
+        sent_ids, retries, failed = [], [], []
+        reachable_user_ids, unreachable_user_ids = set(), set()
+        for message, result in zip(messages, results):
+            if not isinstance(result, Exception):
+                sent_ids.append(message.id)
+                reachable_user_ids.add(message.user_id)
+                continue
+            error_class = classify_send_error(result)
+            error = f"{error_class.value}: {type(result).__name__}: {result}"
+            if error_class == SendErrorClass.UNREACHABLE:
+                unreachable_user_ids.add(message.user_id)
+            if not error_class.is_retryable or message.attempts >= self.max_attempts:
+                logger.error(
+                    f"Giving up on {message.kind} message {message.id} to {message.chat_id} "
+                    f"after {message.attempts} attempts: {error}"
+                )
+                failed.append((message.id, error))
+                admin_digest.record(message.kind, error_class.value, message.chat_id)
+                continue
+            delay = self.retry_delay(message.attempts)
+            if isinstance(result, RetryAfter):
+                delay = max(delay, datetime.timedelta(seconds=retry_after_seconds(result)))
+            retries.append((message.id, finished_at + delay, error))
+
+        async with get_async_batch_db() as db_session:
+            await complete_outbound_messages(
+                finished_at, db_session, sent_ids=sent_ids, retries=retries, failed=failed
+            )
+            await record_chat_send_results(
+                db_session,
+                reachable_user_ids=reachable_user_ids,
+                unreachable_user_ids=unreachable_user_ids,
+            )
+        return len(messages)
+
+
+outbox_worker = OutboxWorker()
@@ -0,0 +1,176 @@
+"""
+Recurrence rules for custom notifications.
+
+A notification's periodicity_type / specific_days / notification_time are
+compiled once into a RecurrenceRule (weekday bitmask + month-day set) that can
+be evaluated for many notifications at once and exported as an RRULE.
+"""
+import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+import pytz
+
+from config import timezone
+
+ALL_WEEKDAYS_MASK = 0b1111111
+RRULE_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+# Longest gap between two occurrences of any supported rule is under a year
+MAX_LOOKAHEAD_DAYS = 366
+
+
+class RecurrenceRule(NamedTuple):
+    periodicity_type: str
+    weekday_mask: int
+    month_days: frozenset
+    time: datetime.time
+
+    def matches(self, date: datetime.date) -> bool:
+        if self.month_days:
+            month_length = _month_length(date)
+            return any(min(day, month_length) == date.day for day in self.month_days)
+        return bool(self.weekday_mask & (1 << date.weekday()))
+
+    def to_rrule(self) -> str:
+        parts = []
+        if self.month_days:
+            parts.append("FREQ=MONTHLY")
+            parts.append(
+                "BYMONTHDAY=" + ",".join(str(day) for day in sorted(self.month_days))
+            )
+        elif self.weekday_mask == ALL_WEEKDAYS_MASK:
+            parts.append("FREQ=DAILY")
+        else:
+            parts.append("FREQ=WEEKLY")
+            parts.append(
+                "BYDAY="
+                + ",".join(
+                    RRULE_WEEKDAYS[day]
+                    for day in range(7)
+                    if self.weekday_mask & (1 << day)
+                )
+            )
+        parts.append(f"BYHOUR={self.time.hour}")
+        parts.append(f"BYMINUTE={self.time.minute}")
+        return ";".join(parts)
+
+
+def _month_length(date: datetime.date) -> int:
+    next_month = (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return (next_month - datetime.timedelta(days=1)).day
+
+
+def _parse_days(specific_days):
+    if not specific_days:
+        return []
+    return [int(day) for day in str(specific_days).split(",") if day.strip()]
+
+
+@lru_cache(maxsize=4096)
+def _compile_rule(periodicity_type, specific_days, hour, minute):
+    days = _parse_days(specific_days)
+    rule_time = datetime.time(hour, minute)
+
+    if periodicity_type == "weekly":
+        # specific_days holds the chosen weekday (0 is Monday), Monday by default
+        weekday = days[0] if days else 0
+        return RecurrenceRule(periodicity_type, 1 << weekday, frozenset(), rule_time)
+    if periodicity_type == "monthly":
+        # specific_days holds the chosen day of month, the 1st by default
+        return RecurrenceRule(
+            periodicity_type, 0, frozenset(days or [1]), rule_time
+        )
+    if periodicity_type == "specific_days" and days:
+        mask = 0
+        for day in days:
+            mask |= 1 << day
+        return RecurrenceRule(periodicity_type, mask, frozenset(), rule_time)
+    # Daily, and the fallback for malformed rules
+    return RecurrenceRule("daily", ALL_WEEKDAYS_MASK, frozenset(), rule_time)
+
+
+def compile_rule(periodicity_type, specific_days, notification_time) -> RecurrenceRule:
+    """
+    Compile a notification's periodicity settings into a RecurrenceRule.
+
+    Compiled rules are cached, so the comma-separated specific_days string is
+    parsed only once per distinct rule.
+    """
+    return _compile_rule(
+        periodicity_type,
+        specific_days,
+        notification_time.hour,
+        notification_time.minute,
+    )
+
+
+def compile_notification_rule(notification) -> RecurrenceRule:
+    return compile_rule(
+        notification.periodicity_type,
+        notification.specific_days,
+        notification.notification_time,
+    )
+
+
+def localize_wall_time(date: datetime.date, wall_time: datetime.time):
+    """
+    Attach config.timezone to a local date and time, resolving DST transitions.
+
+    Times skipped by the spring-forward jump are moved forward by the gap; times
+    repeated by the autumn fall-back resolve to their first occurrence.
+    """
+    naive = datetime.datetime.combine(date, wall_time)
+    try:
+        return timezone.localize(naive, is_dst=None)
+    except pytz.NonExistentTimeError:
+        return timezone.normalize(timezone.localize(naive, is_dst=False))
+    except pytz.AmbiguousTimeError:
+        return timezone.localize(naive, is_dst=True)
+
+
+def _as_local(value: datetime.datetime):
+    # Naive values are config.timezone wall time, as the naive DateTime columns store it
+    if value.tzinfo is None:
+        return timezone.localize(value)
+    return value.astimezone(timezone)
+
+
+def next_occurrence(rule: RecurrenceRule, after: datetime.datetime):
+    """
+    Return the first occurrence of the rule strictly after the given moment.
+
+    A naive ``after`` is taken as config.timezone wall time.
+    """
+    after = _as_local(after)
+    date = after.date()
+    for _ in range(MAX_LOOKAHEAD_DAYS + 1):
+        if rule.matches(date):
+            occurrence = localize_wall_time(date, rule.time)
+            if occurrence > after:
+                return occurrence
+        date += datetime.timedelta(days=1)
+    return None
+
+
+def next_occurrences(rules, after: datetime.datetime):
+    """
+    Return the next occurrence for each rule, evaluating every distinct rule once.
+    """
+    cache = {}
+    results = []
+    for rule in rules:
+        if rule not in cache:
+            cache[rule] = next_occurrence(rule, after)
+        results.append(cache[rule])
+    return results
+
+
+def occurrences_between(rule: RecurrenceRule, start: datetime.datetime, end: datetime.datetime):
+    """Return every occurrence of the rule in the half-open range [start, end)."""
+    end = _as_local(end)
+    occurrences = []
+    occurrence = next_occurrence(rule, start - datetime.timedelta(microseconds=1))
+    while occurrence is not None and occurrence < end:
+        occurrences.append(occurrence)
+        occurrence = next_occurrence(rule, occurrence)
+    return occurrences
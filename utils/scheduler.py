@@ -0,0 +1,348 @@
+"""
+In-memory notification dispatcher.
+
+Builds the day's send plan once after midnight (see utils/send_plan.py) and
+arms a single job_queue timer for the earliest planned entry, instead of
+polling the notification tables every few seconds. Late entries (e.g. after
+a restart) go through the catch-up policies in utils/catch_up.py and are
+released in throttled batches.
+
+With several instances each one plans only the users of its shard, and
+after-training sends are planned by the leader (see utils/coordination.py).
+"""
+import asyncio
+import datetime
+from collections import defaultdict, deque
+
+from config import CATCH_UP_BATCH_SIZE, CATCH_UP_INTERVAL, timezone
+from database import get_async_batch_db
+from models import NotificationType
+from utils.async_db_utils import get_scheduled_notifications, get_trainings_started_on
+from utils.db_utils import add_notification_change_listener
+from utils.catch_up import is_late, should_skip
+from utils.coordination import instance_coordinator
+from utils.logger import get_logger
+from utils.notification_bus import notification_bus
+from utils.recurrence import localize_wall_time
+from utils.send_plan import PlanKind, SendPlan
+
+logger = get_logger(__name__)
+
+# Rows that are still due after their handler ran (failed sends) are retried
+# with the same cadence the old polling jobs had.
+RETRY_DELAY = datetime.timedelta(seconds=10)
+# Safety net for rows changed without a notification (scripts, manual SQL).
+FULL_RESYNC_INTERVAL = datetime.timedelta(hours=1)
+# The plan for the next day is built shortly after local midnight.
+PLAN_BUILD_TIME = datetime.time(hour=0, minute=0, second=5, tzinfo=timezone)
+
+
+def _as_aware(value):
+    if value.tzinfo is None:
+        return timezone.localize(value)
+    return value
+
+
+class NotificationScheduler:
+    def __init__(self):
+        self._plan = SendPlan()
+        self._handlers = {}
+        self._skip_handlers = {}
+        self._after_training_times = {}
+        self._dirty = set()
+        self._job_queue = None
+        self._loop = None
+        self._wake_job = None
+        self._wake_at = None
+        self._lock = asyncio.Lock()
+        self._needs_full_reload = True
+        # Today's past after-training runs are caught up after a start or a leader change
+        self._include_past_after_training = True
+        self._was_leader = False
+        self._catch_up_queue = deque()
+        self._catching_up = set()
+        self._catch_up_job = None
+
+    def register(self, notification_type, handler, skip_handler=None):
+        """
+        Register ``handler(context, notification_ids)`` for a notification type.
+
+        ``skip_handler(context, notification_ids)`` moves rows whose send was
+        dropped by the catch-up policy on to their next execution.
+        """
+        self._handlers[notification_type] = handler
+        if skip_handler:
+            self._skip_handlers[notification_type] = skip_handler
+
+    def register_after_training(self, kind, handler, fire_time):
+        """
+        Register ``handler(context, payload_ids)`` fired at ``fire_time`` for
+        every user that trained the day before.
+        """
+        self._handlers[kind] = handler
+        self._after_training_times[kind] = fire_time
+
+    def start(self, job_queue):
+        self._job_queue = job_queue
+        add_notification_change_listener(self.mark_dirty)
+        notification_bus.subscribe_reconnect(self._resync)
+        self._was_leader = instance_coordinator.is_leader
+        instance_coordinator.subscribe(self._on_cluster_change)
+        job_queue.run_daily(
+            self._request_full_reload,
+            time=PLAN_BUILD_TIME,
+            name="notification_scheduler_plan",
+        )
+        job_queue.run_repeating(
+            self._request_full_reload,
+            interval=FULL_RESYNC_INTERVAL,
+            first=FULL_RESYNC_INTERVAL,
+            name="notification_scheduler_resync",
+        )
+        self._arm(datetime.datetime.now(tz=timezone))
+        logger.info(
+            f"Notification scheduler started for {[kind.value for kind in self._handlers]}"
+        )
+
+    def mark_dirty(self, notification_type, notification_id):
+        """Queue a row for reload; safe to call from any thread."""
+        self._dirty.add((notification_type, notification_id))
+        if self._loop is None:
+            # Before the first wake-up everything is loaded anyway.
+            return
+        if self._lock.locked():
+            # The running dispatch reloads dirty rows before re-arming.
+            return
+        self._loop.call_soon_threadsafe(self._wake_now)
+
+    def _resync(self):
+        # After a LISTEN reconnect published changes may have been missed;
+        # after a membership change the shards moved.
+        self._needs_full_reload = True
+        self._wake_now()
+
+    def _on_cluster_change(self):
+        if instance_coordinator.is_leader and not self._was_leader:
+            self._include_past_after_training = True
+        self._was_leader = instance_coordinator.is_leader
+        self._resync()
+
+    def _wake_now(self):
+        self._arm(datetime.datetime.now(tz=timezone))
+
+    async def _request_full_reload(self, context):
+        self._needs_full_reload = True
+        self._wake_now()
+
+    async def _after_training_entries(self, db_session, plan_date, now, include_past=False):
+        if not self._after_training_times or not instance_coordinator.is_leader:
+            return []
+        trainings = await get_trainings_started_on(
+            plan_date - datetime.timedelta(days=1), db_session
+        )
+        # One message per user; the latest training of the day wins
+        latest_trainings = {}
+        for training_id, user_id, chat_id in trainings:
+            latest_trainings[chat_id] = (training_id, user_id)
+
+        entries = []
+        for kind, fire_time in self._after_training_times.items():
+            fire_datetime = localize_wall_time(plan_date, fire_time)
+            if fire_datetime <= now and not include_past:
+                # Only the first plan after a start or leader change catches up on today's runs
+                continue
+            for chat_id, (training_id, user_id) in latest_trainings.items():
+                payload_id = (
+                    training_id if kind == PlanKind.AFTER_TRAINING_QUIZ else user_id
+                )
+                entries.append((fire_datetime, chat_id, kind, payload_id))
+        return entries
+
+    async def _full_reload(self, db_session):
+        now = datetime.datetime.now(tz=timezone)
+        plan_date = now.date()
+        plan_end = localize_wall_time(
+            plan_date + datetime.timedelta(days=1), datetime.time(0)
+        )
+        shard = instance_coordinator.shard
+        scheduled = (
+            await get_scheduled_notifications(db_session, until=plan_end, shard=shard)
+            if shard is not None
+            else []
+        )
+        entries = [
+            (_as_aware(due), chat_id, notification_type, notification_id)
+            for notification_type, notification_id, chat_id, due in scheduled
+            if notification_type in self._handlers
+        ]
+        entries.extend(
+            await self._after_training_entries(
+                db_session, plan_date, now, include_past=self._include_past_after_training
+            )
+        )
+        self._plan.replace(
+            [entry for entry in entries if (entry[2], entry[3]) not in self._catching_up],
+            plan_end,
+        )
+        self._dirty.clear()
+        self._needs_full_reload = False
+        self._include_past_after_training = False
+        logger.info(
+            f"Notification scheduler planned {len(self._plan)} sends until {plan_end} for shard {shard}"
+        )
+
+    async def _reload(self, keys, db_session):
+        ids_by_type = defaultdict(set)
+        for notification_type, notification_id in keys:
+            if (notification_type, notification_id) in self._catching_up:
+                # Reloaded once the queued catch-up send has fired
+                continue
+            ids_by_type[notification_type].add(notification_id)
+
+        shard = instance_coordinator.shard
+        for notification_type, notification_ids in ids_by_type.items():
+            if notification_type not in self._handlers:
+                continue
+            rows = (
+                await get_scheduled_notifications(
+                    db_session,
+                    notification_type=notification_type,
+                    notification_ids=list(notification_ids),
+                    shard=shard,
+                )
+                if shard is not None
+                else []
+            )
+            found = set()
+            for _, notification_id, chat_id, due in rows:
+                found.add(notification_id)
+                self._plan.patch(
+                    notification_type, notification_id, _as_aware(due), chat_id
+                )
+            for notification_id in notification_ids - found:
+                self._plan.patch(notification_type, notification_id)
+        logger.debug(f"Notification scheduler patched {len(keys)} entries")
+
+    def _arm(self, now):
+        next_due = self._plan.next_fire_time()
+        if self._dirty or self._needs_full_reload:
+            next_due = now
+        if next_due is None:
+            if self._wake_job:
+                self._wake_job.schedule_removal()
+                self._wake_job = None
+                self._wake_at = None
+            return
+        if self._wake_job and self._wake_at <= next_due:
+            # An earlier wake-up re-arms on its own after dispatching.
+            return
+        if self._wake_job:
+            self._wake_job.schedule_removal()
+        self._wake_at = next_due
+        self._wake_job = self._job_queue.run_once(
+            self._dispatch, when=max(next_due, now), name="notification_scheduler"
+        )
+
+    async def _dispatch(self, context):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            notification_bus.start_listening(self._loop)
+        async with self._lock:
+            self._wake_job = None
+            self._wake_at = None
+
+            async with get_async_batch_db() as db_session:
+                if self._needs_full_reload:
+                    await self._full_reload(db_session)
+                elif self._dirty:
+                    keys, self._dirty = self._dirty, set()
+                    await self._reload(keys, db_session)
+
+            now = datetime.datetime.now(tz=timezone)
+            immediate, late = [], []
+            for fire_time, chat_id, kind, payload_id in self._plan.advance(now):
+                entry = (fire_time, chat_id, kind, payload_id)
+                # Skipping sends nothing, so only late sends are throttled
+                if is_late(fire_time, now) and not should_skip(kind, fire_time, now):
+                    late.append(entry)
+                else:
+                    immediate.append(entry)
+            await self._fire(context, immediate, now)
+            if late:
+                self._catch_up_queue.extend(late)
+                self._catching_up.update((entry[2], entry[3]) for entry in late)
+                logger.info(
+                    f"Queued {len(late)} late sends, {len(self._catch_up_queue)} waiting for catch-up"
+                )
+                self._start_catch_up()
+
+        self._arm(datetime.datetime.now(tz=timezone))
+
+    def _start_catch_up(self):
+        if self._catch_up_job is not None:
+            return
+        self._catch_up_job = self._job_queue.run_repeating(
+            self._catch_up,
+            interval=CATCH_UP_INTERVAL,
+            first=0,
+            name="notification_scheduler_catch_up",
+        )
+
+    async def _catch_up(self, context):
+        async with self._lock:
+            batch = [
+                self._catch_up_queue.popleft()
+                for _ in range(min(CATCH_UP_BATCH_SIZE, len(self._catch_up_queue)))
+            ]
+            self._catching_up.difference_update((entry[2], entry[3]) for entry in batch)
+            await self._fire(context, batch, datetime.datetime.now(tz=timezone))
+            if not self._catch_up_queue:
+                logger.info("Notification scheduler caught up")
+                self._catch_up_job.schedule_removal()
+                self._catch_up_job = None
+        self._arm(datetime.datetime.now(tz=timezone))
+
+    async def _fire(self, context, entries, now):
+        """Run the handlers of due entries, or the skip handlers of entries missed for too long."""
+        due_items, skipped_items = defaultdict(list), defaultdict(list)
+        for fire_time, _, kind, payload_id in entries:
+            if is_late(fire_time, now) and should_skip(kind, fire_time, now):
+                skipped_items[kind].append(payload_id)
+            else:
+                due_items[kind].append(payload_id)
+
+        for kind, payload_ids in due_items.items():
+            logger.info(f"Dispatching {len(payload_ids)} {kind.value} sends")
+            try:
+                await self._handlers[kind](context, payload_ids)
+            except Exception as e:
+                logger.error(f"Handler for {kind.value} failed: {e}")
+        for kind, payload_ids in skipped_items.items():
+            logger.info(f"Skipping {len(payload_ids)} {kind.value} sends missed past their catch-up window")
+            skip_handler = self._skip_handlers.get(kind)
+            if skip_handler is None:
+                continue
+            try:
+                await skip_handler(context, payload_ids)
+            except Exception as e:
+                logger.error(f"Skip handler for {kind.value} failed: {e}")
+
+        fired = [
+            (kind, payload_id)
+            for items in (due_items, skipped_items)
+            for kind, payload_ids in items.items()
+            if isinstance(kind, NotificationType)
+            for payload_id in payload_ids
+        ]
+        if fired:
+            self._dirty.difference_update(fired)
+            async with get_async_batch_db() as db_session:
+                await self._reload(fired, db_session)
+            retry_at = datetime.datetime.now(tz=timezone) + RETRY_DELAY
+            for key in fired:
+                entry = self._plan.get(*key)
+                if entry is not None and entry[0] <= now:
+                    self._plan.patch(*key, retry_at, entry[1])
+
+
+notification_scheduler = NotificationScheduler()
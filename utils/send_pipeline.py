@@ -0,0 +1,162 @@
+"""
+Concurrent, rate-limited fan-out for outgoing Telegram messages.
+"""
+import asyncio
+import datetime
+import time
+
+from telegram.error import RetryAfter
+
+from config import (
+    SEND_CONCURRENCY,
+    SEND_MAX_RETRIES,
+    TELEGRAM_GLOBAL_RATE_LIMIT,
+    TELEGRAM_PER_CHAT_RATE_LIMIT,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def is_idle(self):
+        self._refill()
+        return self._tokens >= self.capacity
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def retry_after_seconds(error: RetryAfter):
+    retry_after = error.retry_after
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class SendPipeline:
+    def __init__(
+        self,
+        concurrency=SEND_CONCURRENCY,
+        global_rate=TELEGRAM_GLOBAL_RATE_LIMIT,
+        per_chat_rate=TELEGRAM_PER_CHAT_RATE_LIMIT,
+        max_retries=SEND_MAX_RETRIES,
+    ):
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._paused_until = 0.0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, capacity=1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_chat_buckets(self):
+        for chat_id in [
+            chat_id
+            for chat_id, bucket in self._chat_buckets.items()
+            if bucket.is_idle()
+        ]:
+            del self._chat_buckets[chat_id]
+
+    async def _wait_for_pause(self):
+        delay = self._paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._paused_until - time.monotonic()
+
+    async def send_all(self, label, items):
+        """
+        Send a batch of messages concurrently within Telegram rate limits.
+
+        Args:
+            label: Batch name used in throughput logs
+            items: List of (chat_id, send) pairs, where send() returns an awaitable
+
+        Returns:
+            list: Result of each send(), or the raised exception, in input order
+        """
+        if not items:
+            return []
+
+        results = [None] * len(items)
+        queue = asyncio.Queue()
+        for index, (chat_id, send) in enumerate(items):
+            queue.put_nowait((index, chat_id, send, 0))
+        stats = {"sent": 0, "failed": 0, "retries": 0}
+
+        async def worker():
+            while True:
+                try:
+                    index, chat_id, send, attempt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    await self._wait_for_pause()
+                    await self._chat_bucket(chat_id).acquire()
+                    await self._global_bucket.acquire()
+                    results[index] = await send()
+                    stats["sent"] += 1
+                except RetryAfter as e:
+                    retry_after = retry_after_seconds(e)
+                    self._paused_until = max(
+                        self._paused_until, time.monotonic() + retry_after
+                    )
+                    if attempt < self.max_retries:
+                        logger.warning(
+                            f"{label}: flood control for chat {chat_id}, retrying in {retry_after}s"
+                        )
+                        stats["retries"] += 1
+                        queue.put_nowait((index, chat_id, send, attempt + 1))
+                    else:
+                        logger.error(
+                            f"{label}: giving up on chat {chat_id} after {attempt} retries"
+                        )
+                        results[index] = e
+                        stats["failed"] += 1
+                except Exception as e:
+                    logger.error(f"{label}: failed to send to chat {chat_id}: {e}")
+                    results[index] = e
+                    stats["failed"] += 1
+
+        started = time.monotonic()
+        await asyncio.gather(
+            *(worker() for _ in range(min(self.concurrency, len(items))))
+        )
+        elapsed = time.monotonic() - started
+        self._prune_chat_buckets()
+
+        logger.info(
+            f"{label}: sent {stats['sent']}/{len(items)} messages in {elapsed:.2f}s "
+            f"({stats['sent'] / elapsed if elapsed else stats['sent']:.1f} msg/s), "
+            f"{stats['failed']} failed, {stats['retries']} retried"
+        )
+        return results
+
+
+send_pipeline = SendPipeline()
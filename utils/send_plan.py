@@ -0,0 +1,88 @@
+"""
+Precomputed send plan for one day.
+
+The plan is a sorted array of (fire_time, chat_id, kind, payload_id) entries
+built once after midnight. Intra-day edits are applied as patches and the
+dispatcher advances a cursor with a binary search instead of scanning tables.
+"""
+import bisect
+from enum import Enum
+
+
+class PlanKind(Enum):
+    AFTER_TRAINING_QUIZ = "after_training_quiz"
+    EVENING_MOTIVATION = "evening_motivation"
+
+
+class SendPlan:
+    def __init__(self):
+        self._times = []
+        self._entries = []
+        self._live = {}
+        self._cursor = 0
+        self.plan_end = None
+
+    def __len__(self):
+        return len(self._live)
+
+    def get(self, kind, payload_id):
+        return self._live.get((kind, payload_id))
+
+    def replace(self, entries, plan_end):
+        """Replace the plan with entries firing before plan_end."""
+        entries = sorted(
+            (entry for entry in entries if entry[0] < plan_end),
+            key=lambda entry: entry[0],
+        )
+        self._times = [entry[0] for entry in entries]
+        self._entries = entries
+        self._live = {(entry[2], entry[3]): entry for entry in entries}
+        self._cursor = 0
+        self.plan_end = plan_end
+
+    def patch(self, kind, payload_id, fire_time=None, chat_id=None):
+        """
+        Move, add or (with fire_time None) drop a single entry.
+
+        Entries scheduled past the end of the plan are dropped; the next
+        rebuild picks them up.
+        """
+        key = (kind, payload_id)
+        self._live.pop(key, None)
+        if fire_time is None or self.plan_end is None or fire_time >= self.plan_end:
+            return
+        entry = (fire_time, chat_id, kind, payload_id)
+        # Entries already behind the cursor would never be reached again,
+        # so anything overdue is queued right at the cursor.
+        index = max(bisect.bisect_right(self._times, fire_time), self._cursor)
+        self._times.insert(index, fire_time)
+        self._entries.insert(index, entry)
+        self._live[key] = entry
+
+    def advance(self, now):
+        """Return the live entries due at ``now`` and move the cursor past them."""
+        end = bisect.bisect_right(self._times, now, lo=self._cursor)
+        due = [
+            entry
+            for entry in self._entries[self._cursor:end]
+            if self._live.get((entry[2], entry[3])) is entry
+        ]
+        for entry in due:
+            del self._live[(entry[2], entry[3])]
+        self._cursor = end
+        self._compact()
+        return due
+
+    def next_fire_time(self):
+        for index in range(self._cursor, len(self._entries)):
+            entry = self._entries[index]
+            if self._live.get((entry[2], entry[3])) is entry:
+                return entry[0]
+        return None
+
+    def _compact(self):
+        # Drop consumed entries once they dominate the arrays
+        if self._cursor > 1024 and self._cursor * 2 > len(self._entries):
+            del self._times[: self._cursor]
+            del self._entries[: self._cursor]
+            self._cursor = 0
@@ -0,0 +1,45 @@
+"""
+Classification of errors raised while sending Telegram messages.
+"""
+from enum import Enum
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+
+# BadRequest descriptions meaning the chat itself is gone
+UNREACHABLE_CHAT_DESCRIPTIONS = (
+    "chat not found",
+    "user not found",
+    "peer_id_invalid",
+    "user is deactivated",
+)
+
+
+class SendErrorClass(Enum):
+    # The chat can't be reached until the user writes to the bot again
+    UNREACHABLE = "unreachable"
+    # The request itself is rejected; sending it again fails the same way
+    INVALID = "invalid"
+    RATE_LIMITED = "rate_limited"
+    TRANSIENT = "transient"
+
+    @property
+    def is_retryable(self):
+        return self in (SendErrorClass.RATE_LIMITED, SendErrorClass.TRANSIENT)
+
+
+def classify_send_error(error: Exception) -> SendErrorClass:
+    if isinstance(error, RetryAfter):
+        return SendErrorClass.RATE_LIMITED
+    if isinstance(error, Forbidden):
+        # Bot blocked by the user, user deactivated, bot kicked from the chat
+        return SendErrorClass.UNREACHABLE
+    # Checked before NetworkError, which BadRequest subclasses
+    if isinstance(error, BadRequest):
+        description = str(error).lower()
+        if any(text in description for text in UNREACHABLE_CHAT_DESCRIPTIONS):
+            return SendErrorClass.UNREACHABLE
+        return SendErrorClass.INVALID
+    if isinstance(error, ChatMigrated):
+        return SendErrorClass.INVALID
+    # Timeouts, network errors and anything unexpected
+    return SendErrorClass.TRANSIENT
@@ -0,0 +1,96 @@
+"""
+One-shot job_queue timers for the "training takes more than an hour" reminder.
+"""
+import datetime
+
+from config import timezone
+from database import get_async_batch_db
+from models import NotificationType
+from utils import async_db_utils
+from utils.db_utils import STOP_TRAINING_NOTIFICATION_DELAY, build_outbound_message
+from utils.coordination import instance_coordinator
+from utils.outbox import outbox_worker
+import text_constants
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _job_name(training_id):
+    return f"stop_training_reminder:{training_id}"
+
+
+async def send_stop_training_reminder(context):
+    training_id = context.job.data["training_id"]
+    async with get_async_batch_db() as db_session:
+        training = await async_db_utils.get_running_training(training_id, db_session)
+        if not training:
+            logger.debug(f"Training {training_id} is no longer running, skipping reminder")
+            return
+        chat_id = training.user.chat_id
+
+        logger.info(f"Sending stop training notification to user {chat_id}")
+        await async_db_utils.enqueue_outbound_messages(
+            [
+                build_outbound_message(
+                    user_id=training.user_id,
+                    chat_id=chat_id,
+                    kind=NotificationType.STOP_TRAINING_NOTIFICATION.value,
+                    # One reminder per training
+                    scheduled_for=training.training_start_date,
+                    text=text_constants.TRAINING_MORE_THEN_HOUR,
+                    source_id=training_id,
+                )
+            ],
+            db_session,
+        )
+        await async_db_utils.update_training_stop_notification(chat_id, db_session)
+        # Users without a stop preference still get the reminder
+        await db_session.commit()
+    outbox_worker.wake()
+
+
+def schedule_stop_training_reminder(job_queue, training_id, when=STOP_TRAINING_NOTIFICATION_DELAY):
+    cancel_stop_training_reminder(job_queue, training_id)
+    job_queue.run_once(
+        send_stop_training_reminder,
+        when=when,
+        data={"training_id": training_id},
+        name=_job_name(training_id),
+    )
+    logger.debug(f"Scheduled stop training reminder for training {training_id} at {when}")
+
+
+def cancel_stop_training_reminder(job_queue, training_id):
+    for job in job_queue.get_jobs_by_name(_job_name(training_id)):
+        job.schedule_removal()
+        logger.debug(f"Canceled stop training reminder for training {training_id}")
+
+
+def request_stop_training_reminders_restore(job_queue):
+    """Restore the reminders in a job; safe to call from coordination listeners on the loop."""
+    job_queue.run_once(
+        restore_stop_training_reminders, when=0, name="restore_stop_training_reminders"
+    )
+
+
+async def restore_stop_training_reminders(context):
+    """
+    Re-create timers for running trainings of the users this instance serves,
+    e.g. after a restart or when users were rebalanced to it.
+    """
+    now = datetime.datetime.now(tz=timezone)
+    async with get_async_batch_db() as db_session:
+        pending = await async_db_utils.get_pending_stop_training_reminders(db_session)
+    reminders = [
+        reminder for reminder in pending if instance_coordinator.owns(reminder[3])
+    ]
+    for training_id, _, next_execution_datetime, _ in reminders:
+        if next_execution_datetime is None:
+            continue
+        if next_execution_datetime.tzinfo is None:
+            next_execution_datetime = timezone.localize(next_execution_datetime)
+        schedule_stop_training_reminder(
+            context.job_queue, training_id, when=max(next_execution_datetime, now)
+        )
+    logger.info(f"Restored {len(reminders)} stop training reminders")
@@ -0,0 +1,165 @@
+"""
+Concurrent update processing that keeps every chat's updates in order.
+
+Updates of different chats run in parallel, up to UPDATE_CONCURRENCY at a
+time, while the updates of one chat are processed strictly one after another
+so ConversationHandler state never sees two answers of the same user at once.
+An update only takes a concurrency slot once it is next in line for its chat,
+so a busy chat (a slow statistics request and the taps queued behind it)
+cannot starve the others.
+
+Middlewares (async context manager factories taking the update) wrap the
+handlers of every update, e.g. database.update_session_scope.
+"""
+import asyncio
+import time
+from contextlib import AsyncExitStack
+
+from telegram.ext import BaseUpdateProcessor
+
+from config import UPDATE_CONCURRENCY, UPDATE_METRICS_INTERVAL
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Upper bound of updates admitted at once; the real limit is UPDATE_CONCURRENCY
+MAX_PENDING_UPDATES = 10_000
+
+
+def _chat_key(update):
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return user.id
+    return None
+
+
+class _ChatQueue:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+
+class ChatSerializedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, concurrency=UPDATE_CONCURRENCY):
+        # The base class semaphore only bounds admitted updates; running
+        # handlers are bounded by our own semaphore after the per-chat lock.
+        super().__init__(max(MAX_PENDING_UPDATES, concurrency))
+        self.concurrency = max(concurrency, 1)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._chats = {}
+        self._middlewares = []
+        self._update_queue = None
+        self.waiting_for_chat = 0
+        self.waiting_for_slot = 0
+        self.running = 0
+        self.processed = 0
+        self.peak_waiting_for_slot = 0
+        self._slot_wait_seconds = 0.0
+
+    def add_middleware(self, middleware):
+        self._middlewares.append(middleware)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update, coroutine):
+        key = _chat_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = _ChatQueue()
+        queue.depth += 1
+        self.waiting_for_chat += 1
+        try:
+            try:
+                await queue.lock.acquire()
+            except BaseException:
+                coroutine.close()
+                raise
+            finally:
+                self.waiting_for_chat -= 1
+            try:
+                await self._run(update, coroutine)
+            finally:
+                queue.lock.release()
+        finally:
+            queue.depth -= 1
+            if queue.depth == 0:
+                del self._chats[key]
+
+    async def _run(self, update, coroutine):
+        self.waiting_for_slot += 1
+        self.peak_waiting_for_slot = max(self.peak_waiting_for_slot, self.waiting_for_slot)
+        queued_at = time.monotonic()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            coroutine.close()
+            raise
+        finally:
+            self.waiting_for_slot -= 1
+        self._slot_wait_seconds += time.monotonic() - queued_at
+        self.running += 1
+        try:
+            async with AsyncExitStack() as stack:
+                try:
+                    for middleware in self._middlewares:
+                        await stack.enter_async_context(middleware(update))
+                except BaseException:
+                    coroutine.close()
+                    raise
+                await coroutine
+        finally:
+            self.running -= 1
+            self.processed += 1
+            self._slots.release()
+
+    def metrics(self):
+        """Queue depths of the processor, e.g. for the webhook health endpoint."""
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "waiting_for_slot": self.waiting_for_slot,
+            "waiting_for_chat": self.waiting_for_chat,
+            "busy_chats": len(self._chats),
+            "deepest_chat_queue": max(
+                (queue.depth for queue in self._chats.values()), default=0
+            ),
+            "peak_waiting_for_slot": self.peak_waiting_for_slot,
+            "processed": self.processed,
+            "avg_slot_wait_ms": round(
+                self._slot_wait_seconds / self.processed * 1000 if self.processed else 0, 1
+            ),
+        }
+
+    def start(self, job_queue, update_queue=None):
+        """Log the metrics every UPDATE_METRICS_INTERVAL seconds."""
+        self._update_queue = update_queue
+        job_queue.run_repeating(
+            self._log_metrics,
+            interval=UPDATE_METRICS_INTERVAL,
+            first=UPDATE_METRICS_INTERVAL,
+            name="update_processor_metrics",
+        )
+
+    async def _log_metrics(self, context):
+        metrics = self.metrics()
+        if self._update_queue is not None:
+            metrics["update_queue"] = self._update_queue.qsize()
+        logger.info(f"Update processing: {metrics}")
+        # The peak is reported per interval
+        self.peak_waiting_for_slot = self.waiting_for_slot
+
+
+update_processor = ChatSerializedUpdateProcessor()
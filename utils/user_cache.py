@@ -0,0 +1,204 @@
+"""
+In-process cache of the user fields every update checks.
+
+payment_restricted, admin_restricted, reactivate_unreachable_chat and /start
+look up the same User row (and the morning notification for readiness) on
+every tap. UserProfileCache keeps those fields per chat_id for USER_CACHE_TTL
+seconds, evicting the least recently used entries beyond USER_CACHE_SIZE.
+
+Entries are invalidated after commit when a User or a NotificationPreference
+is inserted, updated or deleted through the ORM, and explicitly by the bulk
+UPDATEs that (de)activate users. Changes made outside this process (another
+instance, manual SQL) show up once the TTL expires.
+
+The same commits bump the user's NotificationVersions counter, which keys
+caches of per-user views of the notification preferences (the notifications
+keyboard of utils/keyboards.py).
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import UPDATE_METRICS_INTERVAL, USER_CACHE_SIZE, USER_CACHE_TTL
+from models import NotificationPreference, User, UserPaymentStatus, UserRole
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_PENDING_CHAT_IDS = "user_cache_chat_ids"
+_PENDING_USER_IDS = "user_cache_user_ids"
+
+
+class UserProfile(
+    namedtuple(
+        "UserProfile",
+        "id chat_id role payment_status full_name is_ready is_deactivated",
+    )
+):
+    __slots__ = ()
+
+    @classmethod
+    def from_user(cls, user, is_ready):
+        return cls(
+            id=user.id,
+            chat_id=user.chat_id,
+            role=user.role,
+            payment_status=user.payment_status,
+            full_name=user.full_name,
+            is_ready=is_ready,
+            # Deactivated for being unreachable, see reactivate_user
+            is_deactivated=user.deactivated_at is not None,
+        )
+
+    @property
+    def is_admin(self):
+        return self.role == UserRole.ADMIN
+
+    @property
+    def is_active(self):
+        return self.payment_status == UserPaymentStatus.ACTIVE or self.is_admin
+
+
+class UserProfileCache:
+    def __init__(self, ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._chat_ids_by_user_id = {}
+        # Invalidated from blocking pool threads too
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, chat_id):
+        chat_id = str(chat_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            profile, expires_at = entry
+            if expires_at <= now:
+                self._remove(chat_id)
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(chat_id)
+            self.hits += 1
+            return profile
+
+    def put(self, profile):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._remove(profile.chat_id)
+            self._entries[profile.chat_id] = (profile, time.monotonic() + self.ttl)
+            self._chat_ids_by_user_id[profile.id] = profile.chat_id
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, chat_ids=(), user_ids=()):
+        with self._lock:
+            for user_id in user_ids:
+                chat_id = self._chat_ids_by_user_id.get(user_id)
+                if chat_id is not None and self._remove(chat_id):
+                    self.invalidations += 1
+            for chat_id in chat_ids:
+                if self._remove(str(chat_id)):
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chat_ids_by_user_id.clear()
+
+    def _remove(self, chat_id):
+        entry = self._entries.pop(chat_id, None)
+        if entry is None:
+            return False
+        self._chat_ids_by_user_id.pop(entry[0].id, None)
+        return True
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def start(self, job_queue):
+        """Log the metrics every UPDATE_METRICS_INTERVAL seconds."""
+        job_queue.run_repeating(
+            self._log_metrics,
+            interval=UPDATE_METRICS_INTERVAL,
+            first=UPDATE_METRICS_INTERVAL,
+            name="user_profile_cache_metrics",
+        )
+
+    async def _log_metrics(self, context):
+        logger.info(f"User profile cache: {self.metrics()}")
+
+
+user_profile_cache = UserProfileCache()
+
+
+class NotificationVersions:
+    """Per-user counter of committed notification preference changes."""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+
+notification_versions = NotificationVersions()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_changes(session, flush_context):
+    chat_ids = session.info.setdefault(_PENDING_CHAT_IDS, set())
+    user_ids = session.info.setdefault(_PENDING_USER_IDS, set())
+    dirty = (instance for instance in session.dirty if session.is_modified(instance))
+    for instance in (*session.new, *dirty, *session.deleted):
+        if isinstance(instance, User):
+            chat_ids.add(instance.chat_id)
+        elif isinstance(instance, NotificationPreference):
+            # Readiness depends on the morning notification
+            user_ids.add(instance.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    chat_ids = session.info.pop(_PENDING_CHAT_IDS, None)
+    user_ids = session.info.pop(_PENDING_USER_IDS, None)
+    if chat_ids or user_ids:
+        user_profile_cache.invalidate(chat_ids or (), user_ids or ())
+    if user_ids:
+        notification_versions.bump(user_ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back_users(session, previous_transaction):
+    session.info.pop(_PENDING_CHAT_IDS, None)
+    session.info.pop(_PENDING_USER_IDS, None)
@@ -0,0 +1,296 @@
+"""
+Process-wide directory of all users, resolved without a query.
+
+Most utils/db_utils.py functions start by looking up the user by chat_id (a
+String column), and the admin user list loads every User row. UserDirectory
+loads all users once into parallel arrays sorted by chat_id: user id, role /
+payment / reachability bit flags and interned full names and usernames, plus
+an id -> row index. Lookups are a bisect, no Python object per user is kept
+(see scripts/benchmark_user_directory.py for the footprint).
+
+Every USER_DIRECTORY_REFRESH_INTERVAL seconds the users whose updated_at is
+past the watermark are merged in. updated_at is the transaction start time,
+so a transaction committing after a refresh can carry an older timestamp;
+REFRESH_OVERLAP re-reads that window. Users are never deleted, so removals
+are not tracked. A refresh builds a new snapshot in the blocking pool and
+swaps it in: readers on the event loop and in pool threads never see a half
+applied refresh.
+
+Until the first load finishes lookups return None and callers query the
+database instead.
+"""
+import asyncio
+import bisect
+import datetime
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from config import UPDATE_METRICS_INTERVAL, USER_DIRECTORY_REFRESH_INTERVAL
+from database import get_async_batch_db
+from models import User, UserPaymentStatus, UserRole
+from utils.logger import get_logger
+from utils.offload import run_blocking
+
+logger = get_logger(__name__)
+
+ADMIN = 1
+PAID = 2
+REACHABLE = 4
+
+# Changes of transactions that started before the watermark but committed after it
+REFRESH_OVERLAP = datetime.timedelta(minutes=1)
+
+DirectoryUser = namedtuple(
+    "DirectoryUser", "id chat_id full_name username is_admin is_paid is_active"
+)
+
+# Rows sorted by chat_id; id_keys / id_rows map user ids (sorted) to rows
+_Snapshot = namedtuple(
+    "_Snapshot", "chat_ids ids flags full_names usernames id_keys id_rows"
+)
+
+
+def users_changed_since_query(watermark=None):
+    query = select(
+        User.chat_id,
+        User.id,
+        User.role,
+        User.payment_status,
+        User.is_active,
+        User.full_name,
+        User.username,
+        User.updated_at,
+    )
+    if watermark is not None:
+        query = query.where(User.updated_at > watermark - REFRESH_OVERLAP)
+    return query
+
+
+def user_flags(role, payment_status, is_active):
+    return (
+        (ADMIN if role == UserRole.ADMIN else 0)
+        | (PAID if payment_status == UserPaymentStatus.ACTIVE else 0)
+        | (REACHABLE if is_active else 0)
+    )
+
+
+def _intern(name):
+    return sys.intern(name) if name else name
+
+
+def _find(keys, key):
+    position = bisect.bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        return position
+    return None
+
+
+def build_snapshot(rows):
+    """Snapshot of (chat_id, id, flags, full_name, username) rows with int chat ids."""
+    rows = sorted(rows, key=lambda row: row[0])
+    ids = array("q", [row[1] for row in rows])
+    id_rows = array("q", sorted(range(len(ids)), key=ids.__getitem__))
+    return _Snapshot(
+        chat_ids=array("q", [row[0] for row in rows]),
+        ids=ids,
+        flags=array("B", [row[2] for row in rows]),
+        full_names=[_intern(row[3]) for row in rows],
+        usernames=[_intern(row[4]) for row in rows],
+        id_keys=array("q", [ids[row] for row in id_rows]),
+        id_rows=id_rows,
+    )
+
+
+def merge_snapshot(snapshot, rows):
+    """Snapshot with the rows applied, the same one if nothing changed."""
+    changed, added = [], []
+    for row in rows:
+        position = _find(snapshot.chat_ids, row[0])
+        if position is None:
+            added.append(row)
+        elif (
+            snapshot.ids[position],
+            snapshot.flags[position],
+            snapshot.full_names[position],
+            snapshot.usernames[position],
+        ) != row[1:]:
+            changed.append((position, row))
+    if added:
+        # Rows shift, rebuild; new users are rare compared to updates
+        existing = zip(
+            snapshot.chat_ids,
+            snapshot.ids,
+            snapshot.flags,
+            snapshot.full_names,
+            snapshot.usernames,
+        )
+        updated = {row[0]: row for _, row in changed}
+        return build_snapshot(
+            [updated.get(row[0], row) for row in existing] + added
+        )
+    if not changed:
+        return snapshot
+    ids = array("q", snapshot.ids)
+    flags = array("B", snapshot.flags)
+    full_names = list(snapshot.full_names)
+    usernames = list(snapshot.usernames)
+    for position, (_, user_id, user_flags_, full_name, username) in changed:
+        ids[position] = user_id
+        flags[position] = user_flags_
+        full_names[position] = _intern(full_name)
+        usernames[position] = _intern(username)
+    return snapshot._replace(ids=ids, flags=flags, full_names=full_names, usernames=usernames)
+
+
+class UserDirectory:
+    def __init__(self, refresh_interval=USER_DIRECTORY_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._refresh_lock = asyncio.Lock()
+        self.watermark = None
+        self.refreshes = 0
+        self.rows_refreshed = 0
+        # Chat ids that are not Telegram ids, e.g. from test data
+        self._skipped_chat_ids = set()
+        self.last_refresh_ms = 0.0
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def __len__(self):
+        snapshot = self._snapshot
+        return len(snapshot.chat_ids) if snapshot is not None else 0
+
+    @staticmethod
+    def _user(snapshot, row):
+        flags = snapshot.flags[row]
+        return DirectoryUser(
+            id=snapshot.ids[row],
+            # Same type as User.chat_id
+            chat_id=str(snapshot.chat_ids[row]),
+            full_name=snapshot.full_names[row],
+            username=snapshot.usernames[row],
+            is_admin=bool(flags & ADMIN),
+            is_paid=bool(flags & PAID),
+            # Like User.is_active: the chat is reachable
+            is_active=bool(flags & REACHABLE),
+        )
+
+    def _row(self, snapshot, chat_id):
+        try:
+            return _find(snapshot.chat_ids, int(chat_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, chat_id):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        row = self._row(snapshot, chat_id)
+        return self._user(snapshot, row) if row is not None else None
+
+    def user_id(self, chat_id):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        row = self._row(snapshot, chat_id)
+        return snapshot.ids[row] if row is not None else None
+
+    def get_by_ids(self, user_ids):
+        """Users with the given ids; ids not in the directory are left out."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        users = []
+        for user_id in user_ids:
+            position = _find(snapshot.id_keys, user_id)
+            if position is not None:
+                users.append(self._user(snapshot, snapshot.id_rows[position]))
+        return users
+
+    def users(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        return [self._user(snapshot, row) for row in range(len(snapshot.chat_ids))]
+
+    def apply(self, rows):
+        """Merge users_changed_since_query rows; the first call loads the directory."""
+        parsed = []
+        for chat_id, user_id, role, payment_status, is_active, full_name, username, _ in rows:
+            try:
+                chat_id = int(chat_id)
+            except (TypeError, ValueError):
+                self._skipped_chat_ids.add(chat_id)
+                continue
+            parsed.append(
+                (chat_id, user_id, user_flags(role, payment_status, is_active), full_name, username)
+            )
+        snapshot = self._snapshot
+        self._snapshot = (
+            build_snapshot(parsed) if snapshot is None else merge_snapshot(snapshot, parsed)
+        )
+
+    async def refresh(self):
+        """Load every user on the first call, then the users changed since the watermark."""
+        async with self._refresh_lock:
+            started = time.perf_counter()
+            async with get_async_batch_db() as db_session:
+                rows = (await db_session.execute(users_changed_since_query(self.watermark))).all()
+            if rows or self._snapshot is None:
+                # Off the event loop, builds the new snapshot and swaps it in
+                await run_blocking(self.apply, rows)
+                self.watermark = max(
+                    (row.updated_at for row in rows), default=self.watermark
+                )
+            self.refreshes += 1
+            self.rows_refreshed += len(rows)
+            self.last_refresh_ms = (time.perf_counter() - started) * 1000
+            return len(rows)
+
+    def metrics(self):
+        return {
+            "size": len(self),
+            "refreshes": self.refreshes,
+            "rows_refreshed": self.rows_refreshed,
+            "skipped": len(self._skipped_chat_ids),
+            "last_refresh_ms": round(self.last_refresh_ms, 1),
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+
+    def start(self, job_queue):
+        """Load the users now, refresh them every refresh_interval seconds and log metrics."""
+        job_queue.run_once(self._refresh_job, when=0, name="user_directory_load")
+        job_queue.run_repeating(
+            self._refresh_job,
+            interval=self.refresh_interval,
+            first=self.refresh_interval,
+            name="user_directory_refresh",
+        )
+        job_queue.run_repeating(
+            self._log_metrics,
+            interval=UPDATE_METRICS_INTERVAL,
+            first=UPDATE_METRICS_INTERVAL,
+            name="user_directory_metrics",
+        )
+
+    async def _refresh_job(self, context):
+        loaded = self.loaded
+        try:
+            rows = await self.refresh()
+        except Exception as e:
+            logger.error(f"User directory refresh failed: {e}")
+            return
+        if not loaded:
+            logger.info(f"User directory loaded {rows} users in {self.last_refresh_ms:.0f} ms")
+
+    async def _log_metrics(self, context):
+        logger.info(f"User directory: {self.metrics()}")
+
+
+user_directory = UserDirectory()
@@ -0,0 +1,136 @@
+"""
+Webhook mode: an embedded aiohttp server feeding Application.update_queue.
+
+Telegram POSTs every update to WEBHOOK_URL + WEBHOOK_PATH with the secret
+token registered in setWebhook; requests without the matching
+X-Telegram-Bot-Api-Secret-Token header are rejected. GET /health reports
+whether the application is running, how many updates are queued
+or waiting in the update processor, how busy the blocking pool and
+the database pools are and how well the in-memory caches serve lookups.
+"""
+import asyncio
+import json
+import secrets
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+from config import (
+    WEBHOOK_LISTEN,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_URL,
+)
+from utils.db_monitor import database_monitor
+from utils.keyboards import notifications_keyboard_cache
+from utils.menus import menu_router
+from utils.logger import get_logger
+from utils.offload import blocking_pool
+from utils.update_processor import update_processor
+from utils.user_cache import user_profile_cache
+from utils.user_directory import user_directory
+
+logger = get_logger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+HEALTH_PATH = "/health"
+
+
+class WebhookServer:
+    def __init__(self, application, secret_token=WEBHOOK_SECRET_TOKEN, path=WEBHOOK_PATH):
+        self.application = application
+        # Telegram accepts 1-256 characters of A-Z, a-z, 0-9, _ and -
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.path = path
+        self.received = 0
+        self.rejected = 0
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        app.router.add_get(HEALTH_PATH, self._handle_health)
+        return app
+
+    async def _handle_update(self, request):
+        if not secrets.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, ""), self.secret_token
+        ):
+            self.rejected += 1
+            logger.warning(f"Rejected webhook request from {request.remote}: invalid secret token")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except (json.JSONDecodeError, TypeError, ValueError, KeyError) as e:
+            self.rejected += 1
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return web.Response(status=400)
+        if update is None:
+            self.rejected += 1
+            return web.Response(status=400)
+
+        self.received += 1
+        # Answer right away; handlers run on the application's update loop
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def _handle_health(self, request):
+        running = self.application.running
+        return web.json_response(
+            {
+                "status": "ok" if running else "stopped",
+                "running": running,
+                "update_queue": self.application.update_queue.qsize(),
+                "received": self.received,
+                "rejected": self.rejected,
+                "processing": update_processor.metrics(),
+                "blocking_pool": blocking_pool.metrics(),
+                "database": database_monitor.metrics(),
+                "user_cache": user_profile_cache.metrics(),
+                "user_directory": user_directory.metrics(),
+                "notifications_keyboard": notifications_keyboard_cache.metrics(),
+                "menu_routes": menu_router.metrics(),
+            },
+            status=200 if running else 503,
+        )
+
+
+async def run_webhook(application, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT):
+    """Serve updates over the webhook until SIGINT/SIGTERM, then shut down cleanly."""
+    server = WebhookServer(application)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(stop_signal, stop_event.set)
+        except NotImplementedError:
+            # Windows: KeyboardInterrupt still stops asyncio.run
+            pass
+
+    runner = web.AppRunner(server.build_app(), access_log=None)
+    async with application:
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}{server.path}",
+                secret_token=server.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+            logger.info(f"Webhook registered at {WEBHOOK_URL.rstrip('/')}{server.path}")
+        elif not WEBHOOK_SECRET_TOKEN:
+            logger.error("Neither WEBHOOK_URL nor WEBHOOK_SECRET_TOKEN is set, every update will be rejected")
+        else:
+            logger.warning("WEBHOOK_URL is not set, expecting updates from an already configured webhook")
+        await application.start()
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        logger.info(f"Listening for webhook updates on {listen}:{port}{server.path}")
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("Stopping webhook server")
+            await runner.cleanup()
+            await application.stop()